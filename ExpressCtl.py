@@ -0,0 +1,84 @@
+""" Control the sync service of the running ExpressScan
+
+    python ExpressCtl.py submit E: --subjects 1,2,11 --mode 1
+    python ExpressCtl.py status
+    python ExpressCtl.py watch <run>
+    python ExpressCtl.py cancel <run> | --drive E:
+"""
+import sys
+import json
+import time
+import argparse
+import ipc
+
+
+def printJson(value):
+    print(json.dumps(value, ensure_ascii=False))
+
+
+def watch(client, runId, interval=0.5):
+    since = 0
+    while True:
+        answer = client.events(runId, since)
+        since = answer['next']
+        for event in answer['events']:
+            if event['type'] != 'output':
+                printJson(event)
+        if answer['run']['state'] != 'running':
+            printJson(answer['run'])
+            return 0 if answer['run']['state'] == 'done' and not answer['run']['failed'] else 1
+        time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('ping')
+    status = commands.add_parser('status')
+    status.add_argument('run', nargs='?')
+    submit = commands.add_parser('submit')
+    submit.add_argument('drive')
+    submit.add_argument('--subjects', default='1,2,3,4,5,6,7,8,9,10,11', help='comma separated numbers 1 - 11')
+    submit.add_argument('--mode', type=int, default=1, choices=[1, 2, 3, 4])
+    submit.add_argument('--delete', action='store_true', help='delete the old copy first')
+    submit.add_argument('--option', default='', help='fcp.exe options, e.g. /from_date=-7D')
+    submit.add_argument('--wait', action='store_true', help='follow the run until it finished')
+    follow = commands.add_parser('watch')
+    follow.add_argument('run')
+    cancel = commands.add_parser('cancel')
+    cancel.add_argument('run', nargs='?')
+    cancel.add_argument('--drive')
+    args = parser.parse_args(argv)
+
+    client = ipc.connect()
+    if client is None:
+        print('ExpressScan is not running', file=sys.stderr)
+        return 2
+    try:
+        if args.command == 'ping':
+            printJson(client.request('ping'))
+        elif args.command == 'status':
+            for run in client.status(args.run):
+                printJson(run)
+        elif args.command == 'submit':
+            drive = args.drive.rstrip('\\/')
+            run = client.submit({'drive': drive if drive.endswith(':') else drive + ':',
+                                 'subjects': [int(subject) for subject in args.subjects.split(',') if subject],
+                                 'mode': args.mode, 'isDelete': args.delete, 'commandOption': args.option})
+            printJson(run)
+            if args.wait:
+                return watch(client, run['id'])
+        elif args.command == 'watch':
+            return watch(client, args.run)
+        elif args.command == 'cancel':
+            printJson(client.cancel(args.run, args.drive))
+    except ipc.IpcError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
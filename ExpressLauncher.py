@@ -5,6 +5,7 @@ import darkdetect
 import subprocess
 import ExpressRes
 from config import cfg
+from heartbeat import readStatus, requestStop
 from typing import Union, Iterable
 from pygetwindow import getWindowsWithTitle as GetWindow
 from PySide6.QtCore import Qt, QPoint, Signal, QEvent, Property, QPropertyAnimation, QTimer, QRectF
@@ -1071,6 +1072,9 @@ class Window(MicaWindow):
         self.upperLayout.addWidget(self.openHelpBtn)
         self.statusBtn.clicked.connect(self.onStatusBtn)
         self.updateStatus()
+        self.statusTimer = QTimer(self)
+        self.statusTimer.timeout.connect(self.updateStatus)
+        self.statusTimer.start(2000)
 
         items = ["D:", "E:", "F:", "G:", "H:", "I:", "J:"]
         self.comboBox = EditableComboBox(self)
@@ -1109,29 +1113,41 @@ class Window(MicaWindow):
         self.mainLayout.addLayout(self.bottomLayout)
 
     def getStatus(self):
-        try:
-            window = GetWindow("ExpressSacn")[0]
-            if window:
-                return True
-            else:
-                return False
-        except:
-            return False
+        return readStatus()
 
     def updateStatus(self):
-        if self.getStatus():
+        status = self.getStatus()
+        if status['running']:
+            # the scanner publishes its running syncs with the heartbeat, the service is not asked
+            runs = '、'.join(f"{run['drive']} {run['progress']}%" for run in status.get('runs') or [])
             self.statusBtn.setText("U盘扫描已开启")
             self.statusBtn.setIcon(FIF.ACCEPT)
+            self.statusBtn.setToolTip(
+                f"已运行 {int(status['uptime'] // 60)} 分钟\n"
+                f"扫描耗时 {status.get('latencyMs', 0):.1f} ms\n"
+                f"已连接 {'、'.join(status.get('drives') or []) or '无'}\n"
+                f"正在同步 {runs or '无'}")
         else:
             self.statusBtn.setText("U盘扫描未开启")
             self.statusBtn.setIcon(FIF.CLOSE)
+            self.statusBtn.setToolTip("")
 
     def onStatusBtn(self):
         menu = RoundMenu(parent=self)
         switchBtn = SwitchButton(self)
+        switchBtn.setChecked(self.getStatus()['running'])
+        switchBtn.checkedChanged.connect(self.onSwitch)
         menu.addWidget(switchBtn, selectable=False)
         menu.exec(QPoint(self.x() + 33, self.y() + 80))
 
+    def onSwitch(self, isChecked: bool):
+        if isChecked:
+            subprocess.Popen("ExpressScan.exe", shell=True)
+        else:
+            requestStop()
+        # the scanner needs a cycle to start beating or to see the stop file
+        QTimer.singleShot(int(cfg.ScanCycle.value * 100) + 1500, self.updateStatus)
+
     def onChooseBtn(self):
         folder = QFileDialog.getExistingDirectory(self, self.tr("选择驱动器"), "./")
         if not folder:
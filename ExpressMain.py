@@ -1,15 +1,22 @@
-import os
 import sys
-import subprocess
+import asyncio
+import tracing
+import profiling
 import darkdetect
 import ExpressRes
+import ipc
 from config import cfg
+from jobs import SyncRequest, deleteJobs, syncJobs, plannedWork
+from driveprofile import Eta
+from throttle import lowerPriority
+from orchestrator import Orchestrator, Progress
+from report import RunReport
 from ctypes import CDLL, c_int
 from winotify import Notification, audio
 from win32api import GetVolumeInformation
 from PySide6.QtGui import QIcon, QColor
-from PySide6.QtCore import Qt, QThread, Signal, QEvent
-from PySide6.QtWidgets import QApplication, QHBoxLayout, QVBoxLayout, QLabel, QWidget, QGridLayout, QFrame, QPushButton
+from PySide6.QtCore import Qt, QThread, Signal, QEvent, QTimer
+from PySide6.QtWidgets import QApplication, QHBoxLayout, QVBoxLayout, QLabel, QWidget, QGridLayout, QFrame
 from qfluentwidgets import setTheme, Theme, BodyLabel, isDarkTheme, PushButton, SubtitleLabel, ProgressBar, \
     InfoBar, InfoBarIcon, InfoBarPosition, IndeterminateProgressBar, setThemeColor, PrimaryPushButton, TextWrap
 from qframelesswindow.titlebar import MinimizeButton, CloseButton, MaximizeButton
@@ -325,100 +332,100 @@ class Dialog(FramelessDialog, Ui_MessageBox):
         self.windowTitleLabel.setVisible(isVisible)
 
 
-class DeleteThread(QThread):
-    deleteFinished = Signal(bool)
+class OrchestratorThread(QThread):
+    """ Runs the asyncio orchestrator in its own loop and forwards its events as Qt signals """
+    event = Signal(dict)
+    valueChange = Signal(int)
+    jobsFinished = Signal(bool)
 
-    def __init__(self, parent=None):
+    def __init__(self, jobs, parent=None):
         super().__init__(parent=parent)
+        self.jobs = jobs
+        self.progress_value = int(0)
+        self.loop = None
+        self.cancelled = False
+        self.orchestrator = Orchestrator(self.onEvent)
+        self.progress = Progress(len(jobs))
 
     def run(self):
-        args = "fcp.exe /cmd=delete " + f"/bufsize={buf} /log=FALSE " + f'/force_start={concurrentProcess} "{destFolder}"'
-        subprocess.call(args, shell=True)
-        self.deleteFinished.emit(True)
-        return
+        if self.cancelled:
+            return
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.orchestrator.run(self.jobs))
+        finally:
+            self.loop.close()
+
+    def cancel(self):
+        """ Stop only this drive's jobs, other drives syncing on the same PC keep running """
+        self.cancelled = True
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.orchestrator.cancel)
+
+    def onEvent(self, event):
+        self.event.emit(event)
+        if self.cancelled:
+            return
+        if self.progress.update(event):
+            self.progress_value = self.progress.value
+            self.valueChange.emit(self.progress_value)
+        if event['type'] == 'finished':
+            self.jobsFinished.emit(not event['failed'])
 
 
-class SyncThread(QThread):
+class AttachThread(QThread):
+    """ Follows a run of the scanner's sync service with the signals of OrchestratorThread """
+    event = Signal(dict)
     valueChange = Signal(int)
+    jobsFinished = Signal(bool)
 
-    def __init__(self, parent=None):
+    def __init__(self, runId, parent=None):
         super().__init__(parent=parent)
-        self.is_paused = bool(0)
+        self.runId = runId
         self.progress_value = int(0)
-    #     self.initDeltaSize = self.getDeltaSize()
-    #
-    #     self.updateProgressTimer = QTimer()
-    #     self.updateProgressTimer.start(3100)
-    #     self.updateProgressTimer.timeout.connect(self.updateProgress)
-    #
-    # def getDeltaSize(self):
-    #     destSize = 0
-    #     sourceSize = 0
-    #     try:
-    #         for root, dirs, files in os.walk(destFolder):
-    #             destSize += sum([os.path.getsize(os.path.join(root, name)) for name in files])
-    #     except:
-    #         pass
-    #     try:
-    #         for root, dirs, files in os.walk(sourceFolder):
-    #             sourceSize += sum([os.path.getsize(os.path.join(root, name)) for name in files])
-    #     except:
-    #         pass
-    #     return abs(destSize - sourceSize)
-    #
-    # def runFunction(self, f, max_wait, default_value):
-    #     try:
-    #         return func_timeout.func_timeout(max_wait, self.getDeltaSize)
-    #     except func_timeout.FunctionTimedOut:
-    #         pass
-    #     return default_value
-    #
-    # def updateProgress(self):
-    #     tempDeltaSize = self.runFunction(self.getDeltaSize, 3, -1)
-    #     if tempDeltaSize/1024/1024 <= 100:
-    #        self.valueChange.emit(-2)
-    #     elif tempDeltaSize == -1:
-    #         return
-    #     else:
-    #         self.progress_value = int(abs(self.initDeltaSize - tempDeltaSize) * 100 / self.initDeltaSize)
-    #         if self.progress_value != 0:
-    #             self.valueChange.emit(self.progress_value)
+        self.client = None
 
     def run(self):
-        while True:
-            if taskList:
-                if taskList[0] == 1:
-                    currentFolder = cfg.yuwenFolder.value
-                elif taskList[0] == 2:
-                    currentFolder = cfg.shuxueFolder.value
-                elif taskList[0] == 3:
-                    currentFolder = cfg.yingyuFolder.value
-                elif taskList[0] == 4:
-                    currentFolder = cfg.wuliFolder.value
-                elif taskList[0] == 5:
-                    currentFolder = cfg.huaxueFolder.value
-                elif taskList[0] == 6:
-                    currentFolder = cfg.shengwuFolder.value
-                elif taskList[0] == 7:
-                    currentFolder = cfg.zhengzhiFolder.value
-                elif taskList[0] == 8:
-                    currentFolder = cfg.lishiFolder.value
-                elif taskList[0] == 9:
-                    currentFolder = cfg.diliFolder.value
-                elif taskList[0] == 10:
-                    currentFolder = cfg.jishuFolder.value
-                elif taskList[0] == 11:
-                    currentFolder = cfg.ziliaoFolder.value
-
-                taskList.pop(0)
-                args = "fcp.exe /cmd=sync " + f"/bufsize={buf} /log=FALSE " + f'/force_start={concurrentProcess} {commandOption} "' + currentFolder + f'" /to="{destFolder}"'
-                subprocess.call(args, shell=True)
-                self.progress_value = int((taskNum - len(taskList)) / taskNum * 100)
-                self.valueChange.emit(self.progress_value)
-            else:
-                self.progress_value = -1
-                self.valueChange.emit(self.progress_value)
-                return
+        self.client = ipc.connect()
+        if self.client is None:
+            self.finish(False)
+            return
+        since = 0
+        progress = None
+        try:
+            while True:
+                answer = self.client.events(self.runId, since)
+                since = answer['next']
+                progress = progress or Progress(answer['run']['jobs'])
+                for event in answer['events']:
+                    self.event.emit(event)
+                    if progress.update(event) and progress.value != -1:
+                        self.progress_value = progress.value
+                        self.valueChange.emit(self.progress_value)
+                if answer['run']['state'] != 'running':
+                    self.finish(answer['run']['state'] == 'done' and not answer['run']['failed'])
+                    return
+                self.msleep(200)
+        except (OSError, ipc.IpcError):
+            self.finish(False)
+        finally:
+            self.client.close()
+
+    def finish(self, ok):
+        self.progress_value = -1
+        self.valueChange.emit(self.progress_value)
+        self.jobsFinished.emit(ok)
+
+    def cancel(self):
+        client = ipc.connect()
+        if client is None:
+            return
+        try:
+            client.cancel(self.runId)
+        except (OSError, ipc.IpcError):
+            pass
+        finally:
+            client.close()
 
 
 class MainWindow(MicaWindow):
@@ -482,11 +489,34 @@ class MainWindow(MicaWindow):
         self.mainLayout.addLayout(self.topLayout)
         self.mainLayout.addLayout(self.bottomLayout)
 
-        self.deleteThread = DeleteThread()
-        self.syncThread = SyncThread()
+        if attachRun:
+            # the service runs the delete too and writes the report
+            self.deleteThread = None
+            self.syncThread = AttachThread(attachRun)
+            self.report = None
+        else:
+            self.deleteThread = OrchestratorThread(deleteJobs(request))
+            self.syncThread = OrchestratorThread(syncJobs(request))
+            self.report = RunReport(drive, request.serial, request.fileSystem, mode, request.copyEngine)
+            self.deleteThread.event.connect(self.report.onEvent)
+            self.syncThread.event.connect(self.report.onEvent)
+            self.deleteThread.event.connect(tracing.tracer.onEvent)
+        self.syncThread.event.connect(tracing.tracer.onEvent)
+        # predicted from the drive's profile until the jobs report how fast they really are
+        self.eta = Eta(request.profile, plannedWork(request))
+        if self.deleteThread is not None:
+            self.deleteThread.event.connect(self.onJobEvent)
+        self.syncThread.event.connect(self.onJobEvent)
+        self.etaTimer = QTimer(self)
+        self.etaTimer.timeout.connect(self.showEta)
+        self.etaTimer.start(1000)
+        self.showEta()
         self.syncThreadRunning = False
         self.deleteThreadRunning = False
-        if isDelete:
+        self.cancelled = False
+        self.failed = False
+        self.stopping = []
+        if isDelete and self.deleteThread is not None:
             self.statusLabel.setText("正在删除原有文件")
             self.setupDeleteThread()
             self.startDeleteThread()
@@ -496,7 +526,7 @@ class MainWindow(MicaWindow):
             self.startSyncThread()
 
     def setupDeleteThread(self):
-        self.deleteThread.deleteFinished.connect(self.deleteThreadFinished)
+        self.deleteThread.jobsFinished.connect(self.deleteThreadFinished)
         self.deleteThreadRunning = True
 
     def startDeleteThread(self):
@@ -506,15 +536,25 @@ class MainWindow(MicaWindow):
             self.setupDeleteThread()
             self.deleteThread.start()
 
-    def deleteThreadFinished(self):
+    def deleteThreadFinished(self, ok):
+        if self.cancelled:
+            return
         self.deleteThread.quit()
         self.deleteThreadRunning = False
+        if not ok:
+            # syncing into a half deleted folder would mix old and new files
+            if self.report is not None:
+                self.report.write()
+            tracing.tracer.export()
+            self.showFailure('删除原有文件失败')
+            return
         self.setupSyncThread()
         self.startSyncThread()
         self.statusLabel.setText("准备中")
 
     def setupSyncThread(self):
         self.syncThread.valueChange.connect(self.setSyncValue)
+        self.syncThread.jobsFinished.connect(self.syncThreadFinished)
         self.syncThreadRunning = True
 
     def startSyncThread(self):
@@ -524,16 +564,45 @@ class MainWindow(MicaWindow):
             self.setupSyncThread()
             self.syncThread.start()
 
+    def syncThreadFinished(self, ok):
+        if self.cancelled:
+            return
+        self.syncThread.quit()
+        self.syncThreadRunning = False
+        if self.report is not None:
+            self.report.write()
+        tracing.tracer.export()
+        if not ok:
+            self.showFailure('同步失败')
+            return
+        self.taskbarProgress.set_mode(0)
+        if cfg.Notify.value:
+            toast = Notification(app_id="Express", title="同步完成", msg=self.GetDriveName() + ' (' + drive + ')', duration="short")
+            toast.set_audio(audio.Default, loop=False)
+            toast.show()
+        sys.exit()
+
+    def showFailure(self, title):
+        """ Keep the window open with the error instead of leaving as if the sync had succeeded """
+        self.failed = True
+        self.statusLabel.setText(title)
+        self.progressBar.error()
+        self.inProgressBar.error()
+        self.taskbarProgress.set_mode(4)
+        self.cancelBtn.setText('关闭')
+        InfoBar.error(title=title, content='部分文件未能完成，详见同步记录', orient=Qt.Horizontal, isClosable=True,
+                      position=InfoBarPosition.BOTTOM, duration=-1, parent=self)
+        if cfg.Notify.value:
+            toast = Notification(app_id="Express", title=title, msg=self.GetDriveName() + ' (' + drive + ')', duration="short")
+            toast.set_audio(audio.Default, loop=False)
+            toast.show()
+
     def setSyncValue(self):
+        if self.cancelled:
+            return
         if self.syncThread.progress_value == -1:
-            self.syncThread.quit()
-            self.syncThreadRunning = False
-            self.taskbarProgress.set_mode(0)
-            if cfg.Notify.value:
-                toast = Notification(app_id="Express", title="同步完成", msg=self.GetDriveName() + ' (' + drive + ')', duration="short")
-                toast.set_audio(audio.Default, loop=False)
-                toast.show()
-            sys.exit()
+            # the end is handled by syncThreadFinished, which knows whether the jobs succeeded
+            return
         # elif self.syncThread.progress_value == -2:
         #     self.statusLabel.setText("即将完成")
         #     self.bottomLayout.removeWidget(self.progressBar)
@@ -561,16 +630,54 @@ class MainWindow(MicaWindow):
             self.bottomLayout.addWidget(self.spaceLabel)
             self.bottomLayout.addWidget(self.progressLabel)
 
+    def onJobEvent(self, event):
+        self.eta.update(event)
+
+    def showEta(self):
+        if not self.eta.known:
+            return
+        seconds = self.eta.remaining()
+        if seconds < 1:
+            text = "即将完成"
+        elif seconds < 60:
+            text = "剩余不到 1 分钟"
+        elif seconds < 3600:
+            text = f"剩余约 {round(seconds / 60)} 分钟"
+        else:
+            text = f"剩余约 {int(seconds // 3600)} 小时 {round(seconds % 3600 / 60)} 分钟"
+        self.detailLabel.setText(self.displayText + ' · ' + text)
+
     def stopThread(self):
+        if self.cancelled:
+            return
+        # completion signals still queued must not start the sync or report success
+        self.cancelled = True
         self.progressBar.pause()
         self.inProgressBar.pause()
         self.taskbarProgress.set_mode(4)
-
-        self.deleteThread.quit()
+        self.statusLabel.setText("正在取消")
+
+        # the GUI keeps running while the jobs wind down, the last thread to end finishes the shutdown
+        self.stopping = [thread for thread in (self.deleteThread, self.syncThread)
+                         if thread is not None and thread.isRunning()]
+        for thread in self.stopping:
+            thread.finished.connect(self.threadStopped)
+            thread.cancel()
+        self.threadStopped()
+
+    def threadStopped(self):
+        if any(thread.isRunning() for thread in self.stopping):
+            return
+        if self.report is not None:
+            jobs = self.syncThread.jobs + (self.deleteThread.jobs if self.deleteThread is not None else [])
+            # jobs that finished before the cancel reached them make a complete run
+            self.report.write('done' if all(job.state in ('ok', 'failed') for job in jobs) else 'cancelled')
+        tracing.tracer.export()
+        if self.deleteThread is not None:
+            self.deleteThread.quit()
         self.deleteThreadRunning = False
         self.syncThread.quit()
         self.syncThreadRunning = False
-        subprocess.call(["taskkill", "-f", "-im", "fcp.exe"], shell=True)
         sys.exit()
 
     def GetDriveName(self):
@@ -583,6 +690,8 @@ class MainWindow(MicaWindow):
             sys.exit()
 
     def onCancelBtn(self):
+        if self.failed:
+            sys.exit()
         yesBtn = PushButton('确定')
         yesBtn.clicked.connect(self.stopThread)
         w = InfoBar(icon=InfoBarIcon.WARNING, title='取消同步？', content='', orient=Qt.Horizontal, isClosable=True,
@@ -593,6 +702,8 @@ class MainWindow(MicaWindow):
     def onShowDetailBtn(self):
         title = 'Express 选项'
         content = f"目标驱动器: {drive}\\\n模式: {self.displayText}\n学科: {self.subject}\n命令行选项: {commandOption}\n缓冲区大小: {buf} MB\n并行进程数: {concurrentProcess}"
+        if request.tuned:
+            content += f"\n复制引擎: {request.copyEngine}\n(按U盘性能自动调整)"
         w = Dialog(title, content, self)
         w.setTitleBarVisible(False)
         w.setContentCopyable(True)
@@ -604,6 +715,9 @@ if __name__ == '__main__':
     QApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
     if darkdetect.isDark():
         setTheme(Theme.DARK)
+    tracing.init(sys.argv, 'ExpressMain')
+    profiling.start('ExpressMain')
+    tracing.instant('import done')
     app = QApplication(sys.argv)
 
     """
@@ -613,22 +727,27 @@ if __name__ == '__main__':
     13          mode{1:"sync(default)", 2:"sync(low)", 3:"copy(lately)", 4:"copy(from_date)"}
     14          isDelete
     15          commandOption
+    --session=  trace session, optional and removed by tracing.init
+    --attach=   run of the scanner's sync service to follow instead of syncing here
     """
 
-    drive = sys.argv[1]
-    taskList = []
-    for i in range(2, 13):
-        if sys.argv[i] == '1':
-            taskList.append(i - 1)
+    attachRun = ipc.attachArg(sys.argv)
+    request = SyncRequest(**ipc.argvToRequest(sys.argv), cfg=cfg)
+    drive = request.drive
+    taskList = request.subjects
     taskNum = len(taskList)
-    buf = str(cfg.BufSize.value)[9:]
-    concurrentProcess = cfg.ConcurrentProcess.value
-    sourceFolder = os.path.normpath(cfg.sourceFolder.value)
-    destFolder = drive + '\\' + os.path.basename(sourceFolder) + '\\'
-    mode = int(sys.argv[13])
-    isDelete = False if sys.argv[14] == 'False' else True
-    commandOption = sys.argv[15]
+    buf = request.buf
+    concurrentProcess = request.concurrentProcess
+    sourceFolder = request.sourceFolder
+    destFolder = request.destFolder
+    mode = request.mode
+    isDelete = request.isDelete
+    commandOption = request.commandOption
+    if mode == 2 and not attachRun:
+        # fcp.exe and the engine threads inherit the background priority
+        lowerPriority()
 
     w = MainWindow()
     w.show()
+    tracing.instant('window shown')
     app.exec()
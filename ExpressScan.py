@@ -1,10 +1,21 @@
 import os
-import msvcrt
-import psutil
 import time
 import sys
 import subprocess
-from config import cfg
+import profiling
+from metrics import ScanMetrics, export
+from report import REPORT_PATH
+from logstore import LogStore, LogMaintainer
+from heartbeat import Heartbeat
+from service import SyncService
+from ipc import IpcServer
+from tracing import tracer, newSession, sessionArgs
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
 
 local_device = []
 local_letter = []
@@ -14,6 +25,16 @@ mobile_letter = []
 mobile_number = 0
 
 
+def diskPartitions():
+    # psutil and the Qt config are left to the scanner process, the simulator runs scan() without them
+    import psutil
+    return psutil.disk_partitions()
+
+
+# replaced by benchmark/simulator.py to scan virtual volumes
+partitionSource = diskPartitions
+
+
 class Mutex:
     def __init__(self):
         self.lockfile = None
@@ -21,13 +42,19 @@ class Mutex:
     def __enter__(self):
         self.lockfile = open('ExpressScan.lockfile', 'w')
         try:
-            msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_NBLCK, 1)
+            if msvcrt is not None:
+                msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
         except IOError:
             sys.exit()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.lockfile:
-            msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_UNLCK, 1)
+            if msvcrt is not None:
+                msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_UN)
             self.lockfile.close()
             os.remove('ExpressScan.lockfile')
 
@@ -38,7 +65,7 @@ def update():
     tmp_mobile_device, tmp_mobile_letter = [], []
     tmp_local_number, tmp_mobile_number = 0, 0
     try:
-        part = psutil.disk_partitions()
+        part = partitionSource()
     except:
         sys.exit()
     else:
@@ -59,23 +86,65 @@ def update():
     return len(part)
 
 
+def launchService(letter):
+    from config import cfg
+    if cfg.Trace.value:
+        # every inserted drive is its own trace session
+        tracer.start(newSession(), processStart=False)
+        tracer.instant('drive detected', drive=letter, cycle=cfg.ScanCycle.value / 10)
+    args = ["ExpressUsbService.exe", letter] + sessionArgs()
+    subprocess.Popen(args, shell=True)
+
+
+def scan(cycle, onInsert=launchService, stop=None, metrics=None, heartbeat=None):
+    """ Poll the partitions every `cycle` seconds and call `onInsert` with the letter of a new drive """
+    now_number = 0
+    before_number = update()
+    before_letter = local_letter + mobile_letter
+    while stop is None or not stop.is_set():
+        start = time.perf_counter()
+        now_number = update()
+        latency = time.perf_counter() - start
+        if metrics is not None:
+            metrics.onScan(latency)
+        if heartbeat is not None:
+            heartbeat.beat(latency, mobile_letter)
+            if heartbeat.stopRequested():
+                break
+        if (now_number > before_number and len(set(local_letter + mobile_letter).difference(set(before_letter))) == 1):
+
+            letter = ''.join(set(local_letter + mobile_letter).difference(set(before_letter)))
+            if metrics is not None:
+                metrics.onDetect(letter)
+            onInsert(letter)
+
+            before_number = now_number
+            before_letter = local_letter + mobile_letter
+        elif (now_number < before_number):
+            before_number = now_number
+            before_letter = local_letter + mobile_letter
+        if stop is None:
+            time.sleep(cycle)
+        else:
+            stop.wait(cycle)
+
+
 if __name__ == "__main__":
+    from config import cfg
+    profiling.start('ExpressScan')
     with Mutex():
-        cycle = cfg.ScanCycle.value / 10
-        now_number = 0
-        before_number = update()
-        before_letter = local_letter + mobile_letter
-        while True:
-            now_number = update()
-            if (now_number > before_number and len(set(local_letter + mobile_letter).difference(set(before_letter))) == 1):
-
-                args = ["ExpressUsbService.exe", ''.join(set(local_letter + mobile_letter).difference(set(before_letter)))]
-                subprocess.Popen(args, shell=True)
-
-                before_number = now_number
-                before_device = local_device + mobile_letter
-                before_letter = local_letter + mobile_letter
-            elif (now_number < before_number):
-                before_number = now_number
-                before_letter = local_letter + mobile_letter
-            time.sleep(cycle)
+        metrics = ScanMetrics()
+        export(metrics, cfg.Metrics.value, cfg.MetricsPort.value)
+        service = SyncService().start()
+        server = IpcServer(service.onRequest).start()
+        heartbeat = Heartbeat(cfg.ScanCycle.value / 10, info={'ipcPort': server.port, 'ipcToken': server.token},
+                              runs=service.activeRuns)
+        maintainer = LogMaintainer(LogStore(REPORT_PATH))
+        maintainer.start()
+        try:
+            scan(cfg.ScanCycle.value / 10, metrics=metrics, heartbeat=heartbeat)
+        finally:
+            maintainer.stop()
+            heartbeat.close()
+            server.stop()
+            service.stop()
@@ -7,6 +7,10 @@ from typing import Union
 from webbrowser import open as webopen
 from pygetwindow import getWindowsWithTitle as GetWindow
 from config import cfg, BufSize, VERSION, YEAR
+from report import readRuns, runCount, summarize
+from usage import cachedSize, reconcile, formatSize
+from analyzer import Analyzer, loadSummary
+from driveprofile import DriveProfiles, volumeInformation, removableDrives, recommend
 from PySide6.QtCore import Qt, Signal, QTimer, QThread, QRectF, QEasingCurve
 from PySide6.QtGui import QColor, QIcon, QPainter, QTextCursor, QAction, QPainterPath
 from PySide6.QtWidgets import QFrame, QApplication, QWidget, QHBoxLayout, QFileDialog, QLabel, QVBoxLayout, \
@@ -576,8 +580,7 @@ class SpinBoxSettingCard(SettingCard):
         self.spinBox = SpinBox(self)
         self.spinBox.setFixedWidth(130)
         self.spinBox.setAccelerated(True)
-        self.spinBox.setMaximum(5)
-        self.spinBox.setMinimum(1)
+        self.spinBox.setRange(*configItem.validator.range)
         self.spinBox.setValue(configItem.value)
 
         self.hBoxLayout.addStretch(1)
@@ -758,13 +761,19 @@ class CustomFolderListSettingCard(ExpandSettingCard):
         """
         super().__init__(FIF.FOLDER_ADD, title, content, parent)
         self._dialogDirectory = directory
-        self.__initWidget()
-
-    def __initWidget(self):
+        self.itemsCreated = False
         self.viewLayout.setSpacing(0)
         self.viewLayout.setAlignment(Qt.AlignTop)
         self.viewLayout.setContentsMargins(0, 0, 0, 0)
 
+    def setExpand(self, isExpand: bool):
+        # the 11 folder items are only needed once the card is opened
+        if isExpand and not self.itemsCreated:
+            self.__initItems()
+        super().setExpand(isExpand)
+
+    def __initItems(self):
+        self.itemsCreated = True
         self.yuwenItem = FolderItem("语文: " + cfg.yuwenFolder.value, self.view)
         self.shuxueItem = FolderItem("数学: " + cfg.shuxueFolder.value, self.view)
         self.yingyuItem = FolderItem("英语: " + cfg.yingyuFolder.value, self.view)
@@ -842,6 +851,8 @@ class CustomFolderListSettingCard(ExpandSettingCard):
             self.ziliaoItem.setFolder("资料: " + cfg.zilaioFolder.value)
 
     def updateContent(self):
+        if not self.itemsCreated:
+            return
         self.yuwenItem.setFolder("语文: " + cfg.yuwenFolder.value)
         self.shuxueItem.setFolder("数学: " + cfg.shuxueFolder.value)
         self.yingyuItem.setFolder("英语: " + cfg.yingyuFolder.value)
@@ -855,6 +866,302 @@ class CustomFolderListSettingCard(ExpandSettingCard):
         self.ziliaoItem.setFolder("资料: " + cfg.ziliaoFolder.value)
 
 
+class PackedSubjectItem(QWidget):
+    def __init__(self, name: str, parent=None):
+        super().__init__(parent=parent)
+        self.hBoxLayout = QHBoxLayout(self)
+        self.nameLabel = QLabel(name, self)
+        self.switchButton = SwitchButton('关', self, IndicatorPosition.RIGHT)
+
+        self.setFixedHeight(53)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+        self.hBoxLayout.setContentsMargins(48, 0, 60, 0)
+        self.hBoxLayout.addWidget(self.nameLabel, 0, Qt.AlignLeft)
+        self.hBoxLayout.addSpacing(16)
+        self.hBoxLayout.addStretch(1)
+        self.hBoxLayout.addWidget(self.switchButton, 0, Qt.AlignRight)
+        self.hBoxLayout.setAlignment(Qt.AlignVCenter)
+
+    def setChecked(self, isChecked: bool):
+        self.switchButton.setChecked(isChecked)
+        self.switchButton.setText('开' if isChecked else '关')
+
+
+class PackedSubjectsCard(ExpandSettingCard):
+    """ Subjects stored on the drive as one zip container instead of many small files """
+    names = ['语文', '数学', '英语', '物理', '化学', '生物', '政治', '历史', '地理', '技术', '资料']
+
+    def __init__(self, title: str, content: str = None, parent=None):
+        """
+        Parameters
+        ----------
+        title: str
+            the title of card
+
+        content: str
+            the content of card
+
+        parent: QWidget
+            parent widget
+        """
+        super().__init__(FIF.ZIP_FOLDER, title, content, parent)
+        self.items = {}
+        self.viewLayout.setSpacing(0)
+        self.viewLayout.setAlignment(Qt.AlignTop)
+        self.viewLayout.setContentsMargins(0, 0, 0, 0)
+
+    def setExpand(self, isExpand: bool):
+        if isExpand and not self.items:
+            self.__initItems()
+        super().setExpand(isExpand)
+
+    def __initItems(self):
+        packed = cfg.PackedSubjects.value
+        for subject, name in enumerate(self.names, 1):
+            item = PackedSubjectItem(name, self.view)
+            item.setChecked(subject in packed)
+            item.switchButton.checkedChanged.connect(lambda isChecked, subject=subject: self.onChecked(subject, isChecked))
+            self.items[subject] = item
+            self.viewLayout.addWidget(item)
+        self._adjustViewSize()
+
+    def onChecked(self, subject: int, isChecked: bool):
+        self.items[subject].setChecked(isChecked)
+        packed = set(cfg.PackedSubjects.value)
+        if isChecked:
+            packed.add(subject)
+        else:
+            packed.discard(subject)
+        cfg.set(cfg.PackedSubjects, sorted(packed))
+
+    def setValue(self, subjects: list):
+        cfg.set(cfg.PackedSubjects, subjects)
+        for subject, item in self.items.items():
+            item.setChecked(subject in subjects)
+
+
+class AnalyzeThread(QThread):
+    folderReady = Signal(str, dict)
+
+    def __init__(self, folders: dict, parent=None):
+        super(AnalyzeThread, self).__init__(parent)
+        self.analyzer = Analyzer(smallFileSize=cfg.SmallFileSize.value * 1024)
+        self.folders = folders
+
+    def run(self):
+        self.analyzer.analyze(self.folders, self.folderReady.emit)
+
+
+class SubjectStatsItem(QWidget):
+    def __init__(self, name: str, parent=None):
+        super().__init__(parent=parent)
+        self.hBoxLayout = QHBoxLayout(self)
+        self.nameLabel = QLabel(name, self)
+        self.statsLabel = QLabel('正在分析…', self)
+
+        self.setFixedHeight(53)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+        self.hBoxLayout.setContentsMargins(48, 0, 60, 0)
+        self.hBoxLayout.addWidget(self.nameLabel, 0, Qt.AlignLeft)
+        self.hBoxLayout.addSpacing(16)
+        self.hBoxLayout.addStretch(1)
+        self.hBoxLayout.addWidget(self.statsLabel, 0, Qt.AlignRight)
+        self.hBoxLayout.setAlignment(Qt.AlignVCenter)
+
+    def setStats(self, stats: dict):
+        if not stats.get('exists', True):
+            self.statsLabel.setText('文件夹不存在')
+            self.setToolTip('')
+            return
+        self.statsLabel.setText(f'{stats["files"]} 个文件  {formatSize(stats["bytes"])}  '
+                                f'小文件 {round(stats["smallRatio"] * 100)}%')
+        self.setToolTip('\n'.join(['最大的文件'] + [f'{formatSize(size)}  {rel}' for rel, size in stats['largest']]))
+
+
+class SubjectStatsCard(ExpandSettingCard):
+    """ File count, size and small-file share of every subject folder, analyzed when the card is opened """
+
+    def __init__(self, title: str, content: str = None, parent=None):
+        """
+        Parameters
+        ----------
+        title: str
+            the title of card
+
+        content: str
+            the content of card
+
+        parent: QWidget
+            parent widget
+        """
+        super().__init__(FIF.PIE_SINGLE, title, content, parent)
+        self.items = {}
+        self.analyzeThread = None
+        self.viewLayout.setSpacing(0)
+        self.viewLayout.setAlignment(Qt.AlignTop)
+        self.viewLayout.setContentsMargins(0, 0, 0, 0)
+
+    def folders(self):
+        return {'语文': cfg.yuwenFolder.value, '数学': cfg.shuxueFolder.value, '英语': cfg.yingyuFolder.value,
+                '物理': cfg.wuliFolder.value, '化学': cfg.huaxueFolder.value, '生物': cfg.shengwuFolder.value,
+                '政治': cfg.zhengzhiFolder.value, '历史': cfg.lishiFolder.value, '地理': cfg.diliFolder.value,
+                '技术': cfg.jishuFolder.value, '资料': cfg.ziliaoFolder.value}
+
+    def setExpand(self, isExpand: bool):
+        if isExpand:
+            self.analyze()
+        super().setExpand(isExpand)
+
+    def analyze(self):
+        if self.analyzeThread is not None and self.analyzeThread.isRunning():
+            return
+        folders = self.folders()
+        if not self.items:
+            for name in folders:
+                self.items[name] = SubjectStatsItem(name, self.view)
+                self.viewLayout.addWidget(self.items[name])
+            self._adjustViewSize()
+        # the last results show at once, the walk only updates what changed since
+        summary = loadSummary()
+        for name, folder in folders.items():
+            if summary.get(folder):
+                self.items[name].setStats(summary[folder])
+            elif not folder:
+                self.items[name].statsLabel.setText('未设置')
+        self.analyzeThread = AnalyzeThread(folders, self)
+        self.analyzeThread.folderReady.connect(self.onFolderReady)
+        self.analyzeThread.start()
+
+    def onFolderReady(self, name: str, stats: dict):
+        self.items[name].setStats(stats)
+
+    def stop(self):
+        """ Cancel the analysis and return the thread to wait for """
+        if self.analyzeThread is not None:
+            self.analyzeThread.analyzer.cancel()
+        return self.analyzeThread
+
+
+class SpeedTestThread(QThread):
+    progress = Signal(str, float)
+    result = Signal(dict)
+    failed = Signal(str)
+
+    def __init__(self, drive: str, parent=None):
+        super(SpeedTestThread, self).__init__(parent)
+        self.drive = drive
+
+    def run(self):
+        import speedtest
+        try:
+            result = speedtest.run(self.drive, progress=self.progress.emit, cancelled=self.isInterruptionRequested)
+        except speedtest.SpeedTestCancelled:
+            self.failed.emit('已取消')
+            return
+        except OSError as e:
+            self.failed.emit(f'测试失败: {e.strerror or e}')
+            return
+        serial, fileSystem = volumeInformation(self.drive)
+        DriveProfiles().recordSpeedTest(serial, self.drive, fileSystem, result)
+        self.result.emit(result)
+
+
+class SpeedTestCard(SettingCard):
+    """ Measures a drive and offers the buffer size and process count that suit it """
+    phases = {'write': '顺序写入', 'read': '顺序读取', 'small files': '小文件写入'}
+
+    def __init__(self, icon: Union[str, QIcon, FIF], title, content=None, parent=None):
+        """
+        Parameters
+        ----------
+        icon: str | QIcon | FluentIconBase
+            the icon to be drawn
+
+        title: str
+            the title of card
+
+        content: str
+            the content of card
+
+        parent: QWidget
+            parent widget
+        """
+        super().__init__(icon, title, content, parent)
+        self.testThread = None
+        self.recommendation = None
+        self.drivesListed = False
+        self.comboBox = ComboBox(self)
+        self.testButton = QPushButton('测试', self)
+        self.applyButton = QPushButton('应用建议', self)
+        self.applyButton.hide()
+        self.hBoxLayout.addWidget(self.comboBox, 0, Qt.AlignRight)
+        self.hBoxLayout.addSpacing(8)
+        self.hBoxLayout.addWidget(self.testButton, 0, Qt.AlignRight)
+        self.hBoxLayout.addSpacing(8)
+        self.hBoxLayout.addWidget(self.applyButton, 0, Qt.AlignRight)
+        self.hBoxLayout.addSpacing(16)
+        self.testButton.clicked.connect(self.onTestButton)
+        self.applyButton.clicked.connect(self.onApplyButton)
+
+    def showEvent(self, e):
+        if not self.drivesListed:
+            # psutil is only needed once the window is on screen
+            self.drivesListed = True
+            QTimer.singleShot(0, self.listDrives)
+        super().showEvent(e)
+
+    def listDrives(self):
+        self.comboBox.clear()
+        drives = removableDrives()
+        self.comboBox.addItems(drives)
+        self.testButton.setDisabled(not drives)
+        if not drives:
+            self.setContent('未找到U盘')
+
+    def onTestButton(self):
+        if self.testThread is not None and self.testThread.isRunning():
+            self.testThread.requestInterruption()
+            return
+        drive = self.comboBox.currentText()
+        if not drive:
+            self.listDrives()
+            return
+        self.applyButton.hide()
+        self.testButton.setText('停止')
+        self.setContent('正在准备…')
+        self.testThread = SpeedTestThread(drive, self)
+        self.testThread.progress.connect(self.onProgress)
+        self.testThread.result.connect(self.onResult)
+        self.testThread.failed.connect(self.onFailed)
+        self.testThread.start()
+
+    def onProgress(self, phase: str, fraction: float):
+        self.setContent(f'{self.phases.get(phase, phase)} {round(fraction * 100)}%')
+
+    def onResult(self, result: dict):
+        self.testButton.setText('测试')
+        self.recommendation = recommend(result)
+        self.setContent(f'写入 {result["largeMBps"]} MB/s，读取 {result["readMBps"]} MB/s，'
+                        f'小文件 {result["smallFilesPerSec"]} 个/秒。建议缓冲区 {self.recommendation["bufSize"].value}，'
+                        f'并行进程数 {self.recommendation["concurrentProcess"]}')
+        self.applyButton.show()
+
+    def onFailed(self, message: str):
+        self.testButton.setText('测试')
+        self.setContent(message)
+
+    def onApplyButton(self):
+        cfg.set(cfg.BufSize, self.recommendation['bufSize'])
+        cfg.set(cfg.ConcurrentProcess, self.recommendation['concurrentProcess'])
+        self.applyButton.hide()
+
+    def stop(self):
+        """ Interrupt the test and return the thread to wait for, a write in flight finishes first """
+        if self.testThread is not None:
+            self.testThread.requestInterruption()
+        return self.testThread
+
+
 class ClearCache(QThread):
     isFinished = Signal(bool)
     def __init__(self):
@@ -868,8 +1175,21 @@ class ClearCache(QThread):
         self.isFinished.emit(True)
 
 
+class Probe(QThread):
+    """ Runs a slow read such as the cache size off the GUI thread """
+    result = Signal(str)
+
+    def __init__(self, function, parent=None):
+        super(Probe, self).__init__(parent)
+        self.function = function
+
+    def run(self):
+        self.result.emit(self.function())
+
+
 class HomeInterface(SmoothScrollArea):
     sourceFolderChanged = Signal(list)
+    helpClicked = Signal()
 
     def __init__(self, parent=None):
         super().__init__(parent=parent)
@@ -878,9 +1198,6 @@ class HomeInterface(SmoothScrollArea):
         self.expandLayout = ExpandLayout(self.scrollWidget)
         self.sourceGroup = SettingCardGroup(self.tr('源'), self.scrollWidget)
         self.actGroup = SettingCardGroup(self.tr('行为'), self.scrollWidget)
-        self.performanceGroup = SettingCardGroup(self.tr('性能'), self.scrollWidget)
-        self.storageGroup = SettingCardGroup(self.tr('存储'), self.scrollWidget)
-        self.advanceGroup = SettingCardGroup(self.tr('高级'), self.scrollWidget)
         self.optionSourceCard = ComboBoxSettingCard(
             cfg.IsSourceCloud,
             FIF.FOLDER,
@@ -911,6 +1228,21 @@ class HomeInterface(SmoothScrollArea):
             self.tr("展开选项卡以设置"),
             directory=cfg.sourceFolder.value,
             parent=self.sourceGroup)
+        self.subjectStatsCard = SubjectStatsCard(
+            self.tr("源文件夹统计"),
+            self.tr("展开查看各学科的文件数、大小和小文件占比"),
+            parent=self.sourceGroup)
+        self.cardsCreated = False
+        self.__initWidget()
+
+    def __initCards(self):
+        # the groups below the first screen are built once the window is painted
+        if self.cardsCreated:
+            return
+        self.cardsCreated = True
+        self.performanceGroup = SettingCardGroup(self.tr('性能'), self.scrollWidget)
+        self.storageGroup = SettingCardGroup(self.tr('存储'), self.scrollWidget)
+        self.advanceGroup = SettingCardGroup(self.tr('高级'), self.scrollWidget)
         self.scanCycleCard = RangeSettingCard(
             cfg.ScanCycle,
             FIF.STOP_WATCH,
@@ -930,12 +1262,72 @@ class HomeInterface(SmoothScrollArea):
                 self.tr('128 MB'), self.tr('256 MB'),
                 self.tr('512 MB'), self.tr('1 GB')],
             parent=self.performanceGroup)
+        self.copyEngineCard = ComboBoxSettingCard(
+            cfg.CopyEngine,
+            FIF.SPEED_HIGH,
+            self.tr('复制引擎'),
+            self.tr('内置引擎针对大量小文件和低速U盘优化'),
+            texts=['FastCopy', self.tr('Express 内置')],
+            parent=self.performanceGroup)
+        self.packedSubjectsCard = PackedSubjectsCard(
+            self.tr("打包存储"),
+            self.tr("选中的学科在U盘上存为一个 zip 文件，只追加有变化的文件，适合大量小文件"),
+            parent=self.performanceGroup)
+        self.contentCheckCard = SwitchSettingCard(
+            FIF.FINGERPRINT,
+            self.tr("内容比对"),
+            self.tr("大小相同仅时间变化的文件比对内容，相同则只更新时间 (内置引擎)"),
+            configItem=cfg.ContentCheck,
+            parent=self.performanceGroup)
+        self.fingerprintCard = ComboBoxSettingCard(
+            cfg.FingerprintMode,
+            FIF.SEARCH,
+            self.tr('比对方式'),
+            self.tr('抽样指纹只读取文件头尾和若干数据块，适合大视频文件'),
+            texts=[self.tr('完整哈希'), self.tr('抽样指纹')],
+            parent=self.performanceGroup)
+        self.verifyCard = ComboBoxSettingCard(
+            cfg.Verify,
+            FIF.ACCEPT,
+            self.tr('写入校验'),
+            self.tr('复制时计算校验值，写入后重新读取U盘比对，失败自动重试'),
+            texts=[self.tr('关闭'), self.tr('完整校验'), self.tr('抽样校验')],
+            parent=self.performanceGroup)
+        self.speedTestCard = SpeedTestCard(
+            FIF.SPEED_MEDIUM,
+            self.tr('U盘测速'),
+            self.tr('测试U盘的读写速度，并给出缓冲区大小和并行进程数的建议'),
+            parent=self.performanceGroup)
+        self.autoTuneCard = SwitchSettingCard(
+            FIF.ROBOT,
+            self.tr("按U盘性能自动调整"),
+            self.tr("根据测速和以往同步的速度选择缓冲区大小、并行进程数，低速U盘改用内置引擎"),
+            configItem=cfg.AutoTune,
+            parent=self.performanceGroup)
         self.clearCard = PushSettingCard(
             self.tr('清除'),
             FIF.BROOM,
             self.tr('清除缓存'),
-            self.tr(self.getSize()),
+            self.cachedSizeText(),
+            self.storageGroup)
+        self.reportCard = PushSettingCard(
+            self.tr('查看'),
+            FIF.HISTORY,
+            self.tr('同步记录'),
+            self.tr('正在读取…'),
             self.storageGroup)
+        self.logMaxSizeCard = SpinBoxSettingCard(
+            cfg.LogMaxSize,
+            FIF.SAVE,
+            self.tr('日志空间上限'),
+            self.tr('归档的同步记录、追踪和性能分析文件最多占用的空间 (MB)，超出时自动删除最旧的'),
+            parent=self.storageGroup)
+        self.logKeepDaysCard = SpinBoxSettingCard(
+            cfg.LogKeepDays,
+            FIF.DATE_TIME,
+            self.tr('日志保留天数'),
+            self.tr('更早的归档日志自动删除'),
+            parent=self.storageGroup)
         self.recoverCard = PushSettingCard(
             self.tr('恢复'),
             FIF.CLEAR_SELECTION,
@@ -954,7 +1346,35 @@ class HomeInterface(SmoothScrollArea):
             self.tr('帮助'),
             self.tr('提示与常见问题'),
             self.advanceGroup)
-        self.__initWidget()
+        self.performanceGroup.addSettingCard(self.scanCycleCard)
+        self.performanceGroup.addSettingCard(self.concurrentProcessCard)
+        self.performanceGroup.addSettingCard(self.bufSizeCard)
+        self.performanceGroup.addSettingCard(self.copyEngineCard)
+        self.performanceGroup.addSettingCard(self.packedSubjectsCard)
+        self.performanceGroup.addSettingCard(self.contentCheckCard)
+        self.performanceGroup.addSettingCard(self.fingerprintCard)
+        self.performanceGroup.addSettingCard(self.verifyCard)
+        self.performanceGroup.addSettingCard(self.speedTestCard)
+        self.performanceGroup.addSettingCard(self.autoTuneCard)
+        self.storageGroup.addSettingCard(self.clearCard)
+        self.storageGroup.addSettingCard(self.reportCard)
+        self.storageGroup.addSettingCard(self.logMaxSizeCard)
+        self.storageGroup.addSettingCard(self.logKeepDaysCard)
+        self.advanceGroup.addSettingCard(self.recoverCard)
+        self.advanceGroup.addSettingCard(self.devCard)
+        self.advanceGroup.addSettingCard(self.helpCard)
+        self.clearCard.clicked.connect(self.clearCache)
+        self.reportCard.clicked.connect(self.onReportCard)
+        self.recoverCard.clicked.connect(self.recoverConfig)
+        self.devCard.clicked.connect(self.openConfig)
+        self.helpCard.clicked.connect(self.helpClicked)
+        for group in (self.performanceGroup, self.storageGroup, self.advanceGroup):
+            self.expandLayout.addWidget(group)
+            group.show()
+        width = self.scrollWidget.width()
+        self.scrollWidget.resize(width, self.expandLayout.heightForWidth(width))
+        self.startProbe(self.getSize, self.clearCard.setContent)
+        self.startProbe(self.getReportText, self.reportCard.setContent)
 
     def __initWidget(self):
         self.resize(1000, 800)
@@ -965,27 +1385,19 @@ class HomeInterface(SmoothScrollArea):
         self.__initLayout()
         self.__connectSignalToSlot()
         self.onOptionSourceCard()
+        self.probes = []
 
     def __initLayout(self):
         self.sourceGroup.addSettingCard(self.optionSourceCard)
         self.sourceGroup.addSettingCard(self.cloudCard)
         self.sourceGroup.addSettingCard(self.customFolderCard)
+        self.sourceGroup.addSettingCard(self.subjectStatsCard)
         self.actGroup.addSettingCard(self.autoRunCard)
         self.actGroup.addSettingCard(self.notifyCard)
-        self.performanceGroup.addSettingCard(self.scanCycleCard)
-        self.performanceGroup.addSettingCard(self.concurrentProcessCard)
-        self.performanceGroup.addSettingCard(self.bufSizeCard)
-        self.storageGroup.addSettingCard(self.clearCard)
-        self.advanceGroup.addSettingCard(self.recoverCard)
-        self.advanceGroup.addSettingCard(self.devCard)
-        self.advanceGroup.addSettingCard(self.helpCard)
         self.expandLayout.setSpacing(28)
         self.expandLayout.setContentsMargins(60, 10, 60, 0)
         self.expandLayout.addWidget(self.sourceGroup)
         self.expandLayout.addWidget(self.actGroup)
-        self.expandLayout.addWidget(self.performanceGroup)
-        self.expandLayout.addWidget(self.storageGroup)
-        self.expandLayout.addWidget(self.advanceGroup)
 
     def noSourceFolderDialog(self):
         w = MessageBox(
@@ -998,23 +1410,40 @@ class HomeInterface(SmoothScrollArea):
             self.__onCloudCardClicked()
 
     def getSize(self):
-        try:
-            size = os.path.getsize('FastCopy2.ini')
-        except:
-            size = 0
-        if os.path.exists('./Log'):
-            for root, dirs, files in os.walk('./Log'):
-                try:
-                    size += sum([os.path.getsize(os.path.join(root, name)) for name in files])
-                except:
-                    pass
-        kbSize = float(size / 1024)
-        if kbSize >= 1024*1024:
-            return str(round(kbSize/1024/1024, 1)) + ' GB'
-        elif kbSize >= 1024:
-            return str(round(kbSize/1024, 1)) + ' MB'
-        else:
-            return str(int(kbSize)) + ' KB'
+        return formatSize(reconcile())
+
+    def cachedSizeText(self):
+        size = cachedSize()
+        return '正在计算…' if size is None else formatSize(size)
+
+    def startProbe(self, function, slot):
+        probe = Probe(function, self)
+        probe.result.connect(slot)
+        self.probes.append(probe)
+        probe.start()
+
+    def showEvent(self, e):
+        if not self.cardsCreated:
+            QTimer.singleShot(0, self.__initCards)
+        super().showEvent(e)
+
+    def stopThreads(self):
+        """ Ask the background threads to stop without waiting, the ones still running are returned """
+        threads = self.probes + [self.subjectStatsCard.stop()]
+        if self.cardsCreated:
+            threads.append(self.speedTestCard.stop())
+        return [thread for thread in threads if thread is not None and thread.isRunning()]
+
+    def getReportText(self):
+        runs = readRuns(limit=1)
+        if not runs:
+            return '暂无同步记录'
+        last = runs[-1]
+        return f'共 {runCount()} 次同步，最近一次 {last.get("drive")} {last.get("megabytesPerSec", 0)} MB/s'
+
+    def onReportCard(self):
+        w = ReportMessageBox(self)
+        w.exec()
 
     def onOptionSourceCard(self):
         if self.optionSourceCard.comboBox.text() == "云上春晖":
@@ -1059,7 +1488,7 @@ class HomeInterface(SmoothScrollArea):
 
     def clearFinished(self):
         self.clearCacheThread.exit(0)
-        self.clearCard.contentLabel.setText(self.getSize())
+        self.startProbe(self.getSize, self.clearCard.setContent)
         self.clearCard.button.setText('已清除')
         QTimer.singleShot(2000, lambda: self.clearCard.button.setText('清除'))
         self.clearCard.button.setDisabled(False)
@@ -1091,6 +1520,14 @@ class HomeInterface(SmoothScrollArea):
             self.scanCycleCard.setValue(10)
             self.concurrentProcessCard.setValue(3)
             self.bufSizeCard.setValue(BufSize._256)
+            self.copyEngineCard.setValue("FastCopy")
+            self.packedSubjectsCard.setValue([])
+            self.contentCheckCard.setChecked(False)
+            self.fingerprintCard.setValue("full")
+            self.verifyCard.setValue("off")
+            self.autoTuneCard.setChecked(True)
+            self.logMaxSizeCard.setValue(64)
+            self.logKeepDaysCard.setValue(180)
 
     def openConfig(self):
         w = MessageBox(
@@ -1105,9 +1542,6 @@ class HomeInterface(SmoothScrollArea):
     def __connectSignalToSlot(self):
         self.optionSourceCard.comboBox.currentTextChanged.connect(self.onOptionSourceCard)
         self.cloudCard.clicked.connect(self.__onCloudCardClicked)
-        self.clearCard.clicked.connect(self.clearCache)
-        self.recoverCard.clicked.connect(self.recoverConfig)
-        self.devCard.clicked.connect(self.openConfig)
 
 
 class DetailMessageBox(MessageBoxBase):
@@ -1150,6 +1584,40 @@ class DetailMessageBox(MessageBoxBase):
         self.widget.setMinimumWidth(350)
 
 
+class ReportMessageBox(MessageBoxBase):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.titleLabel = SubtitleLabel('同步记录', self)
+        self.textBox = TextBrowser(self)
+        self.textBox.setText(self.summaryText())
+
+        self.viewLayout.addWidget(self.titleLabel)
+        self.viewLayout.addWidget(self.textBox)
+
+        self.yesButton.setText('确定')
+        self.hideCancelButton()
+
+        self.widget.setMinimumWidth(420)
+
+    @staticmethod
+    def summaryText():
+        runs = readRuns(limit=500)
+        if not runs:
+            return '暂无同步记录'
+        lines = []
+        for drive in summarize(runs):
+            rate = lambda value: '-' if value is None else f'{value} MB/s'
+            lines.append(
+                f'{drive["drive"]} 序列号 {drive["serial"]} ({drive["fileSystem"]})\n'
+                f'    同步 {drive["runs"]} 次，共 {round(drive["copiedBytes"] / 1024 / 1024)} MB，错误 {drive["errors"]}\n'
+                f'    最近 {rate(drive["lastRate"])}，中位 {rate(drive["medianRate"])}，最慢 {rate(drive["slowestRate"])}')
+        lines.append('\n最近同步')
+        for run in reversed(runs[-10:]):
+            lines.append(f'{run["id"][:15]}  {run["drive"]}  {run["copiedFiles"]} 个文件  '
+                         f'{round(run["copiedBytes"] / 1024 / 1024)} MB  {run["seconds"]} s  {run["megabytesPerSec"]} MB/s')
+        return '\n'.join(lines)
+
+
 class AboutInterface(SmoothScrollArea):
     def __init__(self, parent=None):
         super().__init__(parent=parent)
@@ -1230,15 +1698,32 @@ class AboutInterface(SmoothScrollArea):
         self.feedbackCard.clicked.connect(self.onFeedbackCardClicked)
 
 
+class LazyInterface(QWidget):
+    """ Holds the place of an interface in the navigation, the interface is built when first shown """
+
+    def __init__(self, factory, objectName: str, parent=None):
+        super().__init__(parent=parent)
+        self.factory = factory
+        self.interface = None
+        self.setObjectName(objectName)
+        self.vBoxLayout = QVBoxLayout(self)
+        self.vBoxLayout.setContentsMargins(0, 0, 0, 0)
+
+    def showEvent(self, e):
+        if self.interface is None:
+            self.interface = self.factory(self)
+            self.vBoxLayout.addWidget(self.interface)
+        super().showEvent(e)
+
+
 class Main(MSFluentWindow):
 
     def __init__(self, parent=None):
         super().__init__(parent)
         setThemeColor(QColor(113, 89, 249))
         self.homeInterface = HomeInterface(self)
-        self.aboutInterface = AboutInterface(self)
+        self.aboutInterface = LazyInterface(AboutInterface, 'aboutInterface', self)
         self.homeInterface.setObjectName('homeInterface')
-        self.aboutInterface.setObjectName('aboutInterface')
         self.addSubInterface(self.homeInterface, FIF.HOME, '设置', FIF.HOME_FILL)
         self.navigationInterface.addItem(
             routeKey='Log',
@@ -1256,7 +1741,8 @@ class Main(MSFluentWindow):
             position=NavigationItemPosition.BOTTOM, )
         self.addSubInterface(self.aboutInterface, FIF.INFO, '关于', FIF.INFO, NavigationItemPosition.BOTTOM)
         self.navigationInterface.setCurrentItem(self.homeInterface.objectName())
-        self.homeInterface.helpCard.clicked.connect(self.onHelpBtn)
+        self.homeInterface.helpClicked.connect(self.onHelpBtn)
+        self.closing = False
         self.resize(800, 600)
         self.setWindowTitle('Express 设置')
         self.setWindowIcon(QIcon(':/icon.png'))
@@ -1264,6 +1750,19 @@ class Main(MSFluentWindow):
         desktop = QApplication.screens()[0].size()
         self.move(desktop.width() // 2 - self.width() // 2, desktop.height() // 2 - self.height() // 2)
 
+    def closeEvent(self, e):
+        threads = self.homeInterface.stopThreads()
+        if not self.closing:
+            self.closing = True
+            for thread in threads:
+                thread.finished.connect(self.close)
+        if not any(thread.isRunning() for thread in threads):
+            super().closeEvent(e)
+            return
+        # a speed test may be in the middle of a large write, the window goes now and the process when it ends
+        e.ignore()
+        self.hide()
+
     def onHelpBtn(self):
         print("clicked")
 
@@ -0,0 +1,103 @@
+""" Sync a drive without the GUI, with the same jobs and engine as ExpressMain
+
+    python ExpressSync.py --drive E: --subjects 1,2,5 --mode sync --json-progress
+    python ExpressSync.py --drive E: --mode recent --days 7 --engine Express
+
+Exit status 0 when everything was copied, 1 when a job failed, 130 when interrupted.
+"""
+import sys
+import json
+import argparse
+import settings
+
+MODES = {'sync': 1, 'low': 2, 'recent': 3, 'date': 4}
+
+
+def commandOption(args):
+    options = args.option.split()
+    if args.mode == 'recent':
+        options.insert(0, f'/from_date=-{args.days}D')
+    elif args.mode == 'date':
+        options.insert(0, f'/from_date={args.from_date}')
+        if args.to_date:
+            options.insert(1, f'/to_date={args.to_date}')
+    return ' '.join(options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drive', required=True, help='drive letter such as E:, or a mount point')
+    parser.add_argument('--subjects', default='1,2,3,4,5,6,7,8,9,10,11', help='comma separated numbers 1 - 11')
+    parser.add_argument('--mode', default='sync', choices=list(MODES))
+    parser.add_argument('--days', type=int, default=7, help='age of the files copied in recent mode')
+    parser.add_argument('--from-date', help='YYYYMMDD, date mode')
+    parser.add_argument('--to-date', help='YYYYMMDD, date mode')
+    parser.add_argument('--delete', action='store_true', help='delete the old copy first, recent and date mode')
+    parser.add_argument('--option', default='', help='additional fcp.exe options')
+    parser.add_argument('--dest', help='destination folder instead of the source folder\'s name on the drive')
+    parser.add_argument('--engine', choices=['FastCopy', 'Express'], help='override the configured copy engine')
+    parser.add_argument('--no-tune', action='store_true',
+                        help='keep the configured buffer, concurrency and engine instead of the drive profile\'s')
+    parser.add_argument('--config', default=settings.CONFIG_PATH)
+    parser.add_argument('--json-progress', action='store_true', help='print every event as one JSON line')
+    parser.add_argument('--no-report', action='store_true', help='do not append to ./Log/report.jsonl')
+    args = parser.parse_args(argv)
+    if args.mode == 'date' and not args.from_date:
+        parser.error('--mode date needs --from-date')
+
+    # only now, --help and wrong arguments answer without loading the copy code
+    import asyncio
+    from jobs import SyncRequest, requestJobs
+    from orchestrator import Orchestrator, Progress
+    from throttle import lowerPriority
+    from report import RunReport
+
+    drive = args.drive.rstrip('\\/') if len(args.drive.rstrip('\\/')) == 2 else args.drive
+    overrides = {'CopyEngine': args.engine} if args.engine else {}
+    if args.no_tune or args.engine:
+        overrides['AutoTune'] = False
+    request = SyncRequest(drive, [int(subject) for subject in args.subjects.split(',') if subject],
+                          MODES[args.mode], args.delete and args.mode in ('recent', 'date'), commandOption(args),
+                          args.dest, settings.load(args.config, **overrides))
+    if request.mode == 2:
+        lowerPriority()
+    jobs = requestJobs(request)
+    report = RunReport(drive, request.serial, request.fileSystem, request.mode, request.copyEngine)
+    progress = Progress(len(jobs))
+
+    def emit(event):
+        report.onEvent(event)
+        changed = progress.update(event)
+        if args.json_progress:
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+        elif event['type'] == 'error':
+            print(f"\n{event.get('name')}: {event.get('path') or ''} {event.get('error')}", file=sys.stderr)
+        elif changed and progress.value >= 0:
+            print(f'\r{progress.value}%', end='', file=sys.stderr, flush=True)
+
+    orchestrator = Orchestrator(emit)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(orchestrator.run(jobs))
+    try:
+        loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        # let the jobs stop on their own so no half written file stays behind
+        orchestrator.cancel()
+        loop.run_until_complete(task)
+    finally:
+        loop.close()
+
+    cancelled = any(job.state == 'cancelled' for job in jobs)
+    failed = any(job.state == 'failed' for job in jobs)
+    state = 'cancelled' if cancelled else 'done'
+    run = report.summary(state) if args.no_report else report.write(state)
+    if args.json_progress:
+        print(json.dumps(dict(run, type='summary'), ensure_ascii=False), flush=True)
+    else:
+        print(f"\r{len(jobs)} jobs, {run.get('copiedFiles', 0)} files, {run.get('errors', 0)} errors, "
+              f"{run.get('megabytesPerSec', 0)} MB/s", file=sys.stderr)
+    return 130 if cancelled else 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
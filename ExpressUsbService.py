@@ -3,6 +3,10 @@ import sys
 import subprocess
 import darkdetect
 import ExpressRes
+import tracing
+import profiling
+import ipc
+from report import logPopup
 from win32file import GetDiskFreeSpace
 from PySide6.QtGui import QIcon, QColor, QAction, QPainterPath, QPainter
 from win32api import GetVolumeInformation
@@ -600,9 +604,30 @@ class OptionInterface(QWidget):
         arg.append(mode)
         arg.append(str(isDelete))
         arg.append(commandOption)
+        arg.extend(tracing.sessionArgs())
+        tracing.instant('sync requested', mode=mode)
+        runId = self.submitToService(arg)
+        if runId:
+            arg.append(ipc.ATTACH_ARG + runId)
         subprocess.Popen(arg, shell=True)
         sys.exit()
 
+    def submitToService(self, arg):
+        """ Start the sync in the running scanner, ExpressMain then only shows its progress """
+        client = ipc.connect(1)
+        if client is None:
+            return None
+        try:
+            for run in client.status():
+                if run['drive'] == drive and run['state'] == 'running':
+                    # already syncing, follow that run instead of starting a second one
+                    return run['id']
+            return client.submit(ipc.argvToRequest(arg))['id']
+        except (OSError, ipc.IpcError):
+            return None
+        finally:
+            client.close()
+
     def onLatelyCopyAction(self):
         w = LatelyCopyMessageBox(self)
         if w.exec():
@@ -788,10 +813,15 @@ if __name__ == '__main__':
     QApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
     if darkdetect.isDark():
         setTheme(Theme.DARK)
+    tracing.init(sys.argv, 'ExpressUsbService')
+    profiling.start('ExpressUsbService')
+    tracing.instant('import done')
     app = QApplication(sys.argv)
     if len(sys.argv) != 2:
         sys.exit()
     drive = sys.argv[1]
     w = MainWindow()
     w.show()
+    tracing.instant('window shown')
+    logPopup(drive)
     app.exec()
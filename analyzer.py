@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import heapq
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+CACHE_DIR = './Log/Analyzer'
+SUMMARY_NAME = 'summary.json'
+MB = 1024 * 1024
+LARGEST = 5
+
+
+class TreeCache:
+    """ Directory listings of one source folder, a directory is listed again only when its mtime changed
+
+    A file edited in place does not change the mtime of its directory, so sizes can lag behind until
+    something is added or removed there. Good enough for statistics and estimates, the copy engine
+    still scans the tree itself before syncing.
+    """
+
+    def __init__(self, folder: str, directory: str = CACHE_DIR):
+        self.folder = folder
+        self.path = os.path.join(directory, hashlib.sha1(os.path.normcase(os.path.abspath(folder))
+                                                         .encode('utf-8')).hexdigest()[:16] + '.json')
+        self.dirs = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                values = json.load(f)
+            if values.get('folder') == folder:
+                self.dirs = values['dirs']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'folder': self.folder, 'dirs': self.dirs}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass
+
+    def scanDir(self, rel: str):
+        """ (listing, rescanned) of a directory, the cached listing while its mtime is unchanged """
+        path = os.path.join(self.folder, rel) if rel else self.folder
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, False
+        old = self.dirs.get(rel)
+        if old and old['mtime'] == mtime:
+            return old, False
+        listing = {'mtime': mtime, 'files': {}, 'dirs': []}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            listing['dirs'].append(entry.name)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            listing['files'][entry.name] = [st.st_size, st.st_mtime]
+                    except OSError:
+                        pass
+        except OSError:
+            return None, False
+        return listing, True
+
+
+def summarize(cache: TreeCache, smallFileSize: int = MB):
+    """ Files, bytes, small-file ratio and largest files of a cached tree """
+    files = bytes = small = 0
+    largest = []
+    for rel, listing in cache.dirs.items():
+        for name, (size, mtime) in listing['files'].items():
+            files += 1
+            bytes += size
+            if size <= smallFileSize:
+                small += 1
+            if len(largest) < LARGEST:
+                heapq.heappush(largest, (size, os.path.join(rel, name)))
+            elif size > largest[0][0]:
+                heapq.heapreplace(largest, (size, os.path.join(rel, name)))
+    return {'folder': cache.folder, 'files': files, 'bytes': bytes, 'dirs': max(0, len(cache.dirs) - 1),
+            'smallFiles': small, 'smallRatio': round(small / files, 3) if files else 0.0,
+            'largest': [[rel, size] for size, rel in sorted(largest, reverse=True)]}
+
+
+class Analyzer:
+    """ Walks the subject folders in parallel and keeps per-folder statistics in ./Log/Analyzer
+
+    The directories of all folders share one thread pool, so one huge folder does not keep the
+    others waiting and a slow network share gets several outstanding listings at once.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, workers: int = 8, smallFileSize: int = MB):
+        self.directory = directory
+        self.workers = workers
+        self.smallFileSize = smallFileSize
+        self._cancelEvent = threading.Event()
+
+    def cancel(self):
+        self._cancelEvent.set()
+
+    def analyze(self, folders: dict, onFolder=None):
+        """ Statistics of every folder of `folders` {key: path}, `onFolder(key, stats)` as each one is done """
+        caches = {key: TreeCache(folder, self.directory) for key, folder in folders.items() if folder}
+        fresh = {key: {} for key in caches}
+        rescanned = dict.fromkeys(caches, 0)
+        remaining = dict.fromkeys(caches, 1)
+        started = dict.fromkeys(caches, time.perf_counter())
+        results = {}
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = {pool.submit(cache.scanDir, ''): (key, '') for key, cache in caches.items()}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, rel = pending.pop(future)
+                    listing, scanned = future.result()
+                    remaining[key] -= 1
+                    if listing is not None:
+                        fresh[key][rel] = listing
+                        rescanned[key] += scanned
+                        if not self._cancelEvent.is_set():
+                            for name in listing['dirs']:
+                                child = os.path.join(rel, name) if rel else name
+                                pending[pool.submit(caches[key].scanDir, child)] = (key, child)
+                                remaining[key] += 1
+                    if remaining[key] == 0 and not self._cancelEvent.is_set():
+                        results[key] = self._finish(caches[key], fresh[key], rescanned[key], started[key])
+                        if onFolder:
+                            onFolder(key, results[key])
+        self._saveSummary(results.values())
+        return results
+
+    def _finish(self, cache, listings, rescanned, started):
+        # directories that vanished drop out because only what was reached this time is kept
+        cache.dirs = listings
+        if rescanned or not os.path.exists(cache.path):
+            cache.save()
+        stats = summarize(cache, self.smallFileSize)
+        stats['exists'] = '' in listings
+        stats['rescannedDirs'] = rescanned
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        stats['time'] = time.time()
+        return stats
+
+    def _saveSummary(self, results):
+        summary = loadSummary(self.directory)
+        summary.update({stats['folder']: stats for stats in results})
+        path = os.path.join(self.directory, SUMMARY_NAME)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+
+def loadSummary(directory: str = CACHE_DIR):
+    """ folder: statistics of the last analysis, read without touching the folders """
+    try:
+        with open(os.path.join(directory, SUMMARY_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def folderStats(folder: str, directory: str = CACHE_DIR):
+    return loadSummary(directory).get(folder)
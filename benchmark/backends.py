@@ -0,0 +1,58 @@
+import os
+import time
+import errno
+import threading
+from engine import LocalBackend, MB
+
+
+class ThrottledBackend(LocalBackend):
+    """ A local directory that writes like a removable drive
+
+    Writes are paced to `bandwidth` and every created file costs `fileLatency`,
+    which is what makes thousands of small files slow on a real stick.
+    The default numbers are those of a cheap USB 2.0 stick.
+    """
+
+    def __init__(self, bandwidth: float = 8 * MB, fileLatency: float = 0.004, capacity: int = None):
+        """
+        Parameters
+        ----------
+        bandwidth: float
+            write speed in bytes per second
+
+        fileLatency: float
+            seconds spent creating a file, updating directory entries and the FAT
+
+        capacity: int
+            bytes that fit on the drive, None for unlimited
+        """
+        self.bandwidth = bandwidth
+        self.fileLatency = fileLatency
+        self.capacity = capacity
+        self.written = 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        time.sleep(self.fileLatency)
+        return super().open(path)
+
+    def write(self, fd, data):
+        if self.capacity is not None and self.written + len(data) > self.capacity:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        n = super().write(fd, data)
+        with self._lock:
+            self.written += n
+            now = time.monotonic()
+            self._next = max(self._next, now) + n / self.bandwidth
+            wait = self._next - now
+        if wait > 0:
+            time.sleep(wait)
+        return n
+
+
+TARGETS = {
+    'local': lambda: LocalBackend(),
+    'usb2': lambda: ThrottledBackend(8 * MB, 0.004),
+    'usb3': lambda: ThrottledBackend(60 * MB, 0.001),
+}
@@ -0,0 +1,305 @@
+""" Inject destination failures into a sync and measure how Express recovers
+
+    python -m benchmark.faults --scale 0.02 --out faults.json
+
+Exit status 1 when a scenario does not end with a complete copy.
+"""
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+from engine import CopyEngine, LocalBackend, MB, scanTree
+from packstore import PackedStore
+from benchmark.trees import TreeGenerator, SUBJECTS
+
+ERRORS = {'enospc': errno.ENOSPC, 'eio': errno.EIO, 'eacces': errno.EACCES}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKED_SCENARIO = 'packed-pull-append'
+# the process dies halfway through appending, as with a pulled stick nothing after that reaches the drive
+PACKED_PULL = '''
+import os
+import sys
+sys.path.insert(0, sys.argv[1])
+from packstore import PackedStore
+
+
+def progress(done, total, path):
+    if done >= total // 2:
+        os._exit(1)
+
+
+PackedStore(sys.argv[3]).sync(sys.argv[2], progress=progress)
+'''
+
+
+class Fault:
+    """ What goes wrong and when
+
+    The fault fires on the `after`-th call of `op` or once `afterBytes` have been written,
+    and keeps firing for `count` calls, None meaning until the end.
+    """
+
+    def __init__(self, kind: str, op: str = 'write', after: int = 0, afterBytes: int = None,
+                 count: int = None, latency: float = 0.0):
+        """
+        Parameters
+        ----------
+        kind: str
+            'enospc', 'eio', 'eacces', 'latency' or 'vanish'
+
+        op: str
+            backend method the fault is attached to, e.g. 'open' or 'write'
+
+        latency: float
+            seconds added per call for the 'latency' kind
+        """
+        self.kind = kind
+        self.op = op
+        self.after = after
+        self.afterBytes = afterBytes
+        self.count = count
+        self.latency = latency
+        self.calls = 0
+        self.fired = 0
+        self.firedAt = None
+
+
+class FaultyBackend(LocalBackend):
+    """ A destination backend that fails on purpose
+
+    'vanish' moves the destination root away, as pulling the stick does, and every later
+    operation fails with ENODEV until `reinsert` puts it back.
+    """
+
+    def __init__(self, root: str, faults: list, inner: LocalBackend = None):
+        self.root = root
+        self.faults = faults
+        self.inner = inner or LocalBackend()
+        self.written = 0
+        self.vanished = False
+        self._lock = threading.Lock()
+
+    def reinsert(self):
+        if self.vanished:
+            os.replace(self.root + '.pulled', self.root)
+            self.vanished = False
+        self.faults = []
+
+    def _inject(self, op, nbytes=0):
+        with self._lock:
+            if self.vanished:
+                raise OSError(errno.ENODEV, os.strerror(errno.ENODEV))
+            for fault in self.faults:
+                if fault.op != op:
+                    continue
+                fault.calls += 1
+                due = self.written >= fault.afterBytes if fault.afterBytes is not None else fault.calls > fault.after
+                if not due or (fault.count is not None and fault.fired >= fault.count):
+                    continue
+                fault.fired += 1
+                fault.firedAt = fault.firedAt or time.perf_counter()
+                if fault.kind == 'latency':
+                    time.sleep(fault.latency)
+                elif fault.kind == 'vanish':
+                    self.vanished = True
+                    os.replace(self.root, self.root + '.pulled')
+                    raise OSError(errno.ENODEV, os.strerror(errno.ENODEV))
+                else:
+                    raise OSError(ERRORS[fault.kind], os.strerror(ERRORS[fault.kind]))
+            self.written += nbytes
+
+    def open(self, path):
+        self._inject('open')
+        return self.inner.open(path)
+
+    def write(self, fd, data):
+        self._inject('write', len(data))
+        return self.inner.write(fd, data)
+
+    def close(self, fd):
+        self.inner.close(fd)
+
+    def fsync(self, fd):
+        self._inject('fsync')
+        self.inner.fsync(fd)
+
+    def preallocate(self, fd, size):
+        self.inner.preallocate(fd, size)
+
+    def makedirs(self, path):
+        self._inject('makedirs')
+        self.inner.makedirs(path)
+
+    def remove(self, path):
+        self._inject('remove')
+        self.inner.remove(path)
+
+    def rmdir(self, path):
+        self._inject('rmdir')
+        self.inner.rmdir(path)
+
+    def chmod(self, path, mode):
+        self._inject('chmod')
+        self.inner.chmod(path, mode)
+
+    def utime(self, path, mtime):
+        self._inject('utime')
+        self.inner.utime(path, mtime)
+
+
+def scenarios(treeBytes):
+    half = treeBytes // 2
+    return {
+        'enospc-half': [Fault('enospc', afterBytes=half)],
+        'eio-once': [Fault('eio', after=20, count=1)],
+        'eacces-open': [Fault('eacces', op='open', after=10, count=5)],
+        'latency-spike': [Fault('latency', op='write', after=10, count=20, latency=0.05)],
+        'vanish-half': [Fault('vanish', afterBytes=half)],
+    }
+
+
+def orphanedBytes(source, dest):
+    """ Bytes on the destination that are neither a complete copy nor a file of the source """
+    srcFiles = scanTree(source)[0]
+    dstFiles = scanTree(dest)[0] if os.path.isdir(dest) else {}
+    orphaned = 0
+    for rel, (size, mtime, mode) in dstFiles.items():
+        src = srcFiles.get(rel)
+        if src is None or src[0] != size or abs(src[1] - mtime) > 2:
+            orphaned += size
+    return orphaned
+
+
+def syncAll(source, dest, backend):
+    totals = {'files': 0, 'bytes': 0, 'errors': 0, 'destLost': False}
+    for subject in SUBJECTS:
+        stats = CopyEngine(16 * MB, backend=backend).sync(os.path.join(source, subject), os.path.join(dest, subject))
+        totals['files'] += stats.copiedFiles
+        totals['bytes'] += stats.copiedBytes
+        totals['errors'] += len(stats.errors)
+        if stats.destLost:
+            totals['destLost'] = True
+            break
+    return totals
+
+
+def runScenario(name, faults, source, dest, treeFiles, treeBytes):
+    shutil.rmtree(dest, ignore_errors=True)
+    os.makedirs(dest)
+    backend = FaultyBackend(dest, faults)
+    start = time.perf_counter()
+    first = syncAll(source, dest, backend)
+    end = time.perf_counter()
+    firedAt = min((fault.firedAt for fault in faults if fault.firedAt), default=None)
+    backend.reinsert()
+    orphaned = orphanedBytes(source, dest)
+
+    # the next insertion of the same stick, with nothing failing
+    start2 = time.perf_counter()
+    second = syncAll(source, dest, LocalBackend())
+    leftover = orphanedBytes(source, dest)
+    return {
+        'scenario': name,
+        'fired': sum(fault.fired for fault in faults),
+        'firstSeconds': round(end - start, 3),
+        'detectMs': round((end - firedAt) * 1000, 1) if firedAt else None,
+        'firstFiles': first['files'],
+        'firstErrors': first['errors'],
+        'destLost': first['destLost'],
+        'orphanedBytes': orphaned,
+        'redoFiles': second['files'],
+        'redoBytes': second['bytes'],
+        # bytes the first run had already written and the second had to write again
+        'wastedBytes': max(0, first['bytes'] + second['bytes'] - treeBytes),
+        'secondSeconds': round(time.perf_counter() - start2, 3),
+        'leftoverBytes': leftover,
+        'complete': leftover == 0 and second['errors'] == 0,
+    }
+
+
+def runPackedScenario(source, work):
+    """ Pull the stick while changed members are appended to a packed subject, then sync again """
+    folder = os.path.join(work, 'packed-source')
+    container = os.path.join(work, 'packed-dest', SUBJECTS[0] + '.zip')
+    shutil.rmtree(folder, ignore_errors=True)
+    shutil.rmtree(os.path.dirname(container), ignore_errors=True)
+    shutil.copytree(os.path.join(source, SUBJECTS[0]), folder)
+    PackedStore(container).sync(folder)
+    srcFiles = {}
+    for rel, (size, mtime, mode) in scanTree(folder)[0].items():
+        # every member changes, so the interrupted sync appends all of them
+        os.utime(os.path.join(folder, rel), (mtime + 10, mtime + 10))
+        srcFiles[rel.replace(os.sep, '/')] = (size, mtime + 10)
+
+    start = time.perf_counter()
+    pulled = subprocess.run([sys.executable, '-c', PACKED_PULL, ROOT, folder, container]).returncode != 0
+    end = time.perf_counter()
+    readable = zipfile.is_zipfile(container)
+
+    start2 = time.perf_counter()
+    store = PackedStore(container)
+    try:
+        stats = store.sync(folder)
+        members = store.members()
+        error = None
+    except Exception as e:
+        # a container left without its directory used to fail every later sync
+        stats, members, error = None, {}, f'{type(e).__name__}: {e}'
+    return {
+        'scenario': PACKED_SCENARIO,
+        'fired': int(pulled),
+        'firstSeconds': round(end - start, 3),
+        'readableAfterPull': readable,
+        'redoFiles': stats.copiedFiles if stats else 0,
+        'redoBytes': stats.copiedBytes if stats else 0,
+        'secondSeconds': round(time.perf_counter() - start2, 3),
+        'error': error,
+        'complete': stats is not None and not stats.errors and all(rel in members and members[rel][0] == size
+                                             and abs(members[rel][1] - mtime) <= 2
+                                             for rel, (size, mtime) in srcFiles.items()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=0.02)
+    parser.add_argument('--video-scale', type=float, default=0.002)
+    parser.add_argument('--scenario', help='comma separated subset of the scenarios')
+    parser.add_argument('--work')
+    parser.add_argument('--out')
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix='express-faults-', dir=args.work)
+    try:
+        source, dest = os.path.join(work, 'source'), os.path.join(work, 'dest')
+        treeFiles, treeBytes = TreeGenerator(scale=args.scale, videoScale=args.video_scale).generate(source)
+        results = []
+        for name, faults in scenarios(treeBytes).items():
+            if args.scenario and name not in args.scenario.split(','):
+                continue
+            results.append(runScenario(name, faults, source, dest, treeFiles, treeBytes))
+            print(json.dumps(results[-1]), file=sys.stderr)
+        if not args.scenario or PACKED_SCENARIO in args.scenario.split(','):
+            results.append(runPackedScenario(source, work))
+            print(json.dumps(results[-1]), file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    text = json.dumps({'treeFiles': treeFiles, 'treeBytes': treeBytes, 'results': results}, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if all(result['complete'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+""" Measure sync backends on synthetic classroom trees
+
+    python -m benchmark.runner --scale 0.05 --video-scale 0.01 --target usb2 --out result.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from engine import CopyEngine, MB, scanTree, planSync
+from benchmark.trees import TreeGenerator, SUBJECTS, DAY
+from benchmark.backends import TARGETS
+
+SCENARIOS = ['full', 'incremental', 'mirror', 'from-date']
+
+
+class RssSampler(threading.Thread):
+    """ Peak resident set size while a scenario runs """
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, currentRss())
+            if self._stopEvent.wait(self.interval):
+                break
+
+    def stop(self):
+        self._stopEvent.set()
+        self.join()
+        return self.peak
+
+
+def currentRss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LatencyRecorder:
+    """ Per-file latency from opening the destination until the engine reports the file done """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.latencies = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        open = backend.open
+
+        def timedOpen(path):
+            self._local.start = time.perf_counter()
+            return open(path)
+
+        backend.open = timedOpen
+
+    def progress(self, done, total, path):
+        start = getattr(self._local, 'start', None)
+        if start is not None:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+            self._local.start = None
+
+
+def runEngine(source, dest, target, bufSize, concurrency, delete, fromDate):
+    backend = TARGETS[target]()
+    recorder = LatencyRecorder(backend)
+
+    def syncSubject(subject):
+        engine = CopyEngine(bufSize * MB, backend=backend)
+        return engine.sync(os.path.join(source, subject), os.path.join(dest, subject), delete, fromDate,
+                           progress=recorder.progress)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        stats = list(pool.map(syncSubject, SUBJECTS))
+    return {
+        'files': sum(s.copiedFiles for s in stats),
+        'bytes': sum(s.copiedBytes for s in stats),
+        'deleted': sum(s.deletedFiles for s in stats),
+        'errors': sum(len(s.errors) for s in stats),
+        'latencies': recorder.latencies,
+    }
+
+
+def runFastCopy(source, dest, target, bufSize, concurrency, delete, fromDate):
+    """ fcp.exe only exists on Windows and only writes to the real target """
+    srcFiles, srcDirs = scanTree(source)
+    dstFiles, dstDirs = scanTree(dest) if os.path.isdir(dest) else ({}, set())
+    plan = planSync(srcFiles, dstFiles, dstDirs, srcDirs, delete, fromDate)
+    args = ['fcp.exe', '/cmd=sync' if delete else '/cmd=diff', f'/bufsize={bufSize}', '/log=FALSE',
+            f'/force_start={concurrency}']
+    if fromDate:
+        args.append('/from_date=' + time.strftime('%Y%m%d', time.localtime(fromDate)))
+    for subject in SUBJECTS:
+        subprocess.call(args + [os.path.join(source, subject), '/to=' + dest + os.sep])
+    return {'files': len(plan.copy), 'bytes': plan.copyBytes(), 'deleted': len(plan.delete), 'errors': 0,
+            'latencies': []}
+
+
+BACKENDS = {'engine': runEngine, 'fcp': runFastCopy}
+
+
+def runScenario(scenario, generator, work, backend, target, bufSize, concurrency):
+    source, dest = os.path.join(work, 'source'), os.path.join(work, 'dest')
+    fromDate = None
+    if scenario in ('full', 'from-date'):
+        shutil.rmtree(dest, ignore_errors=True)
+    if scenario == 'incremental':
+        generator.mutate(source)
+    elif scenario == 'mirror':
+        generator.remove(source)
+    elif scenario == 'from-date':
+        fromDate = time.time() - 14 * DAY
+
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    result = BACKENDS[backend](source, dest, target, bufSize, concurrency, scenario != 'from-date', fromDate)
+    seconds = time.perf_counter() - start
+    peak = sampler.stop()
+
+    latencies = result.pop('latencies')
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    result.update({
+        'scenario': scenario,
+        'backend': backend,
+        'target': target,
+        'bufSizeMb': bufSize,
+        'concurrency': concurrency,
+        'seconds': round(seconds, 3),
+        'filesPerSec': round(result['files'] / seconds, 1) if seconds else 0,
+        'megabytesPerSec': round(result['bytes'] / MB / seconds, 2) if seconds else 0,
+        'latencyP50Ms': round(p50 * 1000, 2) if p50 is not None else None,
+        'latencyP99Ms': round(p99 * 1000, 2) if p99 is not None else None,
+        'peakRssMb': round(peak / MB, 1),
+    })
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=0.05, help='share of the office files and PDFs of a full tree')
+    parser.add_argument('--video-scale', type=float, default=0.01, help='share of the real video size')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--backend', default='engine', help='comma separated: ' + ', '.join(BACKENDS))
+    parser.add_argument('--target', default='local', help='comma separated: ' + ', '.join(TARGETS))
+    parser.add_argument('--buf-size', default='256', help='comma separated buffer sizes in MB')
+    parser.add_argument('--concurrency', default='1', help='comma separated numbers of parallel subjects')
+    parser.add_argument('--scenario', default=','.join(SCENARIOS))
+    parser.add_argument('--work', help='working directory, a temporary one by default')
+    parser.add_argument('--out', help='write the JSON result here instead of stdout')
+    args = parser.parse_args(argv)
+
+    generator = TreeGenerator(args.seed, args.scale, args.video_scale)
+    results = []
+    for backend in args.backend.split(','):
+        if backend == 'fcp' and shutil.which('fcp.exe') is None:
+            print('fcp.exe not found, skipping', file=sys.stderr)
+            continue
+        for target in args.target.split(','):
+            for bufSize in map(int, args.buf_size.split(',')):
+                for concurrency in map(int, args.concurrency.split(',')):
+                    work = tempfile.mkdtemp(prefix='express-bench-', dir=args.work)
+                    try:
+                        files, size = generator.generate(os.path.join(work, 'source'))
+                        for scenario in args.scenario.split(','):
+                            result = runScenario(scenario, generator, work, backend, target, bufSize, concurrency)
+                            result.update(treeFiles=files, treeBytes=size)
+                            results.append(result)
+                            print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+                    finally:
+                        shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'scale': args.scale,
+        'videoScale': args.video_scale,
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+""" Fake removable drives for running the scanner and a sync end to end on Linux
+
+    python -m benchmark.simulator --timeline "1:insert:E,6:remove:E" --scale 0.02
+"""
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import namedtuple
+from engine import CopyEngine, MB, FAT_TIME_TOLERANCE
+from benchmark.trees import TreeGenerator, SUBJECTS
+from benchmark.backends import ThrottledBackend
+from report import appendRecords
+from metrics import ScanMetrics, MetricsServer, scrape, formatLabels
+
+# same fields as psutil.disk_partitions()
+Partition = namedtuple('Partition', ['device', 'mountpoint', 'fstype', 'opts', 'maxfile', 'maxpath'])
+
+
+class VolumeBackend(ThrottledBackend):
+    """ Writes of a simulated volume, with FAT timestamp granularity and removal """
+
+    def __init__(self, volume):
+        super().__init__(volume.bandwidth, volume.fileLatency, volume.capacity)
+        self.volume = volume
+
+    def open(self, path):
+        self._check()
+        return super().open(path)
+
+    def write(self, fd, data):
+        self._check()
+        return super().write(fd, data)
+
+    def makedirs(self, path):
+        self._check()
+        super().makedirs(path)
+
+    def utime(self, path, mtime):
+        self._check()
+        granularity = self.volume.timeGranularity
+        super().utime(path, mtime - mtime % granularity if granularity else mtime)
+
+    def _check(self):
+        if not self.volume.present:
+            raise OSError(errno.ENODEV, os.strerror(errno.ENODEV))
+
+
+class VirtualVolume:
+    """ A drive letter backed by a directory, or by a loop mounted FAT image when run as root """
+
+    def __init__(self, letter: str, root: str, bandwidth: float = 8 * MB, fileLatency: float = 0.004,
+                 timeGranularity: float = FAT_TIME_TOLERANCE, capacity: int = None, image: bool = False,
+                 fstype: str = 'FAT32'):
+        """
+        Parameters
+        ----------
+        letter: str
+            drive letter reported to the scanner, e.g. 'E'
+
+        root: str
+            directory holding the content of the volume
+
+        bandwidth, fileLatency: float
+            write speed in bytes per second and seconds per created file
+
+        timeGranularity: float
+            timestamps are truncated to this many seconds, 2 on FAT
+
+        capacity: int
+            bytes that fit on the volume
+
+        image: bool
+            back the volume by a loop mounted vfat image of `capacity` bytes, needs root
+        """
+        self.letter = letter.rstrip(':').upper()
+        self.root = root
+        self.bandwidth = bandwidth
+        self.fileLatency = fileLatency
+        self.timeGranularity = timeGranularity
+        self.capacity = capacity
+        self.image = image
+        self.fstype = fstype
+        self.present = False
+        self._imagePath = None
+
+    def partition(self):
+        return Partition(self.letter + ':\\', self.root, self.fstype, 'rw,removable', 255, 260)
+
+    def backend(self):
+        return VolumeBackend(self)
+
+    def insert(self):
+        os.makedirs(self.root, exist_ok=True)
+        if self.image and self._imagePath is None:
+            self._imagePath = self.root.rstrip(os.sep) + '.img'
+            with open(self._imagePath, 'wb') as f:
+                f.truncate(self.capacity or 256 * MB)
+            subprocess.check_call(['mkfs.vfat', '-F', '32', self._imagePath], stdout=subprocess.DEVNULL)
+            subprocess.check_call(['mount', '-o', 'loop', self._imagePath, self.root])
+        self.present = True
+
+    def remove(self):
+        self.present = False
+        if self._imagePath is not None:
+            subprocess.call(['umount', '-l', self.root])
+            os.remove(self._imagePath)
+            self._imagePath = None
+
+
+class DriveSimulator:
+    """ The machine's partition list with scripted insert and remove events
+
+    `partitions` has the signature of psutil.disk_partitions and is plugged into ExpressScan.
+    """
+
+    def __init__(self, volumes: list, timeline: list):
+        """
+        Parameters
+        ----------
+        volumes: list
+            VirtualVolume objects, all removed at the start
+
+        timeline: list
+            (seconds, 'insert' or 'remove', letter) tuples
+        """
+        self.volumes = {volume.letter: volume for volume in volumes}
+        self.timeline = sorted(timeline)
+        self.fixed = [Partition('C:\\', os.sep, 'NTFS', 'rw,fixed', 255, 260)]
+        self.events = []
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    def partitions(self, all=False):
+        with self._lock:
+            return self.fixed + [volume.partition() for volume in self.volumes.values() if volume.present]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._play, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _play(self):
+        start = time.monotonic()
+        for at, action, letter in self.timeline:
+            if self._stopEvent.wait(max(0, start + at - time.monotonic())):
+                return
+            volume = self.volumes[letter.rstrip(':').upper()]
+            with self._lock:
+                self.events.append((time.monotonic(), action, volume.letter))
+                if action == 'insert':
+                    volume.insert()
+                else:
+                    volume.remove()
+
+
+def parseTimeline(text):
+    timeline = []
+    for item in filter(None, text.split(',')):
+        at, action, letter = item.split(':')
+        timeline.append((float(at), action, letter))
+    return timeline
+
+
+def run(timeline, scale=0.02, videoScale=0.002, cycle=0.2, bandwidth=8 * MB, fileLatency=0.004, work=None,
+        metrics=False):
+    """ Scan the simulated drives with ExpressScan and sync every inserted one with the engine
+
+    Returns detection latency per insert and throughput per sync, with `metrics` also what a
+    scraper of the scanner's metrics endpoint saw at the end.
+    """
+    import ExpressScan
+
+    work = tempfile.mkdtemp(prefix='express-sim-', dir=work)
+    source = os.path.join(work, 'source')
+    TreeGenerator(scale=scale, videoScale=videoScale).generate(source)
+    letters = {letter.rstrip(':').upper() for at, action, letter in timeline}
+    volumes = [VirtualVolume(letter, os.path.join(work, 'drive-' + letter), bandwidth, fileLatency)
+               for letter in letters]
+    simulator = DriveSimulator(volumes, timeline)
+    results = []
+    syncs = []
+    reportPath = os.path.join(work, 'report.jsonl')
+    scanMetrics = ScanMetrics(reportPath) if metrics else None
+
+    def onInsert(letter):
+        detected = time.monotonic()
+        inserted = max((t for t, action, l in simulator.events if action == 'insert' and l + ':' == letter),
+                       default=detected)
+        volume = simulator.volumes[letter.rstrip(':')]
+        result = {'drive': letter, 'detectMs': round((detected - inserted) * 1000, 1)}
+        results.append(result)
+        # stands in for ExpressUsbService.logPopup
+        appendRecords([{'record': 'popup', 'drive': letter, 'time': time.time()}], reportPath)
+        thread = threading.Thread(target=sync, args=(volume, result))
+        thread.start()
+        syncs.append(thread)
+
+    def sync(volume, result):
+        engine = CopyEngine(16 * MB, backend=volume.backend())
+        start = time.perf_counter()
+        copied = errors = size = 0
+        for subject in SUBJECTS:
+            stats = engine.sync(os.path.join(source, subject), os.path.join(volume.root, 'source', subject))
+            copied += stats.copiedFiles
+            size += stats.copiedBytes
+            errors += len(stats.errors)
+        seconds = time.perf_counter() - start
+        result.update(files=copied, bytes=size, errors=errors, seconds=round(seconds, 3),
+                      filesPerSec=round(copied / seconds, 1), megabytesPerSec=round(size / MB / seconds, 2),
+                      removed=not volume.present)
+        appendRecords([{'record': 'run', 'drive': volume.letter + ':', 'engine': 'Express', 'state': 'done',
+                        'seconds': seconds, 'copiedFiles': copied, 'copiedBytes': size, 'errors': errors}],
+                      reportPath)
+
+    ExpressScan.partitionSource = simulator.partitions
+    stop = threading.Event()
+    scanner = threading.Thread(target=ExpressScan.scan, args=(cycle, onInsert, stop, scanMetrics), daemon=True)
+    server = MetricsServer(scanMetrics, 0).start() if metrics else None
+    simulator.start()
+    scanner.start()
+    time.sleep(max(at for at, action, letter in timeline) + cycle * 2)
+    for thread in syncs:
+        thread.join()
+    stop.set()
+    scanner.join()
+    simulator.stop()
+    if server is not None:
+        samples = scrape(server.port)
+        server.stop()
+        results.append({'metrics': {name + formatLabels(dict(labels)): value
+                                    for (name, labels), value in sorted(samples.items())}})
+    for volume in volumes:
+        volume.remove()
+    shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timeline', default='1:insert:E', help='comma separated seconds:insert|remove:letter')
+    parser.add_argument('--scale', type=float, default=0.02)
+    parser.add_argument('--video-scale', type=float, default=0.002)
+    parser.add_argument('--cycle', type=float, default=0.2, help='scan cycle in seconds')
+    parser.add_argument('--bandwidth', type=float, default=8, help='MB/s')
+    parser.add_argument('--file-latency', type=float, default=4, help='ms per file')
+    parser.add_argument('--work')
+    parser.add_argument('--metrics', action='store_true', help='scrape the metrics endpoint at the end')
+    args = parser.parse_args(argv)
+    results = run(parseTimeline(args.timeline), args.scale, args.video_scale, args.cycle,
+                  args.bandwidth * MB, args.file_latency / 1000, args.work, args.metrics)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
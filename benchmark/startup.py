@@ -0,0 +1,296 @@
+""" Startup cost of every Express entry point: imports, time to first paint and memory
+
+    python -m benchmark.startup --repeat 5
+    python -m benchmark.startup --update-baseline
+    python -m benchmark.startup --check --tolerance 0.25
+
+Every run starts a fresh interpreter with -X importtime in an empty working directory, so no lockfile, log or
+config of an installation is touched. Off Windows the win32 modules, winotify, msvcrt and pygetwindow are
+replaced by stubs and Qt draws offscreen. Background threads of the windows are not started, ExpressMain shows
+its window without syncing. Exit status 1 when --check finds an entry point slower or bigger than the baseline.
+
+The baseline keeps one section per sys.platform and --update-baseline only replaces the current one. --check
+passes with a notice when the baseline has no section for this platform, or no entry that could be measured
+here, so CI can run it before anyone recorded numbers on that machine.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'benchmark', 'startup-baseline.json')
+MARKER = 'EXPRESS_STARTUP'
+
+# name: (arguments, shows a window)
+ENTRIES = {
+    'ExpressUsbService': (['E:'], True),
+    'ExpressMain': (['E:'] + ['1'] * 11 + ['1', 'False', ''], True),
+    'ExpressSetting': ([], True),
+    'ExpressLauncher': ([], True),
+    'ExpressScan': ([], False),
+    'ExpressSync': ([], False),
+}
+
+# metric: absolute slack on top of the relative tolerance, so a few ms of noise is no regression
+METRICS = {'importMs': 10, 'readyMs': 20, 'rssMB': 4}
+
+STUBS = {
+    'win32api': '''
+def GetVolumeInformation(drive):
+    return 'EXPRESS', 0x1234ABCD, 255, 0, 'FAT32'
+''',
+    'win32file': '''
+def GetDiskFreeSpace(drive):
+    return 64, 512, 1000000, 2000000
+''',
+    'winotify': '''
+class audio:
+    Default = 'ms-winsoundevent:Notification.Default'
+
+
+class Notification:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def set_audio(self, *args, **kwargs):
+        pass
+
+    def add_actions(self, *args, **kwargs):
+        pass
+
+    def show(self):
+        pass
+''',
+    'pygetwindow': '''
+def getWindowsWithTitle(title):
+    return []
+''',
+}
+
+# subprocess takes an importable msvcrt for Windows, these stubs only join sys.path after it was imported
+LATE_STUBS = {
+    'msvcrt': '''
+LK_UNLCK, LK_LOCK, LK_NBLCK, LK_RLCK, LK_NBRLCK = range(5)
+
+
+def locking(fd, mode, nbytes):
+    pass
+
+
+def get_osfhandle(fd):
+    return fd
+''',
+}
+
+# runs in the child: the entry point as __main__, or only imported when it has no window
+BOOTSTRAP = r'''
+import os, sys, time, runpy, pkgutil
+t0 = float(os.environ['EXPRESS_STARTUP_T0'])
+path, window, timeout = sys.argv[1], sys.argv[2] == '1', int(sys.argv[3])
+sys.argv = [path] + sys.argv[4:]
+
+
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, AttributeError, ValueError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+
+def report(ready):
+    print(f'MARKER end ready={ready} rss={rss()}', file=sys.stderr, flush=True)
+
+
+if os.environ.get('EXPRESS_STARTUP_STUBS'):
+    import subprocess
+    sys.path.append(os.environ['EXPRESS_STARTUP_STUBS'])
+print('MARKER begin', file=sys.stderr, flush=True)
+if window:
+    from PySide6.QtCore import QObject, QEvent, QThread, QTimer
+    from PySide6.QtWidgets import QApplication
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint and obj.isWidgetType() and obj.isWindow():
+                QApplication.instance().removeEventFilter(self)
+                QTimer.singleShot(0, lambda: finish(time.time() - t0))
+            return False
+
+    def finish(ready):
+        report(ready)
+        QApplication.instance().quit()
+
+    def exec(app=None):
+        app = QApplication.instance()
+        app.installEventFilter(FirstPaint(app))
+        QTimer.singleShot(timeout, lambda: finish(-1))
+        return qtExec(app)
+
+    qtExec = QApplication.exec
+    QApplication.exec = exec
+    QThread.start = lambda self, *args, **kwargs: None
+    runpy.run_path(path, run_name='__main__')
+else:
+    runpy.run_path(path, run_name='__startup__')
+    report(time.time() - t0)
+'''.replace('MARKER', MARKER)
+
+
+def writeStubs(path, stubs=STUBS):
+    os.makedirs(path, exist_ok=True)
+    for name, source in stubs.items():
+        with open(os.path.join(path, name + '.py'), 'w', encoding='utf-8') as f:
+            f.write(source.lstrip())
+
+
+def parseImportTime(stderr: str):
+    """ (top level imports [(name, cumulative us)], all imports, marker values) between the begin and end marker """
+    imports = []
+    topLevel = []
+    values = None
+    started = False
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            fields = line.split()
+            if fields[1] == 'begin':
+                started = True
+            else:
+                values = dict(field.split('=') for field in fields[2:])
+                break
+        elif started and line.startswith('import time:') and '|' in line:
+            try:
+                selfTime, cumulative, name = line[len('import time:'):].split('|')
+                selfTime, cumulative = int(selfTime), int(cumulative)
+            except ValueError:
+                continue
+            imports.append((name.strip(), selfTime))
+            if len(name) - len(name.lstrip()) == 1:
+                topLevel.append((name.strip(), cumulative))
+    return topLevel, imports, values
+
+
+def runOnce(entry, workDir, stubs, timeout):
+    arguments, window = ENTRIES[entry]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, stubs, os.environ.get('PYTHONPATH')])))
+    env.pop('EXPRESS_PROFILE', None)
+    env.pop('EXPRESS_TRACE', None)
+    if sys.platform != 'win32':
+        env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    if stubs:
+        env['EXPRESS_STARTUP_STUBS'] = os.path.join(stubs, 'late')
+    env['EXPRESS_STARTUP_T0'] = repr(time.time())
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOTSTRAP, os.path.join(ROOT, entry + '.py'), '1' if window else '0',
+                              str(timeout)] + arguments, cwd=workDir, env=env, capture_output=True, text=True,
+                             encoding='utf-8', errors='replace', timeout=timeout / 1000 + 60)
+    topLevel, imports, values = parseImportTime(process.stderr)
+    if values is None:
+        lines = [line for line in process.stderr.splitlines()
+                 if line.strip() and not line.startswith(('import time:', MARKER))]
+        return {'error': lines[-1] if lines else f'exit status {process.returncode}'}
+    if float(values['ready']) < 0:
+        return {'error': f'no paint within {timeout} ms'}
+    return {'importMs': sum(cumulative for name, cumulative in topLevel) / 1000,
+            'readyMs': float(values['ready']) * 1000, 'rssMB': int(values['rss']) / 2 ** 20,
+            'modules': len(imports), 'topLevel': topLevel}
+
+
+def measure(entry, repeat=5, timeout=15000):
+    """ Median of `repeat` cold starts, the first run is dropped as it fills the bytecode cache """
+    workDir = tempfile.mkdtemp(prefix='express-startup-')
+    stubs = None
+    if sys.platform != 'win32':
+        stubs = os.path.join(workDir, 'stubs')
+        writeStubs(stubs)
+        writeStubs(os.path.join(stubs, 'late'), LATE_STUBS)
+    if os.path.isdir(os.path.join(ROOT, 'config')):
+        shutil.copytree(os.path.join(ROOT, 'config'), os.path.join(workDir, 'config'))
+    try:
+        runs = []
+        for i in range(repeat + 1):
+            run = runOnce(entry, workDir, stubs, timeout)
+            if 'error' in run:
+                return {'entry': entry, 'window': ENTRIES[entry][1], 'error': run['error']}
+            if i:
+                runs.append(run)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    result = {'entry': entry, 'window': ENTRIES[entry][1], 'runs': len(runs)}
+    for metric in METRICS:
+        result[metric] = round(statistics.median(run[metric] for run in runs), 1)
+    result['modules'] = runs[-1]['modules']
+    median = sorted(runs, key=lambda run: run['importMs'])[len(runs) // 2]
+    result['top'] = [[name, round(cumulative / 1000, 1)]
+                     for name, cumulative in sorted(median['topLevel'], key=lambda item: -item[1])[:10]]
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """ Regressions against the baseline, entries or metrics missing on either side are skipped """
+    regressions = []
+    for result in results:
+        old = baseline.get('entries', {}).get(result['entry'])
+        if not old or 'error' in result:
+            continue
+        for metric, slack in METRICS.items():
+            if metric in old and result[metric] > old[metric] * (1 + tolerance) + slack:
+                regressions.append({'entry': result['entry'], 'metric': metric, 'baseline': old[metric],
+                                    'value': result[metric]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', default=','.join(ENTRIES), help='comma separated entry points')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--timeout', type=int, default=15000, help='ms to wait for the first paint')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--check', action='store_true', help='exit with 1 on a regression against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative increase')
+    parser.add_argument('--out')
+    args = parser.parse_args(argv)
+
+    results = [measure(entry, args.repeat, args.timeout) for entry in args.entries.split(',') if entry]
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'entries': results}
+    status = 0
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+    except (OSError, ValueError):
+        baselines = {}
+    if args.check:
+        baseline = baselines.get(sys.platform, {})
+        if not any(result['entry'] in baseline.get('entries', {}) for result in results if 'error' not in result):
+            print(f'no {sys.platform} baseline for these entries in {args.baseline}, nothing to compare',
+                  file=sys.stderr)
+        report['regressions'] = compare(results, baseline, args.tolerance)
+        status = 1 if report['regressions'] else 0
+    if args.update_baseline:
+        baselines[sys.platform] = {'python': report['python'], 'platform': report['platform'],
+                                   'entries': {result['entry']: {metric: result[metric] for metric in METRICS}
+                                               for result in results if 'error' not in result}}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
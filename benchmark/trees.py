@@ -0,0 +1,96 @@
+import os
+import time
+import random
+from engine import MB
+
+DAY = 86400
+
+SUBJECTS = ['语文', '数学', '英语', '物理', '化学', '生物', '政治', '历史', '地理', '技术', '资料']
+
+# kind -> (files per subject, smallest size, largest size, extensions)
+PROFILE = {
+    'office': (400, 16 * 1024, 2 * MB, ['.docx', '.pptx', '.xlsx', '.doc', '.ppt']),
+    'pdf': (40, 2 * MB, 40 * MB, ['.pdf']),
+    'video': (2, 1024 * MB, 3 * 1024 * MB, ['.mp4']),
+}
+
+
+class TreeGenerator:
+    """ Reproducible source trees shaped like the 11 subject folders of a classroom PC
+
+    `scale` multiplies the number of office files and PDFs, `videoScale` the size of the videos,
+    so the same shape can be used from a quick CI run up to the real multi-GB case.
+    """
+
+    def __init__(self, seed: int = 1, scale: float = 1.0, videoScale: float = 1.0):
+        self.seed = seed
+        self.scale = scale
+        self.videoScale = videoScale
+        self._pool = random.Random(seed).randbytes(4 * MB)
+
+    def generate(self, root: str, now: float = None):
+        """ Write the tree under `root` and return (files, bytes) """
+        rng = random.Random(self.seed)
+        now = now or time.time()
+        files = total = 0
+        for subject in SUBJECTS:
+            for kind, (count, low, high, extensions) in PROFILE.items():
+                if kind == 'video':
+                    low, high = int(low * self.videoScale), int(high * self.videoScale)
+                else:
+                    count = max(1, round(count * self.scale))
+                for i in range(count):
+                    folder = os.path.join(root, subject, kind, f'第{i % 20 + 1}周' if kind == 'office' else '')
+                    path = os.path.join(folder, f'{kind}{i:04d}{rng.choice(extensions)}')
+                    size = int(rng.uniform(low, high))
+                    # documents were created during the last term
+                    self._write(path, size, rng, now - rng.uniform(0, 120) * DAY)
+                    files += 1
+                    total += size
+        return files, total
+
+    def mutate(self, root: str, fraction: float = 0.05, now: float = None):
+        """ Edit, add and delete a fraction of the office files, as a week of teaching does """
+        rng = random.Random(self.seed + 1)
+        now = now or time.time()
+        changed = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if not name.startswith('office') or rng.random() >= fraction:
+                    continue
+                path = os.path.join(dirpath, name)
+                action = rng.random()
+                if action < 0.6:
+                    self._write(path, os.path.getsize(path) + rng.randint(1, 64 * 1024), rng, now)
+                elif action < 0.8:
+                    self._write(os.path.join(dirpath, 'new-' + name), rng.randint(16 * 1024, MB), rng, now)
+                else:
+                    os.remove(path)
+                changed.append(path)
+        return changed
+
+    def remove(self, root: str, fraction: float = 0.1):
+        """ Delete files from the source so a mirror sync has to delete them on the target """
+        rng = random.Random(self.seed + 2)
+        removed = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if rng.random() < fraction:
+                    os.remove(os.path.join(dirpath, name))
+                    removed.append(name)
+        return removed
+
+    def _write(self, path, size, rng, mtime):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            # a unique head keeps files distinct, the body comes from a shared pool to stay fast
+            f.write(rng.randbytes(min(size, 4096)))
+            remaining = size - min(size, 4096)
+            while remaining:
+                offset = rng.randrange(len(self._pool) // 2)
+                n = min(remaining, len(self._pool) - offset)
+                f.write(self._pool[offset:offset + n])
+                remaining -= n
+        os.utime(path, (mtime, mtime))
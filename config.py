@@ -1,15 +1,6 @@
-from enum import Enum
 from qfluentwidgets import qconfig, QConfig, ConfigItem, OptionsConfigItem, BoolValidator, OptionsValidator, \
     FolderValidator, RangeConfigItem, RangeValidator, EnumSerializer
-
-
-class BufSize(Enum):
-    _32 = "32 MB"
-    _64 = "64 MB"
-    _128 = "128 MB"
-    _256 = "256 MB"
-    _512 = "512 MB"
-    _1024 = "1 GB"
+from settings import BufSize
 
 
 class Config(QConfig):
@@ -17,6 +8,7 @@ class Config(QConfig):
     Notify = ConfigItem("MainWindow", "Notify", False, BoolValidator())
     IsSourceCloud = OptionsConfigItem("MainWindow", "IsSourceCloud", True, BoolValidator())
 
+    PackedSubjects = ConfigItem("Folders", "PackedSubjects", [])
     sourceFolder = ConfigItem("Folders", "SourceFolder", "", FolderValidator())
     yuwenFolder = ConfigItem("Folders", "Yuwen", "", FolderValidator())
     shuxueFolder = ConfigItem("Folders", "Shuxue", "", FolderValidator())
@@ -33,6 +25,22 @@ class Config(QConfig):
     ScanCycle = RangeConfigItem("MainWindow", "ScanCycle", 10, RangeValidator(1, 50))
     ConcurrentProcess = ConfigItem("MainWindow", "ConcurrentProcess", 3, RangeValidator(1, 5))
     BufSize = OptionsConfigItem("MainWindow", "BufSize", BufSize._256, OptionsValidator(BufSize), EnumSerializer(BufSize))
+    AutoTune = ConfigItem("MainWindow", "AutoTune", True, BoolValidator())
+    CopyEngine = OptionsConfigItem("MainWindow", "CopyEngine", "FastCopy", OptionsValidator(["FastCopy", "Express"]))
+    ContentCheck = ConfigItem("MainWindow", "ContentCheck", False, BoolValidator())
+    FingerprintMode = OptionsConfigItem("MainWindow", "FingerprintMode", "full", OptionsValidator(["full", "sampled"]))
+    FingerprintSamples = RangeConfigItem("MainWindow", "FingerprintSamples", 8, RangeValidator(1, 64))
+    FingerprintEscalate = ConfigItem("MainWindow", "FingerprintEscalate", False, BoolValidator())
+    Verify = OptionsConfigItem("MainWindow", "Verify", "off", OptionsValidator(["off", "full", "sampled"]))
+    VerifyDirect = ConfigItem("MainWindow", "VerifyDirect", True, BoolValidator())
+    LowIoRate = RangeConfigItem("MainWindow", "LowIoRate", 20, RangeValidator(1, 200))
+    LowIoIops = RangeConfigItem("MainWindow", "LowIoIops", 200, RangeValidator(10, 5000))
+    SmallFileSize = RangeConfigItem("MainWindow", "SmallFileSize", 1024, RangeValidator(64, 8192))
+    Trace = ConfigItem("MainWindow", "Trace", False, BoolValidator())
+    Metrics = OptionsConfigItem("MainWindow", "Metrics", "off", OptionsValidator(["off", "http", "file"]))
+    MetricsPort = RangeConfigItem("MainWindow", "MetricsPort", 9477, RangeValidator(1024, 65535))
+    LogMaxSize = RangeConfigItem("Storage", "LogMaxSize", 64, RangeValidator(8, 1024))
+    LogKeepDays = RangeConfigItem("Storage", "LogKeepDays", 180, RangeValidator(7, 3650))
     dpiScale = OptionsConfigItem("MainWindow", "DpiScale", "Auto", OptionsValidator([1, 1.25, 1.5, 1.75, 2, "Auto"]), restart=True)
 
 
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+from settings import BufSize
+
+try:
+    from win32api import GetVolumeInformation
+except ImportError:
+    GetVolumeInformation = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+# next to the settings, 清除缓存 empties ./Log and what was learned about the drives should survive it
+PROFILES_PATH = './config/DriveProfiles.json'
+# what a drive is known for, the speed test measures all of them and later syncs refine them
+RATES = ['largeMBps', 'smallFilesPerSec', 'readMBps', 'deleteFilesPerSec']
+MB = 1024 * 1024
+# weight of the newest run in the delete rate and the work of a subject
+ALPHA = 0.3
+# the two copy rates come from one fit over the runs, which needs a longer memory to tell them apart
+FIT_ALPHA = 0.1
+# what a drive nothing is known about is expected to do, a cheap USB 2.0 stick
+DEFAULT_RATES = {'largeMBps': 15.0, 'smallFilesPerSec': 40.0, 'deleteFilesPerSec': 300.0}
+# shorter jobs say more about startup costs than about the drive
+MIN_SECONDS = 2.0
+# the speed test or the defaults weigh as much as one run of this many MB and files
+PRIOR_MB = 10
+PRIOR_FILES = 10
+# below either a drive is a slow stick that wants one process at a time
+SLOW_MBPS = 20
+SLOW_FILES_PER_SEC = 50
+
+
+def removableDrives():
+    """ Letters of the removable drives, the same test ExpressScan uses to find sticks """
+    try:
+        import psutil
+    except ImportError:
+        return []
+    drives = []
+    for partition in psutil.disk_partitions():
+        if 'removable' in partition.opts:
+            drives.append(partition.device.rstrip('\\/'))
+    return drives
+
+
+def volumeInformation(drive):
+    """ (serial, file system) of the drive, (None, None) if unknown """
+    try:
+        volume = GetVolumeInformation(drive)
+        return volume[1], volume[4]
+    except:
+        return None, None
+
+
+class FileLock:
+    """ Exclusive lock of a file, held by one process and one thread at a time """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'w')
+        try:
+            if msvcrt is not None:
+                # retries for about ten seconds before it gives up with OSError
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        except OSError:
+            self.file.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if msvcrt is not None:
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+
+
+class DriveProfiles:
+    """ Performance of every drive seen so far, keyed by volume serial so a stick is recognized on any letter
+
+    The ExpressMain of every drive and the sync service update the same file, so every change re-reads
+    it under a lock and writes it back before the lock is released.
+    """
+
+    def __init__(self, path: str = PROFILES_PATH):
+        self.path = path
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.drives = json.load(f)
+        except (OSError, ValueError):
+            self.drives = {}
+
+    def get(self, serial):
+        return self.drives.get(str(serial)) if serial is not None else None
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temp = f'{self.path}.{os.getpid()}'
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(self.drives, f, ensure_ascii=False, indent=1)
+            os.replace(temp, self.path)
+        except OSError:
+            pass
+
+    def update(self, serial, change):
+        """ Apply `change(profile)` to the drive's profile as it is on disk now, returns the profile """
+        if serial is None:
+            return None
+        try:
+            with FileLock(self.path + '.lock'):
+                self.load()
+                profile = self.drives.setdefault(str(serial), {'serial': serial})
+                change(profile)
+                self.save()
+        except OSError:
+            return None
+        return profile
+
+    def recordSpeedTest(self, serial, drive: str, fileSystem: str, result: dict):
+        """ Take the rates of a speed test as the drive's profile, replacing what earlier syncs learned """
+        return self.update(serial, lambda profile: self._recordSpeedTest(profile, drive, fileSystem, result))
+
+    @staticmethod
+    def _recordSpeedTest(profile, drive, fileSystem, result):
+        profile.update({'drive': drive, 'fileSystem': fileSystem, 'updated': time.time(),
+                        'speedTest': dict(result, time=time.time())})
+        profile.pop('fit', None)
+        for rate in RATES:
+            if result.get(rate):
+                profile[rate] = result[rate]
+
+    def learn(self, run: dict, subjects):
+        """ Fold the subjects of a finished run into the drive's rates
+
+        A copy is modelled as MB / largeMBps + files / smallFilesPerSec. Every subject adds one such
+        equation, exponentially weighted least squares over them separates the two rates: a run of a few
+        videos says much about largeMBps, a run of many documents about smallFilesPerSec. The speed test,
+        or the defaults, count as one run of PRIOR_MB and PRIOR_FILES. The files and bytes each subject
+        copied are kept too, they predict the next run.
+        """
+        return self.update(run.get('serial'), lambda profile: self._learn(profile, run, subjects))
+
+    def _learn(self, profile, run, subjects):
+        for subject in subjects:
+            if subject.get('state') != 'ok':
+                continue
+            elapsed = subject.get('seconds') or 0
+            seconds = subject.get('copyTime') or elapsed
+            if subject['subject'] == 'delete':
+                if seconds >= MIN_SECONDS and subject.get('deletedFiles'):
+                    observed = subject['deletedFiles'] / seconds
+                    old = profile.get('deleteFilesPerSec')
+                    profile['deleteFilesPerSec'] = round(old + ALPHA * (observed - old) if old else observed, 1)
+                continue
+            work = profile.setdefault('subjects', {}).setdefault(workKey(subject['subject'], run.get('mode')), {})
+            for key, value in (('files', subject.get('copiedFiles', 0)), ('bytes', subject.get('copiedBytes', 0)),
+                               ('overhead', max(0.0, elapsed - seconds))):
+                work[key] = round(work[key] + ALPHA * (value - work[key]), 3) if key in work else value
+            if seconds < MIN_SECONDS or not subject.get('copiedFiles'):
+                continue
+            megabytes, files = subject['copiedBytes'] / MB, subject['copiedFiles']
+            fit = profile.setdefault('fit', {'xx': [0.0, 0.0, 0.0], 'xy': [0.0, 0.0]})
+            fit['xx'] = [(1 - FIT_ALPHA) * old + FIT_ALPHA * new for old, new in
+                         zip(fit['xx'], (megabytes * megabytes, megabytes * files, files * files))]
+            fit['xy'] = [(1 - FIT_ALPHA) * old + FIT_ALPHA * new for old, new in
+                         zip(fit['xy'], (megabytes * seconds, files * seconds))]
+            self._solve(profile)
+        profile.update({'drive': run.get('drive'), 'fileSystem': run.get('fileSystem'), 'updated': time.time(),
+                        'runs': profile.get('runs', 0) + 1})
+
+    @staticmethod
+    def _solve(profile):
+        prior = profile.get('speedTest')
+        a, b, c = profile['fit']['xx']
+        p, q = profile['fit']['xy']
+        a += PRIOR_MB * PRIOR_MB
+        p += PRIOR_MB * PRIOR_MB / rateOf(prior, 'largeMBps')
+        c += PRIOR_FILES * PRIOR_FILES
+        q += PRIOR_FILES * PRIOR_FILES / rateOf(prior, 'smallFilesPerSec')
+        determinant = a * c - b * b
+        secondsPerMB, secondsPerFile = (c * p - b * q) / determinant, (a * q - b * p) / determinant
+        # a negative cost is noise of runs that all looked alike, the rate stays what it was
+        if secondsPerMB > 0:
+            profile['largeMBps'] = round(1 / secondsPerMB, 2)
+        if secondsPerFile > 0:
+            profile['smallFilesPerSec'] = round(1 / secondsPerFile, 1)
+
+
+def learnRun(run: dict, subjects, path: str = PROFILES_PATH):
+    """ Update the profile of the run's drive once its report is written """
+    return DriveProfiles(path).learn(run, list(subjects))
+
+
+def workKey(subject: str, mode):
+    # copying recent files moves far less than a sync of the same subject
+    return subject if mode in (1, 2, None) else f'{subject}/{mode}'
+
+
+def rateOf(profile, rate):
+    return (profile or {}).get(rate) or DEFAULT_RATES[rate]
+
+
+def splitSeconds(profile, bytes, files):
+    """ (seconds for the bytes, seconds for the files) of a copy to the drive """
+    return bytes / MB / rateOf(profile, 'largeMBps'), files / rateOf(profile, 'smallFilesPerSec')
+
+
+def estimateSeconds(profile, files=0, bytes=0, deletes=0, overhead=0.0):
+    return sum(splitSeconds(profile, bytes, files)) + deletes / rateOf(profile, 'deleteFilesPerSec') + overhead
+
+
+class Eta:
+    """ Seconds left of a run, predicted from the drive's profile before anything was copied
+
+    Jobs that have not started count with their prediction, the running ones with what is left of it.
+    Once a running job has reported progress for a while the rate it actually reaches takes over.
+    """
+
+    def __init__(self, profile, work: list):
+        """
+        Parameters
+        ----------
+        profile: dict
+            the drive's entry of DriveProfiles, None for a drive seen the first time
+
+        work: list
+            (job name, files, bytes, deletes, overhead seconds) of every job, see jobs.plannedWork
+        """
+        self.predicted = {name: estimateSeconds(profile, files, bytes, deletes, overhead)
+                          for name, files, bytes, deletes, overhead in work}
+        # without analyzer statistics or earlier runs there is nothing to predict from
+        self.known = any(self.predicted.values())
+        self.running = {}
+        self.finished = set()
+
+    def update(self, event):
+        if event['type'] == 'start':
+            self.running[event['job']] = {'name': event['name'], 'start': event['time'], 'first': None}
+        elif event['type'] == 'progress' and event['job'] in self.running and event['total']:
+            job = self.running[event['job']]
+            job.update(done=event['done'], total=event['total'], time=event['time'])
+            if job['first'] is None:
+                job['first'] = (event['time'], event['done'])
+        elif event['type'] == 'done':
+            self.running.pop(event['job'], None)
+            self.finished.add(event['name'])
+        elif event['type'] == 'finished':
+            self.running.clear()
+
+    def remaining(self, now: float = None):
+        now = now or time.time()
+        names = {job['name'] for job in self.running.values()}
+        seconds = sum(value for name, value in self.predicted.items() if name not in self.finished | names)
+        for job in self.running.values():
+            first = job['first']
+            if first and job['time'] - first[0] >= MIN_SECONDS and job['done'] > first[1]:
+                rate = (job['done'] - first[1]) / (job['time'] - first[0])
+                seconds += max(0.0, (job['total'] - job['done']) / rate - (now - job['time']))
+            else:
+                seconds += max(0.0, self.predicted.get(job['name'], 0.0) - (now - job['start']))
+        return seconds
+
+
+def strategy(profile):
+    """ Settings a sync of the drive runs with when AutoTune is on, None while nothing is known about it """
+    if not profile or not profile.get('largeMBps'):
+        return None
+    values = recommend(profile)
+    # many small files on a slow stick is what the built-in engine was written for
+    if rateOf(profile, 'largeMBps') < SLOW_MBPS or rateOf(profile, 'smallFilesPerSec') < SLOW_FILES_PER_SEC:
+        values['copyEngine'] = 'Express'
+    return values
+
+
+def recommend(result: dict):
+    """ BufSize and ConcurrentProcess for a drive with these rates
+
+    Slow sticks lose throughput when several fcp.exe write at once, because the writes stop being
+    sequential, and gain nothing from a large buffer. Fast drives need both to stay busy.
+    """
+    largeMBps = rateOf(result, 'largeMBps')
+    smallFilesPerSec = rateOf(result, 'smallFilesPerSec')
+    if largeMBps < SLOW_MBPS or smallFilesPerSec < SLOW_FILES_PER_SEC:
+        return {'bufSize': BufSize._64, 'concurrentProcess': 1}
+    if largeMBps < 80:
+        return {'bufSize': BufSize._128, 'concurrentProcess': 2}
+    if largeMBps < 200:
+        return {'bufSize': BufSize._256, 'concurrentProcess': 3}
+    if largeMBps < 300 or smallFilesPerSec < 500:
+        return {'bufSize': BufSize._512, 'concurrentProcess': 4}
+    # portable SSDs keep up with every process that can be started
+    return {'bufSize': BufSize._1024, 'concurrentProcess': 5}
@@ -0,0 +1,805 @@
+import os
+import sys
+import mmap
+import json
+import stat
+import time
+import errno
+import hashlib
+import threading
+from tracing import tracer
+from datetime import datetime, timedelta
+
+MB = 1024 * 1024
+FAT_TIME_TOLERANCE = 2
+SAMPLE_BLOCK = 64 * 1024
+# files copied but still waiting for their timestamp are redone when the drive is pulled
+PENDING_TIMES_BYTES = 16 * 1024 * 1024
+O_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+def parseFilterOption(commandOption: str):
+    """ Translate the fcp /from_date and /to_date options into (fromDate, toDate) timestamps """
+    fromDate, toDate = None, None
+    for option in commandOption.split():
+        if '=' not in option:
+            continue
+        key, value = option.split('=', 1)
+        if key == '/from_date':
+            if value.startswith('-') and value.endswith('D'):
+                fromDate = time.time() - int(value[1:-1]) * 86400
+            else:
+                fromDate = datetime.strptime(value, '%Y%m%d').timestamp()
+        elif key == '/to_date':
+            toDate = (datetime.strptime(value, '%Y%m%d') + timedelta(days=1)).timestamp()
+    return fromDate, toDate
+
+
+def preallocate(fd: int, size: int):
+    """ Reserve clusters for a file without moving its end of file """
+    if size <= 0:
+        return
+    try:
+        if sys.platform == 'win32':
+            import msvcrt
+            from ctypes import windll, c_int, c_longlong, c_uint32, c_void_p, byref, sizeof
+            setInformation = windll.kernel32.SetFileInformationByHandle
+            setInformation.restype = c_int
+            setInformation.argtypes = [c_void_p, c_int, c_void_p, c_uint32]
+            allocationSize = c_longlong(size)
+            # FileAllocationInfo = 5
+            setInformation(msvcrt.get_osfhandle(fd), 5, byref(allocationSize), sizeof(allocationSize))
+        elif hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+    except OSError:
+        pass
+
+
+class LocalBackend:
+    """ Destination side file operations of the engine
+
+    Everything that modifies the destination goes through here, so a slow USB stick or a
+    failing drive can be imitated by overriding single methods, see benchmark/.
+    """
+
+    def open(self, path):
+        return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o666)
+
+    def write(self, fd, data):
+        return os.write(fd, data)
+
+    def close(self, fd):
+        os.close(fd)
+
+    def fsync(self, fd):
+        os.fsync(fd)
+
+    def preallocate(self, fd, size):
+        preallocate(fd, size)
+
+    def makedirs(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def rmdir(self, path):
+        os.rmdir(path)
+
+    def chmod(self, path, mode):
+        os.chmod(path, mode)
+
+    def utime(self, path, mtime):
+        os.utime(path, (mtime, mtime))
+
+
+def scanTree(root: str):
+    """ Walk a tree with os.scandir
+
+    Returns
+    -------
+    files: dict
+        relative path -> (size, mtime, mode)
+
+    dirs: set
+        relative paths of all sub directories
+    """
+    files, dirs = {}, set()
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel))
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                relPath = os.path.join(rel, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.add(relPath)
+                        stack.append(relPath)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        files[relPath] = (st.st_size, st.st_mtime, st.st_mode)
+                except OSError:
+                    pass
+    return files, dirs
+
+
+def newHasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def fullDigest(hasher):
+    return 'f:' + hasher.hexdigest()
+
+
+def fileDigest(path: str, bufSize: int = 4 * MB):
+    hasher = newHasher()
+    buffer = bytearray(bufSize)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return fullDigest(hasher)
+
+
+def sameContent(pathA: str, pathB: str, bufSize: int = 4 * MB):
+    """ Streamed compare that stops at the first differing block
+
+    Returns the common full digest when both files are identical, otherwise None
+    """
+    hasher = newHasher()
+    with open(pathA, 'rb') as a, open(pathB, 'rb') as b:
+        while True:
+            chunkA, chunkB = a.read(bufSize), b.read(bufSize)
+            if chunkA != chunkB:
+                return None
+            if not chunkA:
+                return fullDigest(hasher)
+            hasher.update(chunkA)
+
+
+def fingerprintKind(size: int, mode: str = 'full', samples: int = 8, blockSize: int = SAMPLE_BLOCK):
+    """ Digest prefix used for a file: 'f' for a full hash, 's<N>' for N sampled blocks """
+    if mode != 'sampled' or size <= (samples + 2) * blockSize:
+        return 'f'
+    return f's{samples}'
+
+
+def sampleOffsets(size: int, samples: int, blockSize: int = SAMPLE_BLOCK):
+    """ Head, tail and `samples` evenly spaced blocks """
+    last = size - blockSize
+    step = last / (samples + 1)
+    return [0] + [int(step * (i + 1)) for i in range(samples)] + [last]
+
+
+def sampledDigest(path: str, size: int, samples: int = 8, blockSize: int = SAMPLE_BLOCK, buffer: bytearray = None):
+    """ Fingerprint of the size plus a fixed set of sampled blocks
+
+    A match means "very likely unchanged"; files too small to sample get a full digest
+    """
+    kind = fingerprintKind(size, 'sampled', samples, blockSize)
+    if kind == 'f':
+        return fileDigest(path, max(blockSize, 4096))
+    if buffer is None or len(buffer) < blockSize:
+        buffer = bytearray(blockSize)
+    view = memoryview(buffer)[:blockSize]
+    hasher = newHasher()
+    hasher.update(size.to_bytes(8, 'little'))
+    with open(path, 'rb', buffering=0) as f:
+        for offset in sampleOffsets(size, samples, blockSize):
+            f.seek(offset)
+            n = f.readinto(view)
+            hasher.update(view[:n])
+    return kind + ':' + hasher.hexdigest()
+
+
+def sampledBytesDigest(data, samples: int = 8, blockSize: int = SAMPLE_BLOCK):
+    """ sampledDigest of data already in memory """
+    size = len(data)
+    hasher = newHasher()
+    kind = fingerprintKind(size, 'sampled', samples, blockSize)
+    if kind == 'f':
+        hasher.update(data)
+        return fullDigest(hasher)
+    hasher.update(size.to_bytes(8, 'little'))
+    view = memoryview(data)
+    for offset in sampleOffsets(size, samples, blockSize):
+        hasher.update(view[offset:offset + blockSize])
+    return kind + ':' + hasher.hexdigest()
+
+
+def _openDirectWin32(path):
+    from ctypes import windll, c_void_p, c_wchar_p, c_uint32
+    createFile = windll.kernel32.CreateFileW
+    createFile.restype = c_void_p
+    createFile.argtypes = [c_wchar_p, c_uint32, c_uint32, c_void_p, c_uint32, c_uint32, c_void_p]
+    # GENERIC_READ, FILE_SHARE_READ | FILE_SHARE_WRITE, OPEN_EXISTING, FILE_FLAG_NO_BUFFERING
+    handle = createFile(path, 0x80000000, 3, None, 3, 0x20000000, None)
+    if handle is None or handle == c_void_p(-1).value:
+        raise OSError(errno.EINVAL, 'CreateFile failed', path)
+    return handle
+
+
+def readChunks(path: str, blockSize: int = MB, direct: bool = False):
+    """ Yield the content of `path` in blocks
+
+    With `direct` the OS cache is bypassed where supported (O_DIRECT, FILE_FLAG_NO_BUFFERING),
+    so the data comes from the device instead of the pages that were just written.
+    """
+    blockSize = -(-blockSize // mmap.PAGESIZE) * mmap.PAGESIZE
+    buffer = mmap.mmap(-1, blockSize)  # page aligned, as unbuffered I/O requires
+    view = memoryview(buffer)
+    if direct and hasattr(os, 'O_DIRECT'):
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+        except OSError:
+            fd = os.open(path, os.O_RDONLY | O_BINARY)
+        try:
+            while True:
+                n = os.readv(fd, [buffer])
+                if not n:
+                    break
+                yield view[:n]
+        finally:
+            os.close(fd)
+        return
+    if direct and sys.platform == 'win32':
+        from ctypes import windll, c_char, c_int, c_uint32, c_void_p, POINTER, byref, addressof
+        readFile = windll.kernel32.ReadFile
+        readFile.restype = c_int
+        readFile.argtypes = [c_void_p, c_void_p, c_uint32, POINTER(c_uint32), c_void_p]
+        closeHandle = windll.kernel32.CloseHandle
+        closeHandle.restype = c_int
+        closeHandle.argtypes = [c_void_p]
+        try:
+            handle = _openDirectWin32(path)
+        except OSError:
+            handle = None
+        if handle is not None:
+            address = addressof(c_char.from_buffer(buffer))
+            read = c_uint32(0)
+            try:
+                while True:
+                    if not readFile(handle, address, blockSize, byref(read), None):
+                        raise OSError(errno.EIO, 'ReadFile failed', path)
+                    if not read.value:
+                        break
+                    yield view[:read.value]
+            finally:
+                closeHandle(handle)
+            return
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            yield view[:n]
+
+
+class SyncCancelled(Exception):
+    pass
+
+
+class HashIndex:
+    """ Persistent path -> (size, mtime, digest) map
+
+    Used as the source hash cache in ./Log and as the per-subject index on the drive
+    """
+
+    def __init__(self, path: str = None, tolerance: float = 0.001):
+        self.path = path
+        self.tolerance = tolerance
+        self.entries = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, key: str, size: int, mtime: float):
+        entry = self.entries.get(key)
+        if entry and entry[0] == size and abs(entry[1] - mtime) <= self.tolerance:
+            return entry[2]
+        return None
+
+    def put(self, key: str, size: int, mtime: float, digest: str):
+        self.entries[key] = [size, mtime, digest]
+        self._dirty = True
+
+    def discard(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            self._dirty = True
+
+    def retain(self, folder: str, keys):
+        """ Drop the entries below `folder` that are not in `keys`, files deleted or renamed since """
+        prefix = os.path.join(folder, '')
+        stale = [key for key in self.entries if key.startswith(prefix) and key not in keys]
+        for key in stale:
+            del self.entries[key]
+        self._dirty = self._dirty or bool(stale)
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(self.path + '.tmp', self.path)
+            self._dirty = False
+        except OSError:
+            pass
+
+
+class SyncPlan:
+    def __init__(self):
+        self.copy = []
+        self.skip = []
+        self.delete = []
+        self.deleteDirs = []
+
+    def copyBytes(self):
+        return sum(item[1] for item in self.copy)
+
+
+def planSync(srcFiles, dstFiles, dstDirs=(), srcDirs=(), delete=True, fromDate=None, toDate=None):
+    """ Compare two scanned trees the way fcp /cmd=sync does: by size and date """
+    plan = SyncPlan()
+    for rel, (size, mtime, mode) in srcFiles.items():
+        if fromDate is not None and mtime < fromDate:
+            continue
+        if toDate is not None and mtime >= toDate:
+            continue
+        dst = dstFiles.get(rel)
+        if dst is None or dst[0] != size or abs(dst[1] - mtime) > FAT_TIME_TOLERANCE:
+            plan.copy.append((rel, size, mtime, mode))
+        else:
+            plan.skip.append((rel, size, mtime, mode))
+
+    # date filtered copies never mirror deletions
+    if delete and fromDate is None and toDate is None:
+        for rel, (size, mtime, mode) in dstFiles.items():
+            if rel not in srcFiles:
+                plan.delete.append((rel, size, mtime, mode))
+        srcDirs = set(srcDirs)
+        plan.deleteDirs = sorted((d for d in dstDirs if d not in srcDirs), key=len, reverse=True)
+    return plan
+
+
+class SyncStats:
+    def __init__(self):
+        self.plannedFiles = 0
+        self.plannedBytes = 0
+        self.copiedFiles = 0
+        self.copiedBytes = 0
+        self.skippedFiles = 0
+        self.skippedBytes = 0
+        self.deletedFiles = 0
+        self.deletedBytes = 0
+        self.smallFiles = 0
+        self.touchedFiles = 0
+        self.cancelled = False
+        self.destLost = False
+        self.verifiedFiles = 0
+        self.verifiedBytes = 0
+        self.verifyFailures = 0
+        self.scanTime = 0.0
+        self.planTime = 0.0
+        self.checkTime = 0.0
+        self.copyTime = 0.0
+        self.verifyTime = 0.0
+        self.errors = []
+
+    def filesPerSec(self):
+        return self.copiedFiles / self.copyTime if self.copyTime else 0.0
+
+    def megabytesPerSec(self):
+        return self.copiedBytes / MB / self.copyTime if self.copyTime else 0.0
+
+    def verifyMegabytesPerSec(self):
+        return self.verifiedBytes / MB / self.verifyTime if self.verifyTime else 0.0
+
+    def toDict(self):
+        result = dict(self.__dict__)
+        result['filesPerSec'] = round(self.filesPerSec(), 1)
+        result['megabytesPerSec'] = round(self.megabytesPerSec(), 2)
+        result['verifyMegabytesPerSec'] = round(self.verifyMegabytesPerSec(), 2)
+        return result
+
+
+class CopyEngine:
+    """ In-process copy engine, an alternative to fcp.exe tuned for slow FAT flash drives """
+
+    def __init__(self, bufSize: int = 256 * MB, smallFileSize: int = MB, hashCache: HashIndex = None,
+                 fingerprintMode: str = 'full', samples: int = 8, escalate: bool = False,
+                 verify: str = 'off', verifyDirect: bool = True, retries: int = 2, throttle=None,
+                 backend: LocalBackend = None):
+        """
+        Parameters
+        ----------
+        bufSize: int
+            size of the streaming buffer for large files
+
+        smallFileSize: int
+            files up to this size take the small-file path
+
+        hashCache: HashIndex
+            source digest cache, enables the content check for files whose only change is the date
+
+        fingerprintMode: str
+            'full' hashes whole files, 'sampled' only the size, head, tail and `samples` blocks
+
+        escalate: bool
+            confirm a sampled match with a full compare before skipping the file
+
+        verify: str
+            'off', 'full' re-reads the whole destination, 'sampled' only its sampled blocks
+
+        verifyDirect: bool
+            re-read the destination bypassing the OS cache
+
+        retries: int
+            how often a file failing verification is copied again
+
+        throttle: TokenBucket
+            rate limiter for the low impact mode, see throttle.py
+
+        backend: LocalBackend
+            destination file operations, LocalBackend when None
+        """
+        self.bufSize = bufSize
+        self.smallFileSize = smallFileSize
+        self.hashCache = hashCache
+        self.fingerprintMode = fingerprintMode
+        self.samples = samples
+        self.escalate = escalate
+        self.verify = verify
+        self.verifyDirect = verifyDirect
+        self.retries = retries
+        self.throttle = throttle
+        self.backend = backend or LocalBackend()
+        self._cancelEvent = threading.Event()
+        self.destIndex = None
+        self._buffer = None
+        self._sampleBuffer = bytearray(SAMPLE_BLOCK)
+        self._madeDirs = set()
+        self._pendingTimes = []
+        self._pendingBytes = 0
+        self._partial = None
+
+    def sync(self, source: str, dest: str, delete=True, fromDate=None, toDate=None, progress=None, indexPath=None):
+        """ Make `dest` a copy of `source`
+
+        Parameters
+        ----------
+        progress: callable
+            called as progress(doneBytes, totalBytes, relPath) after every file
+
+        indexPath: str
+            digest index of `dest`, kept outside the synced tree
+        """
+        stats = SyncStats()
+        start = time.perf_counter()
+        with tracer.span('scan', source=source, dest=dest):
+            srcFiles, srcDirs = scanTree(source)
+            dstFiles, dstDirs = scanTree(dest)
+        stats.scanTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with tracer.span('plan'):
+            plan = planSync(srcFiles, dstFiles, dstDirs, srcDirs, delete, fromDate, toDate)
+        stats.planTime = time.perf_counter() - start
+        self.destIndex = HashIndex(indexPath, FAT_TIME_TOLERANCE) if indexPath else None
+        if self.hashCache is not None:
+            start = time.perf_counter()
+            self._skipIdentical(source, dest, plan, dstFiles, stats)
+            stats.checkTime = time.perf_counter() - start
+        stats.plannedFiles = len(plan.copy)
+        stats.plannedBytes = plan.copyBytes()
+        stats.skippedFiles = len(plan.skip)
+        stats.skippedBytes = sum(item[1] for item in plan.skip)
+        tracer.instant('plan ready', copy=stats.plannedFiles, bytes=stats.plannedBytes, delete=len(plan.delete))
+
+        start = time.perf_counter()
+        self._madeDirs = set()
+        self._deleteFiles(dest, plan, stats)
+
+        # group writes by directory so directory entries and FAT sectors stay hot
+        plan.copy.sort(key=lambda item: (os.path.dirname(item[0]), item[0]))
+        done = 0
+        for rel, size, mtime, mode in plan.copy:
+            if self._cancelEvent.is_set():
+                stats.cancelled = True
+                break
+            srcPath, dstPath = os.path.join(source, rel), os.path.join(dest, rel)
+            try:
+                self._makeDirs(os.path.dirname(dstPath))
+                if size > self.smallFileSize and tracer.enabled:
+                    with tracer.span('file', path=rel, size=size):
+                        digest = self._copyFile(srcPath, dstPath, size, stats)
+                else:
+                    digest = self._copyFile(srcPath, dstPath, size, stats)
+                if self.destIndex is not None:
+                    self.destIndex.put(rel, size, mtime, digest)
+                self._pendingTimes.append((dstPath, mtime, mode))
+                self._pendingBytes += size
+                if self._pendingBytes >= PENDING_TIMES_BYTES:
+                    self._applyTimes(stats)
+            except SyncCancelled:
+                self._dropPartial(rel)
+                stats.cancelled = True
+                break
+            except OSError as e:
+                stats.errors.append({'path': rel, 'errno': e.errno, 'error': e.strerror})
+                self._dropPartial(rel)
+                if not os.path.isdir(dest):
+                    # the drive was pulled, every further file would fail the same way
+                    stats.destLost = True
+                    break
+                continue
+            stats.copiedFiles += 1
+            stats.copiedBytes += size
+            done += size
+            if progress:
+                progress(done, stats.plannedBytes, rel)
+
+        self._applyTimes(stats)
+        stats.copyTime = time.perf_counter() - start
+        if self.destIndex is not None:
+            for item in plan.delete:
+                self.destIndex.discard(item[0])
+            self.destIndex.save()
+        if self.hashCache is not None:
+            # keyed by absolute source path, without this the cache keeps every file that ever existed
+            self.hashCache.retain(source, {os.path.join(source, rel) for rel in srcFiles})
+            self.hashCache.save()
+        return stats
+
+    def _skipIdentical(self, source, dest, plan, dstFiles, stats):
+        """ Files with the same size and a different date only get their date fixed when the bytes match """
+        remaining = []
+        for item in plan.copy:
+            rel, size, mtime, mode = item
+            dst = dstFiles.get(rel)
+            if dst is None or dst[0] != size:
+                remaining.append(item)
+                continue
+            srcPath, dstPath = os.path.join(source, rel), os.path.join(dest, rel)
+            try:
+                same = self._sameContent(srcPath, dstPath, rel, size, mtime, dst[1])
+            except OSError:
+                same = False
+            if same:
+                self._pendingTimes.append((dstPath, mtime, mode))
+                plan.skip.append(item)
+                stats.touchedFiles += 1
+            else:
+                remaining.append(item)
+        plan.copy = remaining
+
+    def _sameContent(self, srcPath, dstPath, rel, size, mtime, dstMtime):
+        kind = fingerprintKind(size, self.fingerprintMode, self.samples)
+        srcDigest = self._ofKind(self.hashCache.get(srcPath, size, mtime), kind)
+        dstDigest = self._ofKind(self.destIndex.get(rel, size, dstMtime), kind) if self.destIndex is not None else None
+        if srcDigest is None and dstDigest is None and kind == 'f':
+            # nothing cached: one streamed pass over both files, aborting at the first difference
+            digest = sameContent(srcPath, dstPath)
+            if digest is None:
+                return False
+            srcDigest = dstDigest = digest
+        else:
+            if srcDigest is None:
+                srcDigest = self._fingerprint(srcPath, size)
+            if dstDigest is None:
+                dstDigest = self._fingerprint(dstPath, size)
+        self.hashCache.put(srcPath, size, mtime, srcDigest)
+        if self.destIndex is not None:
+            self.destIndex.put(rel, size, mtime, dstDigest)
+        if srcDigest == dstDigest and kind != 'f' and self.escalate:
+            return sameContent(srcPath, dstPath) is not None
+        return srcDigest == dstDigest
+
+    def _fingerprint(self, path, size):
+        if self.fingerprintMode == 'sampled':
+            return sampledDigest(path, size, self.samples, SAMPLE_BLOCK, self._sampleBuffer)
+        return fileDigest(path)
+
+    @staticmethod
+    def _ofKind(digest, kind):
+        if digest is not None and digest.split(':', 1)[0] == kind:
+            return digest
+        return None
+
+    def cancel(self):
+        """ Stop after the current file, thread safe
+
+        A large file being written is aborted at the next chunk and removed. Files already
+        written still get their timestamps and index entries, so the destination stays consistent.
+        """
+        self._cancelEvent.set()
+        if self.throttle:
+            self.throttle.cancel()
+
+    def removeTree(self, path: str):
+        """ Delete a whole destination folder, the equivalent of fcp /cmd=delete """
+        stats = SyncStats()
+        start = time.perf_counter()
+        files, dirs = scanTree(path)
+        for rel, (size, mtime, mode) in files.items():
+            if self._cancelEvent.is_set():
+                stats.cancelled = True
+                return stats
+            try:
+                self._unlink(os.path.join(path, rel), mode)
+                stats.deletedFiles += 1
+                stats.deletedBytes += size
+            except OSError as e:
+                stats.errors.append({'path': rel, 'errno': e.errno, 'error': e.strerror})
+        for rel in sorted(dirs, key=len, reverse=True) + ['']:
+            try:
+                self.backend.rmdir(os.path.join(path, rel))
+            except OSError:
+                pass
+        stats.copyTime = time.perf_counter() - start
+        return stats
+
+    def _deleteFiles(self, dest, plan, stats):
+        for rel, size, mtime, mode in plan.delete:
+            try:
+                self._unlink(os.path.join(dest, rel), mode)
+                stats.deletedFiles += 1
+                stats.deletedBytes += size
+            except OSError as e:
+                stats.errors.append({'path': rel, 'errno': e.errno, 'error': e.strerror})
+        for rel in plan.deleteDirs:
+            try:
+                self.backend.rmdir(os.path.join(dest, rel))
+            except OSError:
+                pass
+
+    def _unlink(self, path, mode):
+        if not mode & stat.S_IWRITE:
+            self.backend.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        self.backend.remove(path)
+
+    def _makeDirs(self, path):
+        if path in self._madeDirs:
+            return
+        self.backend.makedirs(path)
+        self._madeDirs.add(path)
+
+    def _openDest(self, path):
+        try:
+            fd = self.backend.open(path)
+        except PermissionError:
+            # read-only destination files are overwritten like fcp does
+            self.backend.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+            fd = self.backend.open(path)
+        self._partial = path
+        return fd
+
+    def _dropPartial(self, rel):
+        """ A truncated or half written file would look newer than the source, remove it so the next sync copies it again """
+        if self._partial is None:
+            return
+        try:
+            self._unlink(self._partial, stat.S_IWRITE)
+        except OSError:
+            pass
+        self._partial = None
+        if self.destIndex is not None:
+            self.destIndex.discard(rel)
+
+    def _copyFile(self, srcPath, dstPath, size, stats):
+        """ Copy one file, verify it when enabled and return its digest for the destination index """
+        needFull = self.verify == 'full' or (self.destIndex is not None and self.fingerprintMode != 'sampled')
+        needSampled = self.verify == 'sampled' or (self.destIndex is not None and self.fingerprintMode == 'sampled')
+        for attempt in range(self.retries + 1):
+            if self.throttle:
+                self.throttle.consume(0, 1)
+            if size <= self.smallFileSize:
+                data = self._copySmallFile(srcPath, dstPath)
+                full = self._bytesDigest(data) if needFull else None
+                sampled = sampledBytesDigest(data, self.samples) if needSampled else None
+            else:
+                full = self._copyLargeFile(srcPath, dstPath, size, needFull)
+                # a few block reads from the fast source disk instead of hashing the whole stream
+                sampled = sampledDigest(srcPath, size, self.samples, SAMPLE_BLOCK, self._sampleBuffer) if needSampled else None
+            if self.verify == 'off' or self._verifyFile(dstPath, size, full if self.verify == 'full' else sampled, stats):
+                break
+            stats.verifyFailures += 1
+        else:
+            raise OSError(errno.EIO, 'Verification failed', dstPath)
+
+        self._partial = None
+        if size <= self.smallFileSize:
+            stats.smallFiles += 1
+        return sampled if self.fingerprintMode == 'sampled' else full
+
+    def _verifyFile(self, dstPath, size, expected, stats):
+        """ Re-read only the destination and compare it with the digest taken while copying """
+        start = time.perf_counter()
+        if self.verify == 'full':
+            hasher = newHasher()
+            for chunk in readChunks(dstPath, min(max(size, 4096), 4 * MB), self.verifyDirect):
+                if self.throttle:
+                    self.throttle.consume(len(chunk), 1)
+                hasher.update(chunk)
+                stats.verifiedBytes += len(chunk)
+            actual = fullDigest(hasher)
+        else:
+            actual = sampledDigest(dstPath, size, self.samples, SAMPLE_BLOCK, self._sampleBuffer)
+            stats.verifiedBytes += min(size, (self.samples + 2) * SAMPLE_BLOCK)
+        stats.verifyTime += time.perf_counter() - start
+        stats.verifiedFiles += 1
+        return actual == expected
+
+    @staticmethod
+    def _bytesDigest(data):
+        hasher = newHasher()
+        hasher.update(data)
+        return fullDigest(hasher)
+
+    def _copySmallFile(self, srcPath, dstPath):
+        with open(srcPath, 'rb') as f:
+            data = f.read()
+        if self.throttle:
+            self.throttle.consume(len(data))
+        fd = self._openDest(dstPath)
+        try:
+            self.backend.preallocate(fd, len(data))
+            view = memoryview(data)
+            while view:
+                view = view[self.backend.write(fd, view):]
+        finally:
+            self.backend.close(fd)
+        return data
+
+    def _copyLargeFile(self, srcPath, dstPath, size, needFull=False):
+        chunkSize = min(self.bufSize, size, self.throttle.chunkSize if self.throttle else size)
+        if self._buffer is None or len(self._buffer) < chunkSize:
+            self._buffer = bytearray(chunkSize)
+        buffer = memoryview(self._buffer)[:chunkSize]
+        hasher = newHasher() if needFull else None
+        fd = self._openDest(dstPath)
+        try:
+            self.backend.preallocate(fd, size)
+            with open(srcPath, 'rb', buffering=0) as f:
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    if self._cancelEvent.is_set():
+                        raise SyncCancelled()
+                    if self.throttle:
+                        self.throttle.consume(n, 1)
+                    view = buffer[:n]
+                    if hasher:
+                        hasher.update(view)
+                    while view:
+                        view = view[self.backend.write(fd, view):]
+            if self.verify != 'off':
+                self.backend.fsync(fd)
+        finally:
+            self.backend.close(fd)
+        return fullDigest(hasher) if hasher else None
+
+    def _applyTimes(self, stats):
+        """ Batched timestamp and attribute pass, run once all data is written """
+        for path, mtime, mode in self._pendingTimes:
+            try:
+                self.backend.utime(path, mtime)
+                if not mode & stat.S_IWRITE:
+                    self.backend.chmod(path, stat.S_IMODE(mode))
+            except OSError as e:
+                stats.errors.append({'path': path, 'errno': e.errno, 'error': e.strerror})
+        self._pendingTimes = []
+        self._pendingBytes = 0
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+
+HEARTBEAT_PATH = './Log/ExpressScan.heartbeat'
+STOP_PATH = './Log/ExpressScan.stop'
+
+
+class Heartbeat:
+    """ Status file of the resident scanner, rewritten at most every `interval` seconds
+
+    The Launcher reads it instead of looking for a window, and asks the scanner to quit by
+    creating the stop file, so neither side enumerates processes.
+    """
+
+    def __init__(self, cycle: float, path: str = HEARTBEAT_PATH, stopPath: str = STOP_PATH, interval: float = 1,
+                 info: dict = None, runs=None):
+        """
+        Parameters
+        ----------
+        cycle: float
+            scan cycle in seconds, readers give up on a heartbeat older than a few cycles
+
+        interval: float
+            minimum seconds between two writes of the file
+
+        info: dict
+            published with every beat, e.g. where the IPC service listens
+
+        runs: callable
+            returns the running syncs, published as 'runs' so readers need not query the service
+        """
+        self.cycle = cycle
+        self.path = path
+        self.stopPath = stopPath
+        self.interval = interval
+        self.info = info or {}
+        self.runs = runs
+        self.started = time.time()
+        self.scans = 0
+        self.lastWrite = 0
+        try:
+            # a stop request left over from an earlier scanner is not meant for this one
+            os.remove(stopPath)
+        except OSError:
+            pass
+
+    def beat(self, latency: float, drives):
+        """ One scan loop iteration took `latency` seconds and saw `drives` """
+        self.scans += 1
+        now = time.time()
+        if now - self.lastWrite < self.interval:
+            return
+        self.lastWrite = now
+        status = {
+            'pid': os.getpid(),
+            'started': self.started,
+            'lastScan': now,
+            'latencyMs': round(latency * 1000, 3),
+            'cycle': self.cycle,
+            'scans': self.scans,
+            'drives': sorted(drives),
+        }
+        status.update(self.info)
+        if self.runs is not None:
+            status['runs'] = self.runs()
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(status, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass
+
+    def stopRequested(self):
+        return os.path.exists(self.stopPath)
+
+    def close(self):
+        for path in (self.path, self.stopPath):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def readStatus(path: str = HEARTBEAT_PATH, now: float = None):
+    """ The scanner's last heartbeat with 'running' and 'uptime' added, {'running': False} without one """
+    try:
+        with open(path, encoding='utf-8') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return {'running': False}
+    now = now or time.time()
+    # a scanner that was killed leaves its file behind, only a recent beat counts
+    status['running'] = now - status.get('lastScan', 0) < max(5.0, status.get('cycle', 1) * 3 + 1)
+    status['uptime'] = now - status.get('started', now)
+    return status
+
+
+def requestStop(path: str = STOP_PATH):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        open(path, 'w').close()
+    except OSError:
+        return False
+    return True
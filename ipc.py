@@ -0,0 +1,177 @@
+import json
+import socket
+import struct
+import secrets
+import threading
+import socketserver
+from heartbeat import readStatus
+
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('>I')
+MAX_MESSAGE = 16 * 1024 * 1024
+ATTACH_ARG = '--attach='
+
+
+class IpcError(Exception):
+    pass
+
+
+def send(sock, message: dict):
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def receive(sock):
+    """ One message, None when the peer closed the connection """
+    header = _receiveExactly(sock, HEADER.size)
+    if header is None:
+        return None
+    size, = HEADER.unpack(header)
+    if size > MAX_MESSAGE:
+        raise IpcError(f'Message of {size} bytes')
+    data = _receiveExactly(sock, size)
+    if data is None:
+        raise IpcError('Connection closed inside a message')
+    return json.loads(data.decode('utf-8'))
+
+
+def _receiveExactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+class IpcHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = receive(self.request)
+            except (OSError, ValueError, IpcError):
+                return
+            if message is None:
+                return
+            try:
+                send(self.request, self.server.dispatch(message))
+            except OSError:
+                return
+
+
+class IpcServer(socketserver.ThreadingTCPServer):
+    """ Length-prefixed JSON requests on 127.0.0.1
+
+    Every request is {'v': PROTOCOL_VERSION, 'token': ..., 'op': ..., ...} and gets one answer
+    {'v': PROTOCOL_VERSION, 'ok': True, ...} or {'ok': False, 'error': ...}. Port and token are
+    published through the scanner's heartbeat file, a client has to be able to read ./Log.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = False
+
+    def __init__(self, onRequest, port: int = 0):
+        """
+        Parameters
+        ----------
+        onRequest: callable
+            gets the op and the request dict, returns the answer's values or raises IpcError
+
+        port: int
+            0 picks a free port
+        """
+        self.onRequest = onRequest
+        self.token = secrets.token_hex(16)
+        super().__init__(('127.0.0.1', port), IpcHandler)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def dispatch(self, message):
+        if not isinstance(message, dict) or not secrets.compare_digest(str(message.get('token')), self.token):
+            return {'v': PROTOCOL_VERSION, 'ok': False, 'error': 'bad token'}
+        if message.get('v') != PROTOCOL_VERSION:
+            return {'v': PROTOCOL_VERSION, 'ok': False, 'error': f"unsupported version {message.get('v')}"}
+        try:
+            answer = self.onRequest(message.get('op'), message)
+        except IpcError as e:
+            return {'v': PROTOCOL_VERSION, 'ok': False, 'error': str(e)}
+        except Exception as e:
+            return {'v': PROTOCOL_VERSION, 'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        return dict(answer or {}, v=PROTOCOL_VERSION, ok=True)
+
+
+class IpcClient:
+    """ One connection to the service, requests are answered in order """
+
+    def __init__(self, port: int, token: str, timeout: float = 5):
+        self.token = token
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+
+    def request(self, op: str, **values):
+        send(self.sock, dict(values, v=PROTOCOL_VERSION, token=self.token, op=op))
+        answer = receive(self.sock)
+        if answer is None:
+            raise IpcError('Service closed the connection')
+        if not answer.get('ok'):
+            raise IpcError(answer.get('error'))
+        return answer
+
+    def submit(self, request: dict):
+        return self.request('submit', request=request)['run']
+
+    def status(self, run: str = None):
+        return self.request('status', run=run)['runs']
+
+    def events(self, run: str, since: int = 0):
+        return self.request('events', run=run, since=since)
+
+    def cancel(self, run: str = None, drive: str = None):
+        return self.request('cancel', run=run, drive=drive)['cancelled']
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def connect(timeout: float = 5):
+    """ A client of the running scanner's service, None if no scanner with a service is running """
+    status = readStatus()
+    if not status['running'] or not status.get('ipcPort'):
+        return None
+    try:
+        return IpcClient(status['ipcPort'], status['ipcToken'], timeout)
+    except OSError:
+        return None
+
+
+def argvToRequest(argv: list):
+    """ The 15 positional arguments ExpressMain has always taken, as a submit request """
+    return {'drive': argv[1], 'subjects': [i - 1 for i in range(2, 13) if argv[i] == '1'], 'mode': int(argv[13]),
+            'isDelete': argv[14] != 'False', 'commandOption': argv[15]}
+
+
+def attachArg(argv: list):
+    """ Take --attach=<run> out of `argv` and return the run, None if not given """
+    for arg in list(argv):
+        if arg.startswith(ATTACH_ARG):
+            argv.remove(arg)
+            return arg[len(ATTACH_ARG):]
+    return None
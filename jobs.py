@@ -0,0 +1,166 @@
+import os
+import settings
+from engine import CopyEngine, HashIndex, MB, parseFilterOption
+from throttle import TokenBucket, LoadMonitor
+from orchestrator import ProcessJob, WorkerJob
+from driveprofile import DriveProfiles, volumeInformation, strategy, workKey
+
+SUBJECT_FOLDERS = {1: 'yuwenFolder', 2: 'shuxueFolder', 3: 'yingyuFolder', 4: 'wuliFolder', 5: 'huaxueFolder',
+                   6: 'shengwuFolder', 7: 'zhengzhiFolder', 8: 'lishiFolder', 9: 'diliFolder', 10: 'jishuFolder',
+                   11: 'ziliaoFolder'}
+
+
+class SyncRequest:
+    """ One sync of a drive as chosen in the popup, with the settings it runs under """
+
+    def __init__(self, drive: str, subjects: list, mode: int = 1, isDelete: bool = False, commandOption: str = '',
+                 destFolder: str = None, cfg=None):
+        """
+        Parameters
+        ----------
+        drive: str
+            drive letter with colon, e.g. 'E:', or a mount point
+
+        subjects: list
+            subject numbers 1 - 11, see SUBJECT_FOLDERS
+
+        mode: int
+            1 sync, 2 sync with low priority, 3 copy recent files, 4 copy from a date
+
+        commandOption: str
+            fcp.exe options, /from_date and /to_date are understood by the engine too
+
+        destFolder: str
+            where the source folder goes, by default the folder of the same name on the drive
+
+        cfg:
+            config.cfg or settings.load(), read fresh from config/config.json when not given
+        """
+        self.drive = drive
+        self.subjects = [int(subject) for subject in subjects]
+        self.mode = int(mode)
+        self.isDelete = bool(isDelete)
+        self.commandOption = commandOption
+        self.cfg = cfg = cfg or settings.load()
+        self.buf = str(cfg.BufSize.value)[9:]
+        self.concurrentProcess = cfg.ConcurrentProcess.value
+        self.copyEngine = cfg.CopyEngine.value
+        self.sourceFolder = os.path.normpath(cfg.sourceFolder.value)
+        # 'E:' alone would join into the current directory of the drive
+        root = drive + os.sep if len(drive) == 2 and drive[1] == ':' else drive
+        self.destFolder = destFolder or os.path.join(root, os.path.basename(self.sourceFolder), '')
+        self.serial, self.fileSystem = volumeInformation(drive)
+        self.profile = DriveProfiles().get(self.serial)
+        self.tuned = False
+        if cfg.AutoTune.value:
+            self.applyStrategy(strategy(self.profile))
+
+    def applyStrategy(self, values):
+        """ Run with what the drive's profile suggests instead of the configured buffer, concurrency and engine """
+        if not values:
+            return
+        self.buf = str(values['bufSize'])[9:]
+        self.concurrentProcess = values['concurrentProcess']
+        self.copyEngine = values.get('copyEngine') or self.copyEngine
+        self.tuned = True
+
+    def toDict(self):
+        return {'drive': self.drive, 'subjects': self.subjects, 'mode': self.mode, 'isDelete': self.isDelete,
+                'commandOption': self.commandOption}
+
+
+def subjectFolder(cfg, subject):
+    return getattr(cfg, SUBJECT_FOLDERS[subject]).value
+
+
+def deleteJobs(request: SyncRequest):
+    if request.copyEngine == "Express":
+        engine = CopyEngine(int(request.buf) * MB)
+        return [WorkerJob('delete', engine, lambda progress: engine.removeTree(request.destFolder), request.drive)]
+    args = ["fcp.exe", "/cmd=delete", f"/bufsize={request.buf}", "/log=FALSE",
+            f"/force_start={request.concurrentProcess}", request.destFolder]
+    return [ProcessJob('delete', args, request.drive)]
+
+
+def syncJobs(request: SyncRequest):
+    cfg = request.cfg
+    jobs = []
+    fromDate, toDate = parseFilterOption(request.commandOption)
+    hashCache = HashIndex('./Log/HashCache.json') if cfg.ContentCheck.value else None
+    for subject in request.subjects:
+        folder = os.path.normpath(subjectFolder(cfg, subject))
+        name = os.path.basename(folder)
+        if subject in cfg.PackedSubjects.value:
+            jobs.append(packedJob(request, folder, name, fromDate, toDate))
+        elif request.copyEngine == "Express":
+            jobs.append(engineJob(request, folder, name, fromDate, toDate, hashCache))
+        else:
+            verifyOption = ["/verify"] if cfg.Verify.value != "off" else []
+            args = ["fcp.exe", "/cmd=sync", f"/bufsize={request.buf}", "/log=FALSE",
+                    f"/force_start={request.concurrentProcess}"] \
+                + request.commandOption.split() + verifyOption + [folder, f"/to={request.destFolder}"]
+            jobs.append(ProcessJob(name, args, request.drive))
+    return jobs
+
+
+def engineJob(request, folder, name, fromDate, toDate, hashCache):
+    cfg = request.cfg
+    engine = CopyEngine(int(request.buf) * MB, cfg.SmallFileSize.value * 1024, hashCache, cfg.FingerprintMode.value,
+                        cfg.FingerprintSamples.value, cfg.FingerprintEscalate.value,
+                        cfg.Verify.value, cfg.VerifyDirect.value)
+    if request.mode == 2:
+        engine.throttle = TokenBucket(cfg.LowIoRate.value * MB, cfg.LowIoIops.value)
+
+    def call(progress):
+        monitor = None
+        if engine.throttle:
+            monitor = LoadMonitor(engine.throttle)
+            monitor.start()
+        try:
+            # the digest index on the drive only serves the content check
+            indexPath = os.path.join(request.destFolder, '.express', name + '.json') if hashCache is not None else None
+            return engine.sync(folder, os.path.join(request.destFolder, name), True, fromDate, toDate, progress,
+                               indexPath=indexPath)
+        finally:
+            if monitor:
+                monitor.stop()
+
+    return WorkerJob(name, engine, call, request.drive)
+
+
+def packedJob(request, folder, name, fromDate, toDate):
+    from packstore import PackedStore, FAT32_MAX_FILE
+    maxSize = FAT32_MAX_FILE if request.fileSystem == 'FAT32' else None
+    store = PackedStore(os.path.join(request.destFolder, name + '.zip'), maxSize=maxSize)
+    return WorkerJob(name, store, lambda progress: store.sync(folder, True, fromDate, toDate, progress),
+                     request.drive)
+
+
+def requestJobs(request: SyncRequest):
+    """ Everything a request runs, the delete of mode 3 and 4 goes first on the same drive """
+    return (deleteJobs(request) if request.isDelete else []) + syncJobs(request)
+
+
+def plannedWork(request: SyncRequest):
+    """ (job name, files, bytes, deletes, overhead seconds) of every job of requestJobs, for driveprofile.Eta
+
+    A subject already on the drive is expected to copy what it copied there the last runs, one that
+    is not there yet or was just deleted copies the whole folder as the analyzer last saw it.
+    """
+    from analyzer import loadSummary
+    summary = loadSummary()
+    learned = (request.profile or {}).get('subjects', {})
+    folders = [subjectFolder(request.cfg, subject) for subject in request.subjects]
+    work = []
+    if request.isDelete:
+        work.append(('delete', 0, 0, sum((summary.get(folder) or {}).get('files', 0) for folder in folders), 0.0))
+    for folder in folders:
+        name = os.path.basename(os.path.normpath(folder))
+        previous = learned.get(workKey(name, request.mode))
+        dest = os.path.join(request.destFolder, name)
+        if previous and (request.mode in (3, 4) or os.path.exists(dest) or os.path.exists(dest + '.zip')):
+            work.append((name, previous['files'], previous['bytes'], 0, previous.get('overhead', 0.0)))
+        else:
+            stats = summary.get(folder) or {}
+            work.append((name, stats.get('files', 0), stats.get('bytes', 0), 0, 0.0))
+    return work
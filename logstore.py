@@ -0,0 +1,277 @@
+import os
+import json
+import gzip
+import time
+import threading
+from usage import noteWrite
+
+MB = 1024 * 1024
+DAY = 24 * 3600
+INDEX_NAME = 'index.json'
+# report.jsonl is rotated beyond this, readers of the active file never parse more
+SEGMENT_BYTES = 4 * MB
+# trace and profile output next to the active file shares the budget of the archive
+PRUNED_DIRS = ['Trace', 'Profile']
+# retention does not wait for a rotation, a classroom PC can take months to fill a segment
+MAINTAIN_INTERVAL = 6 * 3600
+
+
+def readRecords(file):
+    for line in file:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+class LogStore:
+    """ report.jsonl with size based rotation, gzip compressed segments, retention and an index
+
+    The active file stays where it always was, so appending and tailing it does not change. Once it
+    reaches `segmentBytes` it is moved into the archive, compressed in a background thread and
+    summarized in the index: first and last time and number of runs of every segment, which lets
+    `runs` open only the segments a query needs. Archived segments, traces and profiles are removed
+    oldest first beyond `maxBytes` or `maxAge`.
+    """
+
+    def __init__(self, path: str, archive: str = None, segmentBytes: int = SEGMENT_BYTES,
+                 maxBytes: int = None, maxAge: float = None, prunedDirs=PRUNED_DIRS):
+        """
+        Parameters
+        ----------
+        path: str
+            the active file, e.g. ./Log/report.jsonl
+
+        archive: str
+            where the segments go, Archive next to the active file by default
+
+        maxBytes: int
+            budget of the archive and `prunedDirs` together, LogMaxSize of the settings when not given
+
+        maxAge: float
+            seconds after which segments and files are removed, LogKeepDays of the settings when not given
+
+        prunedDirs: list
+            directories next to the active file whose files count against the budget too
+        """
+        directory = os.path.dirname(path) or '.'
+        self.path = path
+        self.archive = archive or os.path.join(directory, 'Archive')
+        self.segmentBytes = segmentBytes
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+        self.prunedDirs = [os.path.join(directory, name) for name in prunedDirs]
+        self.indexPath = os.path.join(self.archive, INDEX_NAME)
+        self.stem = os.path.splitext(os.path.basename(path))[0]
+
+    def rotateIfNeeded(self):
+        try:
+            if os.path.getsize(self.path) < self.segmentBytes:
+                return None
+        except OSError:
+            return None
+        return self.rotate()
+
+    def rotate(self, background: bool = True):
+        """ Move the active file into the archive, compress and prune after it """
+        name = f'{self.stem}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.jsonl'
+        target = os.path.join(self.archive, name)
+        try:
+            os.makedirs(self.archive, exist_ok=True)
+            # fails while another process has the file open on Windows, the next append tries again
+            os.replace(self.path, target)
+        except OSError:
+            return None
+        noteWrite(target)
+        if background:
+            # not a daemon, a process that exits right after its report still finishes the segment
+            threading.Thread(target=self.maintain, name='LogStore').start()
+        else:
+            self.maintain()
+        return target
+
+    def maintain(self):
+        self.compressPending()
+        self.prune()
+
+    def compressPending(self):
+        """ Index and compress the segments still stored as plain text, also those left by an earlier process """
+        for name in self._segmentNames():
+            if not name.endswith('.jsonl'):
+                continue
+            source = os.path.join(self.archive, name)
+            try:
+                with open(source, 'rb') as f:
+                    data = f.read()
+                entry = self._summarize(data.decode('utf-8', 'replace').splitlines())
+                with gzip.open(source + '.gz.' + str(os.getpid()), 'wb', compresslevel=6) as f:
+                    f.write(data)
+                os.replace(source + '.gz.' + str(os.getpid()), source + '.gz')
+                os.remove(source)
+            except OSError:
+                continue
+            entry['bytes'] = os.path.getsize(source + '.gz')
+            self._updateIndex({name + '.gz': entry}, [name])
+            noteWrite(source, entry['bytes'] - len(data))
+
+    def prune(self, now: float = None):
+        """ Remove what is older than maxAge, then the oldest until maxBytes is kept, returns the bytes freed """
+        now = now or time.time()
+        maxBytes, maxAge = self._limits()
+        index = self.index()
+        files = []
+        for name, entry in index.items():
+            path = os.path.join(self.archive, name)
+            try:
+                modified = entry.get('last') or os.path.getmtime(path)
+            except OSError:
+                continue
+            files.append((modified, path, entry.get('bytes', 0)))
+        for directory in self.prunedDirs:
+            for root, dirs, names in os.walk(directory):
+                for name in names:
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, os.path.join(root, name), stat.st_size))
+        files.sort()
+        total = sum(size for _, _, size in files)
+        freed = 0
+        removed = []
+        for modified, path, size in files:
+            if total <= maxBytes and modified >= now - maxAge:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            freed += size
+            removed.append(os.path.basename(path))
+            noteWrite(path, -size)
+        if removed:
+            self._updateIndex({}, removed)
+        return freed
+
+    def index(self):
+        """ name: {'first', 'last', 'runs', 'records', 'bytes'} of every compressed segment """
+        try:
+            with open(self.indexPath, encoding='utf-8') as f:
+                index = json.load(f)['segments']
+        except (OSError, ValueError, KeyError, TypeError):
+            index = {}
+        names = [name for name in self._segmentNames() if name.endswith('.gz')]
+        missing = [name for name in names if name not in index]
+        if missing or len(index) != len(names):
+            # segments of a crashed or concurrent process, or an index that was lost
+            added = {}
+            for name in missing:
+                try:
+                    with gzip.open(os.path.join(self.archive, name), 'rt', encoding='utf-8', errors='replace') as f:
+                        added[name] = self._summarize(f)
+                    added[name]['bytes'] = os.path.getsize(os.path.join(self.archive, name))
+                except (OSError, EOFError):
+                    continue
+            index = self._updateIndex(added, [name for name in index if name not in names])
+        return index
+
+    def runs(self, limit: int = None, since: float = None):
+        """ 'run' records of the active file and the archive, newest last """
+        runs = self._runsOf(lambda: open(self.path, encoding='utf-8'), since)
+        for name, entry in sorted(self.index().items(), key=lambda item: item[1].get('last') or 0, reverse=True):
+            if limit and len(runs) >= limit or since and (entry.get('last') or 0) < since:
+                break
+            if not entry.get('runs'):
+                continue
+            path = os.path.join(self.archive, name)
+            runs = self._runsOf(lambda: gzip.open(path, 'rt', encoding='utf-8', errors='replace'), since) + runs
+        return runs[-limit:] if limit else runs
+
+    def runCount(self):
+        """ Number of runs ever recorded, read from the index for the archive """
+        return len(self._runsOf(lambda: open(self.path, encoding='utf-8'))) + \
+            sum(entry.get('runs', 0) for entry in self.index().values())
+
+    @staticmethod
+    def _runsOf(opener, since=None):
+        try:
+            with opener() as f:
+                return [record for record in readRecords(f) if record.get('record') == 'run'
+                        and not (since and (record.get('start') or 0) < since)]
+        except (OSError, EOFError):
+            return []
+
+    @staticmethod
+    def _summarize(lines):
+        entry = {'first': None, 'last': None, 'runs': 0, 'records': 0}
+        for record in readRecords(lines):
+            if not isinstance(record, dict):
+                continue
+            entry['records'] += 1
+            moment = record.get('start') or record.get('time')
+            if moment:
+                entry['first'] = min(entry['first'] or moment, moment)
+                entry['last'] = max(entry['last'] or moment, moment)
+            if record.get('record') == 'run':
+                entry['runs'] += 1
+        return entry
+
+    def _limits(self):
+        maxBytes, maxAge = self.maxBytes, self.maxAge
+        if maxBytes is None or maxAge is None:
+            import settings
+            values = settings.load()
+            maxBytes = values.LogMaxSize.value * MB if maxBytes is None else maxBytes
+            maxAge = values.LogKeepDays.value * DAY if maxAge is None else maxAge
+        return maxBytes, maxAge
+
+    def _segmentNames(self):
+        try:
+            return [name for name in os.listdir(self.archive)
+                    if name.startswith(self.stem + '-') and name.endswith(('.jsonl', '.jsonl.gz'))]
+        except OSError:
+            return []
+
+    def _updateIndex(self, added: dict, removed: list):
+        # read again right before writing, another process may have changed it meanwhile
+        try:
+            with open(self.indexPath, encoding='utf-8') as f:
+                index = json.load(f)['segments']
+        except (OSError, ValueError, KeyError, TypeError):
+            index = {}
+        index.update(added)
+        for name in removed:
+            index.pop(name, None)
+        try:
+            os.makedirs(self.archive, exist_ok=True)
+            temp = f'{self.indexPath}.{os.getpid()}'
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump({'segments': index}, f, ensure_ascii=False)
+            os.replace(temp, self.indexPath)
+        except OSError:
+            pass
+        return index
+
+
+class LogMaintainer(threading.Thread):
+    """ Compresses and prunes the archive when the scanner starts and every `interval` seconds after """
+
+    def __init__(self, store: LogStore, interval: float = MAINTAIN_INTERVAL):
+        super().__init__(name='LogMaintainer', daemon=True)
+        self.store = store
+        self.interval = interval
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self.store.maintain()
+            except OSError:
+                pass
+            if self._stopEvent.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stopEvent.set()
+        self.join(10)
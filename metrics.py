@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import errno
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from report import REPORT_PATH
+
+METRICS_PATH = './Log/metrics.prom'
+METRICS_PORT = 9477
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def formatLabels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{str(value)}"' for key, value in sorted(labels.items())) + '}'
+
+
+def formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, value=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{formatLabels(dict(zip(self.labels, key)))} {formatValue(value)}')
+        if not self.values and not self.labels:
+            lines.append(f'{self.name} 0')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{formatLabels({"le": formatValue(bound)})} {cumulative}')
+        lines.append(f'{self.name}_sum {formatValue(self.sum)}')
+        lines.append(f'{self.name}_count {self.count}')
+        return lines
+
+
+class ScanMetrics:
+    """ Metrics of the resident scanner in the Prometheus text format
+
+    The scan loop reports iterations and detections itself, everything the other processes do
+    is read from the new lines of ./Log/report.jsonl: 'popup' lines written by ExpressUsbService
+    give the detection to popup latency, 'run' and 'subject' lines of ExpressMain the syncs.
+    """
+
+    def __init__(self, reportPath: str = REPORT_PATH):
+        self.reportPath = reportPath
+        self.scans = Counter('express_scan_iterations_total', 'Partition polls of the scan loop')
+        self.scanSeconds = Histogram('express_scan_iteration_seconds', 'Time spent polling the partitions',
+                                     (0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+        self.detections = Counter('express_drive_detections_total', 'Inserted drives detected')
+        self.popupLatency = Histogram('express_detect_to_popup_seconds', 'Drive detection until the popup is shown',
+                                      (0.25, 0.5, 1, 2, 5, 10, 30))
+        self.syncs = Counter('express_syncs_total', 'Finished ExpressMain runs', ('state', 'engine'))
+        self.syncSeconds = Histogram('express_sync_seconds', 'Duration of ExpressMain runs',
+                                     (10, 30, 60, 120, 300, 600, 1800, 3600))
+        self.bytesWritten = Counter('express_bytes_written_total', 'Bytes copied onto drives')
+        self.filesWritten = Counter('express_files_written_total', 'Files copied onto drives')
+        self.errors = Counter('express_sync_errors_total', 'Sync errors by errno name', ('type',))
+        self.metrics = [self.scans, self.scanSeconds, self.detections, self.popupLatency, self.syncs,
+                        self.syncSeconds, self.bytesWritten, self.filesWritten, self.errors]
+        self._pending = {}
+        self._lock = threading.Lock()
+        try:
+            # counters start with the process, older lines are history
+            stat = os.stat(reportPath)
+            self._offset, self._file = stat.st_size, (stat.st_dev, stat.st_ino)
+        except OSError:
+            self._offset, self._file = 0, None
+
+    def onScan(self, seconds: float):
+        with self._lock:
+            self.scans.inc()
+            self.scanSeconds.observe(seconds)
+
+    def onDetect(self, letter: str):
+        with self._lock:
+            self.detections.inc()
+            self._pending[letter] = time.time()
+
+    def refresh(self):
+        """ Take in the report lines appended since the last call """
+        try:
+            with open(self.reportPath, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                f.seek(0, os.SEEK_END)
+                if f.tell() < self._offset or (stat.st_dev, stat.st_ino) != self._file:
+                    # rotated by the log store, the new file is read from its start
+                    self._offset, self._file = 0, (stat.st_dev, stat.st_ino)
+                f.seek(self._offset)
+                data = f.read()
+        except OSError:
+            return
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            try:
+                self._onRecord(json.loads(line))
+            except (ValueError, TypeError, AttributeError):
+                continue
+
+    def _onRecord(self, record):
+        kind = record.get('record')
+        if kind == 'popup':
+            detected = self._pending.pop(record.get('drive'), None)
+            if detected is not None:
+                self.popupLatency.observe(max(0.0, record['time'] - detected))
+        elif kind == 'subject':
+            for error in record.get('errors') or []:
+                code = error.get('errno')
+                self.errors.inc(type=errno.errorcode.get(code, 'other') if code else 'other')
+        elif kind == 'run':
+            self.syncs.inc(state=record.get('state'), engine=record.get('engine'))
+            self.syncSeconds.observe(record.get('seconds', 0))
+            self.bytesWritten.inc(record.get('copiedBytes', 0))
+            self.filesWritten.inc(record.get('copiedFiles', 0))
+
+    def render(self):
+        with self._lock:
+            self.refresh()
+            lines = []
+            for metric in self.metrics:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def writeFile(self, path: str = METRICS_PATH):
+        """ Replace `path` atomically, for node_exporter's textfile collector """
+        text = self.render()
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """ GET /metrics on 127.0.0.1 only, port 0 picks a free port (see `port`) """
+
+    daemon_threads = True
+
+    def __init__(self, metrics: ScanMetrics, port: int = METRICS_PORT):
+        self.metrics = metrics
+        super().__init__(('127.0.0.1', port), MetricsHandler)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsFileWriter(threading.Thread):
+    def __init__(self, metrics: ScanMetrics, path: str = METRICS_PATH, interval: float = 15):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        while not self._stopEvent.wait(self.interval):
+            self.metrics.writeFile(self.path)
+
+    def stop(self):
+        self._stopEvent.set()
+        self.join()
+        self.metrics.writeFile(self.path)
+
+
+def export(metrics: ScanMetrics, mode: str, port: int = METRICS_PORT):
+    """ Start the exporter chosen in the settings: 'http', 'file' or 'off' """
+    try:
+        if mode == 'http':
+            return MetricsServer(metrics, port).start()
+        if mode == 'file':
+            writer = MetricsFileWriter(metrics)
+            writer.start()
+            return writer
+    except OSError:
+        pass
+    return None
+
+
+def parse(text: str):
+    """ {(name, ((label, value), ...)): value} of a text exposition, what a scraper would store """
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, value = line.rsplit(' ', 1)
+        labels = ()
+        if '{' in series:
+            series, body = series[:-1].split('{', 1)
+            labels = tuple(sorted(tuple(item.split('=', 1)) for item in body.split(',')))
+            labels = tuple((key, text.strip('"')) for key, text in labels)
+        samples[(series, labels)] = float(value)
+    return samples
+
+
+def scrape(port: int = METRICS_PORT, host: str = '127.0.0.1', timeout: float = 5):
+    """ A local stand-in for Prometheus: fetch /metrics and parse it """
+    with urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=timeout) as response:
+        return parse(response.read().decode('utf-8'))
@@ -0,0 +1,230 @@
+import re
+import sys
+import time
+import asyncio
+import locale
+import itertools
+
+STAT_PATTERN = re.compile(r'(\w+)\s*=\s*(.+?)(?=\s+\w+\s*=|$)')
+ERROR_PATTERN = re.compile(r"error|failed|can't|cannot", re.IGNORECASE)
+PROGRESS_INTERVAL = 0.1
+
+
+class Job:
+    """ One unit of work for the orchestrator, jobs of the same drive run one after another """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, drive: str = None):
+        self.id = next(Job._ids)
+        self.name = name
+        self.drive = drive
+        self.state = 'pending'
+        self.stats = {}
+
+
+class ProcessJob(Job):
+    """ A child process such as fcp.exe, its stdout and stderr are parsed while it runs """
+
+    def __init__(self, name: str, args: list, drive: str = None):
+        super().__init__(name, drive)
+        self.args = args
+        self.process = None
+
+
+class WorkerJob(Job):
+    """ An in-process copy running in the default executor
+
+    `call(progress)` does the work, `worker` is the object whose `cancel` stops it.
+    """
+
+    def __init__(self, name: str, worker, call, drive: str = None):
+        super().__init__(name, drive)
+        self.worker = worker
+        self.call = call
+
+
+class Progress:
+    """ Percent done of a list of jobs from their events, -1 once the orchestrator finished """
+
+    def __init__(self, jobCount: int):
+        self.jobCount = jobCount
+        self.doneJobs = 0
+        self.value = 0
+
+    def update(self, event):
+        """ Take in one event, True when `value` changed """
+        if event['type'] == 'finished':
+            self.value = -1
+            return True
+        if event['type'] == 'done':
+            self.doneJobs += 1
+            fraction = 0
+        elif event['type'] == 'progress' and event['total']:
+            fraction = event['done'] / event['total']
+        else:
+            return False
+        value = int((self.doneJobs + fraction) / max(self.jobCount, 1) * 100)
+        if value == self.value:
+            return False
+        self.value = value
+        return True
+
+
+class Orchestrator:
+    """ Supervise copy jobs of many drives from one asyncio loop
+
+    Everything that happens is reported to `emit` as a plain dict, so the caller decides whether
+    it ends up in a Qt signal, a log file or a socket.
+    """
+
+    def __init__(self, emit, concurrency: int = 4, killTimeout: float = 5):
+        """
+        Parameters
+        ----------
+        emit: callable
+            receives every event dict, called from the loop thread
+
+        concurrency: int
+            how many drives are served at the same time
+
+        killTimeout: float
+            seconds a terminated child gets before it is killed
+        """
+        self.emit = emit
+        self.concurrency = concurrency
+        self.killTimeout = killTimeout
+        self.jobs = []
+        self.cancelled = set()
+        self._semaphore = None
+        self._loop = None
+
+    async def run(self, jobs: list):
+        """ Run all jobs and return them with their final state """
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.jobs.extend(jobs)
+        drives = {}
+        for job in jobs:
+            drives.setdefault(job.drive, []).append(job)
+        try:
+            await asyncio.gather(*(self._runDrive(queue) for queue in drives.values()))
+        finally:
+            # the windows and the sync service wait for this event, it must come whatever happened
+            self._emit(None, 'finished', jobs=len(jobs),
+                       failed=sum(job.state in ('failed', 'running', 'pending') for job in jobs),
+                       cancelled=sum(job.state == 'cancelled' for job in jobs))
+        return jobs
+
+    def cancel(self, drive=None):
+        """ Cancel the jobs of one drive, or all of them, must be called in the loop thread """
+        for job in self.jobs:
+            if drive is not None and job.drive != drive:
+                continue
+            self.cancelled.add(job.id)
+            if job.state != 'running':
+                continue
+            if isinstance(job, WorkerJob):
+                job.worker.cancel()
+            elif job.process is not None and job.process.returncode is None:
+                job.process.terminate()
+                self._loop.call_later(self.killTimeout, self._kill, job.process)
+
+    async def _runDrive(self, queue):
+        async with self._semaphore:
+            for job in queue:
+                if job.id in self.cancelled:
+                    job.state = 'cancelled'
+                    self._emit(job, 'done', state=job.state)
+                    continue
+                start = time.perf_counter()
+                job.state = 'running'
+                self._emit(job, 'start')
+                try:
+                    if isinstance(job, ProcessJob):
+                        ok = await self._runProcess(job)
+                    else:
+                        ok = await self._runWorker(job)
+                except OSError as e:
+                    self._emit(job, 'error', errno=e.errno, error=e.strerror or str(e))
+                    ok = False
+                except Exception as e:
+                    # a bug or a damaged destination in one job must not take the others down
+                    self._emit(job, 'error', errno=None, error=f'{type(e).__name__}: {e}')
+                    ok = False
+                if job.id in self.cancelled:
+                    job.state = 'cancelled'
+                else:
+                    job.state = 'ok' if ok else 'failed'
+                self._emit(job, 'done', state=job.state, stats=job.stats,
+                           elapsed=round(time.perf_counter() - start, 3))
+
+    async def _runProcess(self, job):
+        job.process = await asyncio.create_subprocess_exec(
+            *job.args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        if job.id in self.cancelled:
+            # cancelled while the child was being spawned
+            job.process.terminate()
+            self._loop.call_later(self.killTimeout, self._kill, job.process)
+        await asyncio.gather(self._readStream(job, job.process.stdout, 'stdout'),
+                             self._readStream(job, job.process.stderr, 'stderr'))
+        returncode = await job.process.wait()
+        job.stats['returncode'] = returncode
+        return returncode == 0
+
+    async def _readStream(self, job, stream, name):
+        encoding = 'mbcs' if sys.platform == 'win32' else locale.getpreferredencoding(False)
+        pending = b''
+        while True:
+            chunk = await stream.read(4096)
+            if not chunk:
+                break
+            # console tools redraw their progress with a bare carriage return
+            lines = re.split(rb'\r\n|\r|\n', pending + chunk)
+            pending = lines.pop()
+            for line in lines:
+                self._parseLine(job, line.decode(encoding, 'replace').strip(), name)
+        if pending:
+            self._parseLine(job, pending.decode(encoding, 'replace').strip(), name)
+
+    def _parseLine(self, job, line, stream):
+        if not line:
+            return
+        stats = dict(STAT_PATTERN.findall(line))
+        if stats:
+            job.stats.update(stats)
+            self._emit(job, 'stat', values=stats)
+        elif stream == 'stderr' or ERROR_PATTERN.search(line):
+            self._emit(job, 'error', error=line)
+        else:
+            self._emit(job, 'output', line=line)
+
+    async def _runWorker(self, job):
+        last = [0.0]
+
+        def progress(done, total, path):
+            now = time.perf_counter()
+            if now - last[0] < PROGRESS_INTERVAL and done < total:
+                return
+            last[0] = now
+            self._loop.call_soon_threadsafe(lambda: self._emit(job, 'progress', done=done, total=total, path=path))
+
+        result = await self._loop.run_in_executor(None, job.call, progress)
+        if result is None:
+            return True
+        job.stats = result.toDict()
+        for error in result.errors:
+            self._emit(job, 'error', **error)
+        return not result.errors
+
+    @staticmethod
+    def _kill(process):
+        if process.returncode is None:
+            process.kill()
+
+    def _emit(self, job, kind, **values):
+        event = {'type': kind, 'time': time.time()}
+        if job is not None:
+            event.update(job=job.id, name=job.name, drive=job.drive)
+        event.update(values)
+        self.emit(event)
@@ -0,0 +1,271 @@
+import os
+import time
+import shutil
+import struct
+import zipfile
+import threading
+from engine import MB, SyncStats, scanTree, planSync
+
+FAT32_MAX_FILE = 4 * 1024 * MB - 1
+# extended timestamp extra field, holds the modification time in UTC
+EXTENDED_TIMESTAMP = 0x5455
+# end of central directory records, zip64 record and locator included
+END_RECORDS = 22 + 56 + 20
+
+
+class PackedStore:
+    """ A subject stored as one uncompressed zip instead of thousands of small files
+
+    Changed members and a new central directory pointing at the newest copies are
+    appended behind the end of the file, the previous directory stays untouched.
+    Replaced and deleted members become dead space which `compact` reclaims once
+    it exceeds `compactRatio` of the file. The length before an append is kept in
+    a journal next to the container, so a stick pulled in the middle is cut back
+    to the previous version on the next access.
+    """
+
+    def __init__(self, path: str, bufSize: int = 16 * MB, compactRatio: float = 0.3, maxSize: int = None):
+        """
+        Parameters
+        ----------
+        path: str
+            path of the container on the destination drive
+
+        bufSize: int
+            size of the streaming buffer
+
+        compactRatio: float
+            dead space ratio that triggers compaction after a sync
+
+        maxSize: int
+            size limit of the container, e.g. FAT32_MAX_FILE on FAT32 drives
+        """
+        self.path = path
+        self.bufSize = bufSize
+        self.compactRatio = compactRatio
+        self.maxSize = maxSize
+        self.journalPath = path + '.journal'
+        self._cancelEvent = threading.Event()
+
+    def members(self):
+        """ Live members as name -> (size, mtime, mode), read from the central directory """
+        members = self._readMembers()
+        return {} if members is None else members
+
+    def _readMembers(self):
+        # None when there is no container or one cut off while an older version wrote its directory
+        self._recover()
+        try:
+            with zipfile.ZipFile(self.path, 'r') as zf:
+                return {info.filename: self._memberStat(info) for info in zf.infolist()}
+        except (FileNotFoundError, zipfile.BadZipFile):
+            return None
+
+    def deadBytes(self):
+        if not os.path.exists(self.path):
+            return 0
+        try:
+            with zipfile.ZipFile(self.path, 'r') as zf:
+                return zf.start_dir - self._liveBytes(zf)
+        except zipfile.BadZipFile:
+            return 0
+
+    def sync(self, source: str, delete=True, fromDate=None, toDate=None, progress=None):
+        """ Bring the container up to date with `source`, appending only changed files """
+        stats = SyncStats()
+        start = time.perf_counter()
+        srcFiles, srcDirs = scanTree(source)
+        srcFiles = {rel.replace(os.sep, '/'): value for rel, value in srcFiles.items()}
+        dstMembers = self._readMembers()
+        dstFiles = dstMembers or {}
+        stats.scanTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        plan = planSync(srcFiles, dstFiles, delete=delete, fromDate=fromDate, toDate=toDate)
+        stats.planTime = time.perf_counter() - start
+        stats.plannedFiles = len(plan.copy)
+        stats.plannedBytes = plan.copyBytes()
+        stats.skippedFiles = len(plan.skip)
+        stats.skippedBytes = sum(item[1] for item in plan.skip)
+        if not plan.copy and not plan.delete:
+            return stats
+
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # a damaged container is written again from scratch, everything was planned for copying
+        length = os.path.getsize(self.path) if dstMembers is not None else 0
+        self._writeJournal(length)
+        try:
+            with open(self.path, 'r+b' if dstMembers is not None else 'w+b') as f:
+                zf = zipfile.ZipFile(f, 'a', zipfile.ZIP_STORED)
+                # new members go behind the old directory, which stays valid until the journal is gone
+                zf.start_dir = length
+                self._update(zf, source, plan, stats, progress)
+                f.flush()
+                os.fsync(f.fileno())
+        except:
+            self._recover()
+            raise
+        os.remove(self.journalPath)
+
+        if not stats.cancelled and os.path.getsize(self.path) and self.deadBytes() > self.compactRatio * os.path.getsize(self.path):
+            self.compact()
+        stats.copyTime = time.perf_counter() - start
+        return stats
+
+    def _update(self, zf, source, plan, stats, progress):
+        with zf:
+            self._forget(zf, {item[0] for item in plan.delete + plan.copy})
+            centralSize = sum(self._centralEntrySize(info.filename, info.file_size, info.header_offset)
+                              for info in zf.filelist)
+            for rel, size, mtime, mode in plan.delete:
+                stats.deletedFiles += 1
+                stats.deletedBytes += size
+
+            plan.copy.sort(key=lambda item: item[0])
+            done = 0
+            for rel, size, mtime, mode in plan.copy:
+                if self._cancelEvent.is_set():
+                    # members are small, stop between them and let the central directory be written
+                    stats.cancelled = True
+                    break
+                entrySize = self._centralEntrySize(rel, size, zf.start_dir)
+                if self.maxSize is not None and \
+                        zf.start_dir + self._localSize(rel, size) + centralSize + entrySize + END_RECORDS > self.maxSize:
+                    stats.errors.append({'path': rel, 'errno': 27, 'error': 'File too large'})
+                    continue
+                try:
+                    self._append(zf, os.path.join(source, rel), rel, size, mtime, mode)
+                except OSError as e:
+                    stats.errors.append({'path': rel, 'errno': e.errno, 'error': e.strerror})
+                    continue
+                centralSize += entrySize
+                stats.copiedFiles += 1
+                stats.copiedBytes += size
+                done += size
+                if progress:
+                    progress(done, stats.plannedBytes, rel)
+
+    def cancel(self):
+        self._cancelEvent.set()
+
+    def compact(self):
+        """ Rewrite the container with live members only, skipped when the drive has no room for the copy """
+        tmpPath = self.path + '.tmp'
+        with zipfile.ZipFile(self.path, 'r') as src:
+            needed = self._liveBytes(src) + END_RECORDS + \
+                sum(self._centralEntrySize(info.filename, info.file_size, info.header_offset) for info in src.infolist())
+        if shutil.disk_usage(os.path.dirname(self.path) or '.').free < needed:
+            return False
+        with zipfile.ZipFile(self.path, 'r') as src, open(tmpPath, 'wb') as f, \
+                zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as dst:
+            for info in src.infolist():
+                newInfo = zipfile.ZipInfo(info.filename, info.date_time)
+                newInfo.external_attr = info.external_attr
+                newInfo.extra = self._timestampExtra(self._memberStat(info)[1])
+                newInfo.file_size = info.file_size
+                with src.open(info) as fin, dst.open(newInfo, 'w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as fout:
+                    while True:
+                        chunk = fin.read(self.bufSize)
+                        if not chunk:
+                            break
+                        fout.write(chunk)
+            dst.close()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpPath, self.path)
+        return True
+
+    def extract(self, dest: str):
+        """ Unpack the container, for users who need the plain files back """
+        with zipfile.ZipFile(self.path, 'r') as zf:
+            for info in zf.infolist():
+                path = zf.extract(info, dest)
+                mtime = self._memberStat(info)[1]
+                os.utime(path, (mtime, mtime))
+
+    def _append(self, zf, srcPath, rel, size, mtime, mode):
+        info = zipfile.ZipInfo(rel, time.localtime(max(mtime, 315532800))[:6])
+        info.external_attr = (mode & 0xFFFF) << 16
+        info.extra = self._timestampExtra(mtime)
+        info.file_size = size
+        with open(srcPath, 'rb', buffering=0) as fin, zf.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as fout:
+            buffer = bytearray(min(self.bufSize, max(size, 1)))
+            view = memoryview(buffer)
+            while True:
+                n = fin.readinto(buffer)
+                if not n:
+                    break
+                fout.write(view[:n])
+
+    def _writeJournal(self, length):
+        with open(self.journalPath, 'w') as f:
+            f.write(str(length))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _recover(self):
+        """ Cut the container back to the length in the journal after an interrupted sync """
+        try:
+            with open(self.journalPath) as f:
+                length = int(f.read())
+        except FileNotFoundError:
+            return
+        except ValueError:
+            # torn journal, it is written before the container is touched
+            length = None
+        if length is not None:
+            try:
+                if length:
+                    os.truncate(self.path, length)
+                else:
+                    os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        os.remove(self.journalPath)
+
+    @staticmethod
+    def _timestampExtra(mtime):
+        return struct.pack('<HHBl', EXTENDED_TIMESTAMP, 5, 1, int(mtime))
+
+    @staticmethod
+    def _localSize(name, size):
+        # header with the timestamp field, plus the zip64 field zipfile adds to large members
+        zip64 = 20 if size * 1.05 > zipfile.ZIP64_LIMIT else 0
+        return 30 + len(name.encode('utf-8')) + 9 + zip64 + size
+
+    @staticmethod
+    def _centralEntrySize(name, size, offset):
+        zip64 = 28 if size * 1.05 > zipfile.ZIP64_LIMIT or offset > zipfile.ZIP64_LIMIT else 0
+        return 46 + len(name.encode('utf-8')) + 9 + zip64
+
+    @staticmethod
+    def _forget(zf, names):
+        """ Drop members from the central directory, leaving their data as dead space """
+        if not names:
+            return
+        zf.filelist = [info for info in zf.filelist if info.filename not in names]
+        for name in names:
+            zf.NameToInfo.pop(name, None)
+        zf._didModify = True
+
+    @staticmethod
+    def _memberStat(info):
+        extra = info.extra
+        while len(extra) >= 4:
+            kind, length = struct.unpack('<HH', extra[:4])
+            if kind == EXTENDED_TIMESTAMP and length >= 5 and extra[4] & 1:
+                return info.file_size, struct.unpack('<l', extra[5:9])[0], (info.external_attr >> 16) or 0o644
+            extra = extra[4 + length:]
+        # containers written before the UTC field, zip timestamps are local with the 2 second resolution of FAT
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        return info.file_size, mtime, (info.external_attr >> 16) or 0o644
+
+    @staticmethod
+    def _liveBytes(zf):
+        total = 0
+        for info in zf.infolist():
+            total += 30 + len(info.filename.encode('utf-8')) + len(info.extra) + info.compress_size
+            if info.flag_bits & 0x08:
+                total += 24 if info.file_size >= zipfile.ZIP64_LIMIT else 16
+        return total
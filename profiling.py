@@ -0,0 +1,160 @@
+""" Field profiling switched on by the EXPRESS_PROFILE environment variable
+
+    EXPRESS_PROFILE=sample     sample all thread stacks every EXPRESS_PROFILE_INTERVAL ms (default 10)
+    EXPRESS_PROFILE=cprofile   deterministic cProfile of the main thread and every thread started later
+
+Results land in ./Log/Profile when the process exits: a .collapsed file for flamegraph.pl or
+speedscope and a .txt summary for sampling, a .pstats file and a .txt summary for cProfile.
+Without the variable nothing is imported or hooked.
+"""
+import os
+import sys
+import time
+import atexit
+import threading
+
+PROFILE_DIR = './Log/Profile'
+# cProfile runs on sys.monitoring from 3.12, which sees every thread and allows only one active profiler
+MONITORING = sys.version_info >= (3, 12)
+
+_profiler = None
+
+
+class SamplingProfiler(threading.Thread):
+    """ Counts the stacks of all other threads, cost is one sys._current_frames per interval """
+
+    def __init__(self, interval: float = 0.01):
+        super().__init__(name='ExpressProfiler', daemon=True)
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stopEvent.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = [ident]
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                # code objects are hashable, names are only formatted once in dump
+                key = tuple(stack)
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stopEvent.set()
+        self.join()
+
+    def collapsed(self):
+        """ Stacks in the folded format of flamegraph.pl, root first """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = {}
+        for key, count in self.stacks.items():
+            frames = [f'{os.path.basename(code.co_filename)}:{code.co_name}' for code in reversed(key[1:])]
+            stack = ';'.join([names.get(key[0], str(key[0]))] + frames)
+            stacks[stack] = stacks.get(stack, 0) + count
+        return stacks
+
+    def dump(self, base):
+        stacks = self.collapsed()
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f'{stack} {count}\n')
+        own = {}
+        for stack, count in stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            own[leaf] = own.get(leaf, 0) + count
+        total = sum(own.values()) or 1
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(f'{self.samples} samples every {self.interval * 1000:g} ms\n\n')
+            for leaf, count in sorted(own.items(), key=lambda item: -item[1])[:50]:
+                f.write(f'{count / total * 100:6.2f}%  {count:8d}  {leaf}\n')
+
+
+class ThreadedCProfile:
+    """ cProfile of all threads, before Python 3.12 it only sees the thread that enabled it,
+    so there every new thread enables its own """
+
+    def __init__(self):
+        import cProfile
+        self._cProfile = cProfile
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not MONITORING:
+            threading.setprofile(self._bootstrap)
+        self._enable()
+
+    def _bootstrap(self, frame, event, arg):
+        sys.setprofile(None)
+        self._enable()
+
+    def _enable(self):
+        profiler = self._cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        profiler.enable()
+
+    def stop(self):
+        if not MONITORING:
+            threading.setprofile(None)
+        self.profilers[0].disable()
+
+    def dump(self, base):
+        import pstats
+
+        class Snapshot:
+            def __init__(self, profiler):
+                profiler.snapshot_stats()
+                self.stats = profiler.stats
+
+            def create_stats(self):
+                pass
+
+        # pstats refuses a profiler without calls, e.g. of a thread that ended right away
+        snapshots = [snapshot for snapshot in map(Snapshot, self.profilers) if snapshot.stats]
+        if not snapshots:
+            return
+        stats = pstats.Stats(*snapshots)
+        stats.dump_stats(base + '.pstats')
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            stats.stream = f
+            stats.sort_stats('cumulative').print_stats(60)
+
+
+def start(name: str):
+    """ Start profiling this process if EXPRESS_PROFILE asks for it, results are written at exit """
+    global _profiler
+    mode = os.environ.get('EXPRESS_PROFILE', '').lower()
+    if not mode or _profiler is not None:
+        return None
+    if mode == 'cprofile':
+        _profiler = ThreadedCProfile()
+        _profiler.start()
+    else:
+        _profiler = SamplingProfiler(float(os.environ.get('EXPRESS_PROFILE_INTERVAL', 10)) / 1000)
+        _profiler.start()
+    atexit.register(stop, name)
+    return _profiler
+
+
+def stop(name: str):
+    global _profiler
+    if _profiler is None:
+        return None
+    profiler, _profiler = _profiler, None
+    profiler.stop()
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}')
+        profiler.dump(base)
+    except OSError:
+        return None
+    from usage import noteWrite
+    noteWrite(base)
+    return base
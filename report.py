@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import time
+from engine import MB
+from usage import noteWrite
+from logstore import LogStore
+from driveprofile import learnRun
+
+REPORT_PATH = './Log/report.jsonl'
+
+COUNTERS = ['plannedFiles', 'plannedBytes', 'copiedFiles', 'copiedBytes', 'skippedFiles', 'skippedBytes',
+            'deletedFiles', 'deletedBytes']
+DURATIONS = ['scanTime', 'planTime', 'copyTime', 'verifyTime']
+UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'KIB': 1024, 'M': MB, 'MB': MB, 'MIB': MB,
+         'G': 1024 * MB, 'GB': 1024 * MB, 'GIB': 1024 * MB}
+
+
+def parseNumber(text):
+    match = re.match(r'\s*([\d,.]+)', text or '')
+    return float(match.group(1).replace(',', '')) if match else 0.0
+
+
+def parseSize(text):
+    match = re.match(r'\s*([\d,.]+)\s*([KMG]?I?B?)', (text or '').upper())
+    if not match:
+        return 0
+    return int(float(match.group(1).replace(',', '')) * UNITS.get(match.group(2), 1))
+
+
+def fastCopyStats(values):
+    """ Map the summary lines of fcp.exe onto the engine's counters """
+    stats = {
+        'copiedFiles': int(parseNumber(values.get('TotalFiles'))),
+        'copiedBytes': parseSize(values.get('TotalWrite')),
+        'deletedFiles': int(parseNumber(values.get('TotalDel'))),
+        'copyTime': parseNumber(values.get('TotalTime')),
+    }
+    stats['fcp'] = {key: value for key, value in values.items() if key != 'returncode'}
+    return stats
+
+
+class RunReport:
+    """ Collects the orchestrator events of one ExpressMain run and appends them to ./Log/report.jsonl
+
+    Every subject becomes one 'subject' line, the whole run one 'run' line with the totals.
+    """
+
+    def __init__(self, drive: str, serial=None, fileSystem: str = None, mode: int = None,
+                 engine: str = None, path: str = REPORT_PATH, id: str = None):
+        self.path = path
+        self.run = {
+            'record': 'run',
+            'id': id or time.strftime('%Y%m%d-%H%M%S') + '-' + str(os.getpid()),
+            'start': time.time(),
+            'drive': drive,
+            'serial': serial,
+            'fileSystem': fileSystem,
+            'mode': mode,
+            'engine': engine,
+        }
+        self.subjects = {}
+
+    def onEvent(self, event):
+        if event.get('type') == 'start':
+            self.subjects[event['job']] = {'record': 'subject', 'run': self.run['id'], 'subject': event['name'],
+                                           'start': event['time'], 'errors': []}
+        elif event.get('type') == 'error' and event.get('job') in self.subjects:
+            self.subjects[event['job']]['errors'].append({key: event.get(key) for key in ('path', 'errno', 'error')})
+        elif event.get('type') == 'done' and event.get('job') in self.subjects:
+            subject = self.subjects[event['job']]
+            stats = event.get('stats') or {}
+            if 'returncode' in stats:
+                stats = fastCopyStats(stats)
+            for key in COUNTERS + DURATIONS:
+                subject[key] = stats.get(key, 0)
+            if 'fcp' in stats:
+                subject['fcp'] = stats['fcp']
+            subject['state'] = event['state']
+            subject['seconds'] = round(event.get('elapsed') or event['time'] - subject['start'], 3)
+            subject['megabytesPerSec'] = self._rate(subject['copiedBytes'], subject['copyTime'] or subject['seconds'])
+
+    def write(self, state: str = 'done'):
+        run = self.summary(state)
+        appendRecords(list(self.subjects.values()) + [run], self.path)
+        learnRun(run, self.subjects.values())
+        return run
+
+    def summary(self, state: str = 'done'):
+        """ The 'run' line with the totals so far """
+        subjects = list(self.subjects.values())
+        run = dict(self.run)
+        run['state'] = state
+        run['seconds'] = round(time.time() - run['start'], 3)
+        run['subjects'] = len(subjects)
+        for key in COUNTERS + DURATIONS:
+            run[key] = sum(subject.get(key, 0) for subject in subjects)
+        run['errors'] = sum(len(subject['errors']) for subject in subjects)
+        run['megabytesPerSec'] = self._rate(run['copiedBytes'], run['copyTime'] or run['seconds'])
+        return run
+
+    @staticmethod
+    def _rate(size, seconds):
+        return round(size / MB / seconds, 2) if seconds else 0.0
+
+
+def appendRecords(records, path: str = REPORT_PATH):
+    text = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(text)
+    except OSError:
+        return
+    noteWrite(path, len(text.encode('utf-8')))
+    LogStore(path).rotateIfNeeded()
+
+
+def logPopup(drive: str, path: str = REPORT_PATH):
+    """ ExpressUsbService is on screen, the scanner's metrics pair this with the detection """
+    appendRecords([{'record': 'popup', 'drive': drive, 'time': time.time(), 'pid': os.getpid()}], path)
+
+
+def readRuns(path: str = REPORT_PATH, limit: int = None, since: float = None):
+    """ The 'run' lines of the report and its archived segments, newest last """
+    return LogStore(path).runs(limit, since)
+
+
+def runCount(path: str = REPORT_PATH):
+    return LogStore(path).runCount()
+
+
+def summarize(runs):
+    """ Per drive serial: number of runs, last, median and slowest MB/s of runs that copied something """
+    drives = {}
+    for run in runs:
+        key = run.get('serial') or run.get('drive')
+        drive = drives.setdefault(key, {'serial': run.get('serial'), 'drive': run.get('drive'),
+                                        'fileSystem': run.get('fileSystem'), 'runs': 0, 'errors': 0,
+                                        'copiedBytes': 0, 'rates': [], 'last': None})
+        drive['runs'] += 1
+        drive['errors'] += run.get('errors', 0)
+        drive['copiedBytes'] += run.get('copiedBytes', 0)
+        drive['last'] = run.get('start')
+        if run.get('copiedBytes', 0) >= MB and run.get('megabytesPerSec'):
+            drive['rates'].append(run['megabytesPerSec'])
+    for drive in drives.values():
+        rates = sorted(drive.pop('rates'))
+        drive['lastRate'] = None
+        drive['medianRate'] = rates[len(rates) // 2] if rates else None
+        drive['slowestRate'] = rates[0] if rates else None
+    for run in runs:
+        drive = drives[run.get('serial') or run.get('drive')]
+        if run.get('copiedBytes', 0) >= MB and run.get('megabytesPerSec'):
+            drive['lastRate'] = run['megabytesPerSec']
+    return sorted(drives.values(), key=lambda drive: drive['last'] or 0, reverse=True)
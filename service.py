@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import itertools
+import threading
+from orchestrator import Orchestrator, Progress
+from report import RunReport
+from jobs import SyncRequest, requestJobs
+from ipc import IpcError
+
+MAX_EVENTS = 4000
+KEEP_FINISHED = 20
+
+
+class SyncRun:
+    """ One submitted request, its events are kept for the clients that poll them """
+
+    def __init__(self, id: str, request: SyncRequest, jobs: list):
+        self.id = id
+        self.request = request
+        self.jobs = jobs
+        self.state = 'running'
+        self.started = time.time()
+        self.finished = None
+        self.failed = 0
+        self.progress = Progress(len(jobs))
+        self.events = []
+        self.firstEvent = 0
+        self.cancelRequested = False
+        # one process runs them all, the pid in the default id would not tell two drives apart
+        self.report = RunReport(request.drive, request.serial, request.fileSystem, request.mode, request.copyEngine,
+                                id=f'{id}-{os.getpid()}')
+        self.orchestrator = Orchestrator(self.onEvent)
+        self._lock = threading.Lock()
+
+    def onEvent(self, event):
+        self.report.onEvent(event)
+        with self._lock:
+            self.progress.update(event)
+            self.events.append(dict(event, seq=self.firstEvent + len(self.events)))
+            if len(self.events) > MAX_EVENTS:
+                # slow pollers lose the oldest half, 'finished' is always among the newest
+                drop = len(self.events) // 2
+                del self.events[:drop]
+                self.firstEvent += drop
+        if event['type'] == 'start' and self.cancelRequested:
+            self.orchestrator.cancel()
+        elif event['type'] == 'finished':
+            self.failed = event['failed']
+            self.state = 'cancelled' if event['cancelled'] else 'done'
+            self.finished = time.time()
+            self.report.write(self.state)
+
+    def onRunDone(self, future):
+        """ The orchestrator ended without its 'finished' event, e.g. by an exception of an event handler """
+        if self.state != 'running' or not future.cancelled() and future.exception() is None:
+            return
+        self.failed = len(self.jobs)
+        self.state = 'failed'
+        self.finished = time.time()
+        self.report.write(self.state)
+
+    def cancel(self):
+        """ Must be called in the loop thread, also works before the first job started """
+        self.cancelRequested = True
+        self.orchestrator.cancel()
+
+    def eventsSince(self, since: int):
+        with self._lock:
+            start = max(0, since - self.firstEvent)
+            return self.events[start:], self.firstEvent + len(self.events)
+
+    def toDict(self):
+        return dict(self.request.toDict(), id=self.id, state=self.state, progress=self.progress.value,
+                    jobs=len(self.jobs), failed=self.failed, started=self.started, finished=self.finished)
+
+
+class SyncService:
+    """ Runs sync requests inside the resident scanner, so a sync starts without spawning ExpressMain
+
+    All runs share one asyncio loop thread, each run has its own Orchestrator and RunReport.
+    `onRequest` answers the ops of the IPC protocol: ping, submit, status, events and cancel.
+    """
+
+    def __init__(self):
+        self.runs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='ExpressService', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.cancel()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(10)
+
+    def submit(self, request: SyncRequest):
+        with self._lock:
+            for run in self.runs.values():
+                if run.state == 'running' and run.request.drive == request.drive:
+                    raise IpcError(f'{request.drive} is already syncing in run {run.id}')
+            run = SyncRun(time.strftime('%Y%m%d-%H%M%S-') + str(next(self._ids)), request, requestJobs(request))
+            self.runs[run.id] = run
+            finished = [old for old in self.runs.values() if old.finished]
+            for old in sorted(finished, key=lambda old: old.finished)[:-KEEP_FINISHED]:
+                del self.runs[old.id]
+        asyncio.run_coroutine_threadsafe(run.orchestrator.run(run.jobs), self.loop).add_done_callback(run.onRunDone)
+        return run
+
+    def cancel(self, runId: str = None, drive: str = None):
+        with self._lock:
+            runs = [run for run in self.runs.values() if run.state == 'running'
+                    and (runId is None or run.id == runId) and (drive is None or run.request.drive == drive)]
+        for run in runs:
+            self.loop.call_soon_threadsafe(run.cancel)
+        return [run.id for run in runs]
+
+    def run(self, runId: str):
+        with self._lock:
+            if runId not in self.runs:
+                raise IpcError(f'unknown run {runId}')
+            return self.runs[runId]
+
+    def activeRuns(self):
+        """ Drive and progress of the running syncs, for the scanner's heartbeat """
+        with self._lock:
+            return [{'id': run.id, 'drive': run.request.drive, 'progress': run.progress.value}
+                    for run in self.runs.values() if run.state == 'running']
+
+    def onRequest(self, op, message):
+        if op == 'ping':
+            return {'runs': len(self.runs)}
+        if op == 'submit':
+            values = message['request']
+            request = SyncRequest(values['drive'], values['subjects'], values.get('mode', 1),
+                                  values.get('isDelete', False), values.get('commandOption', ''))
+            return {'run': self.submit(request).toDict()}
+        if op == 'status':
+            if message.get('run'):
+                return {'runs': [self.run(message['run']).toDict()]}
+            with self._lock:
+                return {'runs': [run.toDict() for run in self.runs.values()]}
+        if op == 'events':
+            run = self.run(message['run'])
+            events, next = run.eventsSince(int(message.get('since') or 0))
+            return {'run': run.toDict(), 'events': events, 'next': next}
+        if op == 'cancel':
+            return {'cancelled': self.cancel(message.get('run'), message.get('drive'))}
+        raise IpcError(f'unknown op {op}')
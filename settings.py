@@ -0,0 +1,78 @@
+import json
+from enum import Enum
+
+CONFIG_PATH = 'config/config.json'
+
+
+class BufSize(Enum):
+    _32 = "32 MB"
+    _64 = "64 MB"
+    _128 = "128 MB"
+    _256 = "256 MB"
+    _512 = "512 MB"
+    _1024 = "1 GB"
+
+
+# (group, key in config.json, default) of what syncing needs, defaults as in config.py
+ITEMS = {
+    'PackedSubjects': ("Folders", "PackedSubjects", []),
+    'sourceFolder': ("Folders", "SourceFolder", ""),
+    'yuwenFolder': ("Folders", "Yuwen", ""),
+    'shuxueFolder': ("Folders", "Shuxue", ""),
+    'yingyuFolder': ("Folders", "Yingyu", ""),
+    'wuliFolder': ("Folders", "Wuli", ""),
+    'huaxueFolder': ("Folders", "Huaxue", ""),
+    'shengwuFolder': ("Folders", "Shengwu", ""),
+    'zhengzhiFolder': ("Folders", "Zhengzhi", ""),
+    'lishiFolder': ("Folders", "Lishi", ""),
+    'diliFolder': ("Folders", "Dili", ""),
+    'jishuFolder': ("Folders", "Jishu", ""),
+    'ziliaoFolder': ("Folders", "Ziliao", ""),
+    'ConcurrentProcess': ("MainWindow", "ConcurrentProcess", 3),
+    'AutoTune': ("MainWindow", "AutoTune", True),
+    'BufSize': ("MainWindow", "BufSize", BufSize._256),
+    'CopyEngine': ("MainWindow", "CopyEngine", "FastCopy"),
+    'ContentCheck': ("MainWindow", "ContentCheck", False),
+    'FingerprintMode': ("MainWindow", "FingerprintMode", "full"),
+    'FingerprintSamples': ("MainWindow", "FingerprintSamples", 8),
+    'FingerprintEscalate': ("MainWindow", "FingerprintEscalate", False),
+    'Verify': ("MainWindow", "Verify", "off"),
+    'VerifyDirect': ("MainWindow", "VerifyDirect", True),
+    'LowIoRate': ("MainWindow", "LowIoRate", 20),
+    'LowIoIops': ("MainWindow", "LowIoIops", 200),
+    'SmallFileSize': ("MainWindow", "SmallFileSize", 1024),
+    'LogMaxSize': ("Storage", "LogMaxSize", 64),
+    'LogKeepDays': ("Storage", "LogKeepDays", 180),
+}
+
+
+class Setting:
+    def __init__(self, value):
+        self.value = value
+
+
+class Settings:
+    """ Read-only view of config/config.json without Qt, attributes look like those of config.cfg """
+
+    def __init__(self, values: dict = None):
+        for name, (group, key, default) in ITEMS.items():
+            value = (values or {}).get(group, {}).get(key, default)
+            if isinstance(default, Enum):
+                try:
+                    value = type(default)(value)
+                except ValueError:
+                    value = default
+            setattr(self, name, Setting(value))
+
+
+def load(path: str = CONFIG_PATH, **overrides):
+    """ Settings as saved by ExpressSetting, `overrides` replace single values by attribute name """
+    try:
+        with open(path, encoding='utf-8') as f:
+            values = json.load(f)
+    except (OSError, ValueError):
+        values = {}
+    settings = Settings(values)
+    for name, value in overrides.items():
+        getattr(settings, name).value = value
+    return settings
@@ -0,0 +1,141 @@
+""" Short write, small-file and read test of a drive, with the settings it suggests
+
+    python speedtest.py E:
+
+The rates are stored in ./config/DriveProfiles.json under the drive's volume serial. Everything is written
+below a temporary folder in the root of the drive, which is removed afterwards. Each phase stops after
+its byte or file budget or `phaseSeconds`, whichever comes first.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+from engine import MB, readChunks
+from driveprofile import DriveProfiles, volumeInformation, recommend
+
+TEST_FOLDER = '.express-speedtest'
+SEQUENTIAL_BYTES = 128 * MB
+CHUNK = 4 * MB
+SMALL_FILES = 300
+SMALL_FILE_SIZE = 16 * 1024
+PHASE_SECONDS = 6
+
+
+class SpeedTestCancelled(Exception):
+    pass
+
+
+def driveRoot(drive: str):
+    return drive + os.sep if drive.endswith(':') else drive
+
+
+def run(drive: str, sequentialBytes: int = SEQUENTIAL_BYTES, smallFiles: int = SMALL_FILES,
+        smallFileSize: int = SMALL_FILE_SIZE, phaseSeconds: float = PHASE_SECONDS, progress=None, cancelled=None):
+    """ Measure the drive, returns the rates as DriveProfiles stores them
+
+    Parameters
+    ----------
+    progress: callable
+        called as progress(phase, fraction) while testing
+
+    cancelled: callable
+        returns True when the test should stop, the test folder is removed either way
+    """
+    root = driveRoot(drive)
+    folder = os.path.join(root, f'{TEST_FOLDER}-{os.getpid()}')
+    # never fill more than a quarter of the free space
+    sequentialBytes = max(CHUNK, min(sequentialBytes, shutil.disk_usage(root).free // 4 // CHUNK * CHUNK))
+    os.makedirs(folder)
+    try:
+        result = {'drive': drive}
+        result.update(_sequentialWrite(folder, sequentialBytes, phaseSeconds, progress, cancelled))
+        result.update(_sequentialRead(folder, phaseSeconds, progress, cancelled))
+        result.update(_smallFiles(folder, smallFiles, smallFileSize, phaseSeconds, progress, cancelled))
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def _check(phase, fraction, progress, cancelled):
+    if cancelled and cancelled():
+        raise SpeedTestCancelled()
+    if progress:
+        progress(phase, fraction)
+
+
+def _sequentialWrite(folder, size, phaseSeconds, progress, cancelled):
+    data = os.urandom(CHUNK)
+    written = 0
+    start = time.perf_counter()
+    with open(os.path.join(folder, 'sequential.bin'), 'wb', buffering=0) as f:
+        while written < size and time.perf_counter() - start < phaseSeconds:
+            _check('write', written / size, progress, cancelled)
+            written += f.write(data)
+        # what is still in the cache has not reached the drive yet
+        os.fsync(f.fileno())
+    seconds = time.perf_counter() - start
+    return {'largeMBps': round(written / MB / seconds, 2), 'writtenBytes': written}
+
+
+def _sequentialRead(folder, phaseSeconds, progress, cancelled):
+    path = os.path.join(folder, 'sequential.bin')
+    size = os.path.getsize(path)
+    read = 0
+    start = time.perf_counter()
+    # bypass the cache, the file was just written and would otherwise come from memory
+    for block in readChunks(path, CHUNK, direct=True):
+        read += len(block)
+        if time.perf_counter() - start >= phaseSeconds:
+            break
+        _check('read', read / size, progress, cancelled)
+    seconds = time.perf_counter() - start
+    return {'readMBps': round(read / MB / seconds, 2) if seconds else 0.0}
+
+
+def _smallFiles(folder, count, size, phaseSeconds, progress, cancelled):
+    data = os.urandom(size)
+    paths = []
+    start = time.perf_counter()
+    for i in range(count):
+        if time.perf_counter() - start >= phaseSeconds:
+            break
+        _check('small files', i / count, progress, cancelled)
+        path = os.path.join(folder, 'small', f'{i // 100:03}', f'{i:05}.bin')
+        if i % 100 == 0:
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb', buffering=0) as f:
+            f.write(data)
+            # removable drives default to write-through on Windows, this keeps other systems comparable
+            os.fsync(f.fileno())
+        paths.append(path)
+    writeSeconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for path in paths:
+        os.remove(path)
+    deleteSeconds = time.perf_counter() - start
+    return {'smallFilesPerSec': round(len(paths) / writeSeconds, 1) if writeSeconds else 0.0,
+            'deleteFilesPerSec': round(len(paths) / deleteSeconds, 1) if deleteSeconds else 0.0,
+            'smallFiles': len(paths), 'smallFileSize': size}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print(__doc__, file=sys.stderr)
+        return 2
+    result = run(argv[0], progress=lambda phase, fraction: print(f'\r{phase} {round(fraction * 100)}%   ', end='',
+                                                                 file=sys.stderr, flush=True))
+    serial, fileSystem = volumeInformation(argv[0])
+    DriveProfiles().recordSpeedTest(serial, argv[0], fileSystem, result)
+    recommendation = recommend(result)
+    result['recommended'] = {'BufSize': recommendation['bufSize'].value,
+                             'ConcurrentProcess': recommendation['concurrentProcess']}
+    print(file=sys.stderr)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
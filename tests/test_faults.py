@@ -0,0 +1,35 @@
+""" Recovery guarantees of benchmark/faults.py, every scenario must end with a complete copy """
+import os
+import pytest
+from engine import scanTree
+from benchmark.trees import TreeGenerator
+from benchmark.faults import scenarios, runScenario, runPackedScenario
+
+
+@pytest.fixture(scope='module')
+def tree(tmp_path_factory):
+    work = str(tmp_path_factory.mktemp('faults'))
+    source = os.path.join(work, 'source')
+    files, size = TreeGenerator(scale=0.005, videoScale=0.0005).generate(source)
+    largest = max(entry[0] for entry in scanTree(source)[0].values())
+    return work, source, files, size, largest
+
+
+@pytest.mark.parametrize('name', list(scenarios(0)))
+def test_scenario(tree, name):
+    work, source, files, size, largest = tree
+    result = runScenario(name, scenarios(size)[name], source, os.path.join(work, 'dest'), files, size)
+    assert result['fired']
+    assert result['complete'], result
+    assert result['leftoverBytes'] == 0
+    # the engine writes one file at a time, a failure can only leave that one incomplete or make it redone
+    assert result['orphanedBytes'] <= largest
+    assert result['wastedBytes'] <= largest
+
+
+def test_packed_pull_append(tree):
+    work, source = tree[:2]
+    result = runPackedScenario(source, work)
+    assert result['fired']
+    assert result['error'] is None
+    assert result['complete'], result
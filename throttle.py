@@ -0,0 +1,121 @@
+import sys
+import time
+import threading
+from engine import MB
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def lowerPriority(pid: int = None):
+    """ Run a process with background CPU and I/O priority, children started afterwards inherit it """
+    if psutil is None:
+        return False
+    try:
+        process = psutil.Process(pid)
+        if sys.platform == 'win32':
+            process.nice(psutil.IDLE_PRIORITY_CLASS)
+            process.ionice(psutil.IOPRIO_VERYLOW)
+        else:
+            process.nice(10)
+            if hasattr(process, 'ionice'):
+                process.ionice(psutil.IOPRIO_CLASS_IDLE)
+        return True
+    except (psutil.Error, OSError, ValueError):
+        return False
+
+
+class TokenBucket:
+    """ Limit the throughput and the operation rate of the copy engine
+
+    Both budgets refill continuously and may be spent up to one second ahead.
+    `scale` is lowered by `LoadMonitor` while the foreground is busy.
+    """
+
+    def __init__(self, rate: int = 20 * MB, iops: int = 200, chunkSize: int = MB):
+        """
+        Parameters
+        ----------
+        rate: int
+            bytes per second
+
+        iops: int
+            file operations per second
+
+        chunkSize: int
+            largest read the engine does at once, so a single chunk never exceeds the budget
+        """
+        self.rate = rate
+        self.iops = iops
+        self.chunkSize = chunkSize
+        self.scale = 1.0
+        self._bytes = float(rate)
+        self._ops = float(iops)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._cancelEvent = threading.Event()
+
+    def consume(self, nbytes: int = 0, ops: int = 0):
+        """ Block until `nbytes` and `ops` fit into the budget """
+        with self._lock:
+            now = time.monotonic()
+            rate, iops = self.rate * self.scale, self.iops * self.scale
+            elapsed, self._last = now - self._last, now
+            self._bytes = min(rate, self._bytes + elapsed * rate) - nbytes
+            self._ops = min(iops, self._ops + elapsed * iops) - ops
+            wait = max(-self._bytes / rate, -self._ops / iops, 0)
+        if wait:
+            self._cancelEvent.wait(wait)
+
+    def cancel(self):
+        """ Wake up a waiting consumer, the engine checks for cancellation right after """
+        self._cancelEvent.set()
+
+
+class LoadMonitor(threading.Thread):
+    """ Back off the bucket while host disk latency or foreground CPU load is high
+
+    The rate is halved on every busy sample down to `minScale` and recovers by a quarter
+    on every quiet one, so the sync still finishes when the machine is never idle.
+    """
+
+    def __init__(self, bucket: TokenBucket, interval: float = 0.5, cpuHigh: float = 60,
+                 latencyHigh: float = 20, minScale: float = 0.05):
+        super().__init__(daemon=True)
+        self.bucket = bucket
+        self.interval = interval
+        self.cpuHigh = cpuHigh
+        self.latencyHigh = latencyHigh
+        self.minScale = minScale
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        if psutil is None:
+            return
+        own = psutil.Process()
+        cpuCount = psutil.cpu_count() or 1
+        psutil.cpu_percent(None)
+        own.cpu_percent(None)
+        last = psutil.disk_io_counters()
+        while not self._stopEvent.wait(self.interval):
+            try:
+                # CPU used by everything except the sync itself
+                cpu = psutil.cpu_percent(None) - own.cpu_percent(None) / cpuCount
+                io = psutil.disk_io_counters()
+            except (psutil.Error, OSError):
+                continue
+            latency = 0.0
+            if io is not None and last is not None:
+                ops = (io.read_count - last.read_count) + (io.write_count - last.write_count)
+                busy = (io.read_time - last.read_time) + (io.write_time - last.write_time)
+                latency = busy / ops if ops else 0.0
+            last = io
+            if cpu > self.cpuHigh or latency > self.latencyHigh:
+                self.bucket.scale = max(self.minScale, self.bucket.scale * 0.5)
+            else:
+                self.bucket.scale = min(1.0, self.bucket.scale * 1.25)
+
+    def stop(self):
+        self._stopEvent.set()
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from usage import noteWrite
+
+TRACE_DIR = './Log/Trace'
+SESSION_ARG = '--session='
+# orchestrator jobs get their own tracks next to the real threads
+JOB_TID = 100000
+
+
+class Tracer:
+    """ Chrome Trace Event writer shared by ExpressScan, ExpressUsbService and ExpressMain
+
+    Every process appends its events to its own file of the session, `export` merges them
+    into one JSON that chrome://tracing or Perfetto opens. Timestamps are wall clock
+    microseconds so the processes line up. A tracer without a session does nothing.
+    """
+
+    def __init__(self, session: str = None, process: str = None, directory: str = TRACE_DIR):
+        self.session = session
+        self.process = process or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        self.directory = directory
+        self.pid = os.getpid()
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.session is not None
+
+    def start(self, session: str, processStart: bool = True):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.session = session
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(os.path.join(self.directory, f'{session}-{self.process}-{self.pid}.jsonl'), 'a',
+                              encoding='utf-8')
+        except OSError:
+            self.session = None
+            return
+        # the file keeps growing, the usage ledger rescans the directory instead of counting
+        noteWrite(self._file.name)
+        self._write({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': self.process}})
+        if processStart:
+            self.complete('process start', processStartTime(), now(), cat='startup')
+
+    def instant(self, name: str, cat: str = 'express', **args):
+        if self.enabled:
+            self._write({'name': name, 'cat': cat, 'ph': 'i', 's': 'p', 'ts': now(), 'pid': self.pid,
+                         'tid': threading.get_ident(), 'args': args})
+
+    def complete(self, name: str, start: float, end: float, cat: str = 'express', tid=None, **args):
+        if self.enabled:
+            self._write({'name': name, 'cat': cat, 'ph': 'X', 'ts': start, 'dur': max(0, end - start),
+                         'pid': self.pid, 'tid': tid or threading.get_ident(), 'args': args})
+
+    @contextmanager
+    def span(self, name: str, cat: str = 'express', **args):
+        if not self.enabled:
+            yield
+            return
+        start = now()
+        try:
+            yield
+        finally:
+            self.complete(name, start, now(), cat, **args)
+
+    def onEvent(self, event):
+        """ Orchestrator events: one track per job with a span from start to done """
+        if not self.enabled or event.get('type') not in ('start', 'done'):
+            return
+        ts = event['time'] * 1e6
+        tid = JOB_TID + event['job']
+        if event['type'] == 'start':
+            self._write({'name': event['name'], 'cat': 'job', 'ph': 'B', 'ts': ts, 'pid': self.pid, 'tid': tid})
+        else:
+            self._write({'name': event['name'], 'cat': 'job', 'ph': 'E', 'ts': ts, 'pid': self.pid, 'tid': tid,
+                         'args': {'state': event.get('state')}})
+
+    def export(self, path: str = None):
+        """ Merge the files of all processes of the session into one trace JSON """
+        if not self.enabled:
+            return None
+        events = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.startswith(self.session + '-') or not name.endswith('.jsonl'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    events.extend(json.loads(line) for line in f if line.strip())
+            except (OSError, ValueError):
+                continue
+        path = path or os.path.join(self.directory, self.session + '.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'session': self.session}}, f)
+        return path
+
+    def _write(self, event):
+        with self._lock:
+            try:
+                self._file.write(json.dumps(event, ensure_ascii=False) + '\n')
+                self._file.flush()
+            except (OSError, ValueError):
+                pass
+
+
+def now():
+    return time.time() * 1e6
+
+
+def processStartTime():
+    try:
+        import psutil
+        return psutil.Process().create_time() * 1e6
+    except Exception:
+        return _importTime
+
+
+def newSession():
+    return time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+
+
+def init(argv: list, process: str = None, session: str = None):
+    """ Take --session=<id> out of `argv` so positional arguments keep their index, and start tracing with it """
+    for arg in list(argv):
+        if arg.startswith(SESSION_ARG):
+            argv.remove(arg)
+            session = arg[len(SESSION_ARG):]
+    if process:
+        tracer.process = process
+    if session:
+        tracer.start(session)
+    return tracer
+
+
+def sessionArgs():
+    """ Arguments that hand the session on to a child process """
+    return [SESSION_ARG + tracer.session] if tracer.enabled else []
+
+
+_importTime = now()
+tracer = Tracer()
+span = tracer.span
+instant = tracer.instant
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+
+LOG_DIR = './Log'
+LEDGER_PATH = './Log/usage.json'
+# cache outside ./Log that 清除缓存 removes as well
+EXTRA_FILES = ['FastCopy2.ini']
+
+
+class UsageLedger:
+    """ Bytes and files under ./Log per directory, so the size is known without walking the tree
+
+    Each directory is stored with its mtime, the bytes and number of its own files and its subdirectories.
+    `reconcile` rescans with os.scandir only the directories whose mtime changed or that a writer marked by
+    `add`, the others are taken from the ledger. The top directory is always rescanned because the report,
+    heartbeat and metrics files there are appended or replaced in place.
+    """
+
+    def __init__(self, root: str = LOG_DIR, path: str = LEDGER_PATH):
+        self.root = root
+        self.path = path
+        self.dirs = {}
+        self.updated = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                values = json.load(f)
+            self.dirs = values['dirs']
+            self.updated = values.get('updated')
+        except (OSError, ValueError, KeyError, TypeError):
+            self.dirs = {}
+            self.updated = None
+        return self
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'updated': self.updated, 'dirs': self.dirs}, f, ensure_ascii=False)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass
+
+    @property
+    def known(self):
+        return self.updated is not None
+
+    @property
+    def bytes(self):
+        return sum(entry['bytes'] for entry in self.dirs.values())
+
+    @property
+    def files(self):
+        return sum(entry['files'] for entry in self.dirs.values())
+
+    def add(self, path: str, size: int = 0):
+        """ A writer put `size` bytes into `path`, its directory is rescanned by the next reconcile """
+        key = self._key(os.path.dirname(path))
+        if key is None:
+            return
+        entry = self.dirs.setdefault(key, {'mtime': 0, 'bytes': 0, 'files': 0, 'dirs': []})
+        entry['bytes'] += size
+        entry['mtime'] = 0
+        self.save()
+
+    def reconcile(self):
+        """ Bring the ledger up to date with the disk and return the bytes under the root """
+        dirs = {}
+        pending = ['.']
+        while pending:
+            key = pending.pop()
+            path = os.path.normpath(os.path.join(self.root, key))
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            old = self.dirs.get(key)
+            if key != '.' and old and old['mtime'] == mtime:
+                entry = old
+            else:
+                entry = self._scan(path, mtime)
+            dirs[key] = entry
+            pending.extend(os.path.join(key, name) if key != '.' else name for name in entry['dirs'])
+        self.dirs = dirs
+        self.updated = time.time()
+        self.save()
+        return self.bytes
+
+    @staticmethod
+    def _scan(path, mtime):
+        entry = {'mtime': mtime, 'bytes': 0, 'files': 0, 'dirs': []}
+        try:
+            with os.scandir(path) as it:
+                for item in it:
+                    try:
+                        if item.is_dir(follow_symlinks=False):
+                            entry['dirs'].append(item.name)
+                        else:
+                            entry['bytes'] += item.stat(follow_symlinks=False).st_size
+                            entry['files'] += 1
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return entry
+
+    def _key(self, directory):
+        try:
+            relative = os.path.relpath(os.path.abspath(directory or '.'), os.path.abspath(self.root))
+        except ValueError:
+            # another drive on Windows
+            return None
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            return None
+        return relative
+
+
+def noteWrite(path: str, size: int = 0):
+    """ Tell the ledger about a write under ./Log, writes elsewhere are ignored """
+    UsageLedger().add(path, size)
+
+
+def extraBytes():
+    size = 0
+    for path in EXTRA_FILES:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return size
+
+
+def cachedSize():
+    """ Bytes of the cache as last recorded, None before the first reconcile """
+    ledger = UsageLedger()
+    return ledger.bytes + extraBytes() if ledger.known else None
+
+
+def reconcile():
+    return UsageLedger().reconcile() + extraBytes()
+
+
+def formatSize(size: int):
+    kbSize = float(size / 1024)
+    if kbSize >= 1024 * 1024:
+        return str(round(kbSize / 1024 / 1024, 1)) + ' GB'
+    elif kbSize >= 1024:
+        return str(round(kbSize / 1024, 1)) + ' MB'
+    else:
+        return str(int(kbSize)) + ' KB'